@@ -231,35 +231,30 @@ export default function OnboardingPage() {
     setParseError("");
 
     try {
-      let body: Record<string, string>;
+      let init: RequestInit;
 
       if (syllabusFile) {
-        // Read file as base64
-        const arrayBuf = await syllabusFile.arrayBuffer();
-        const bytes = new Uint8Array(arrayBuf);
-        let binary = "";
-        for (let i = 0; i < bytes.length; i++) {
-          binary += String.fromCharCode(bytes[i]);
-        }
-        const base64 = btoa(binary);
-
+        // Send the raw file as multipart (no base64 inflation)
         const ext = syllabusFile.name.split(".").pop()?.toLowerCase();
         const fileType = ext === "pdf" ? "pdf" : "image";
 
-        body = { file_type: fileType, file_data: base64 };
+        const form = new FormData();
+        form.append("file_type", fileType);
+        form.append("file", syllabusFile);
+        init = { method: "POST", body: form };
       } else if (syllabusText.trim()) {
-        body = { file_type: "text", content: syllabusText.trim() };
+        init = {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ file_type: "text", content: syllabusText.trim() }),
+        };
       } else {
         setParseError("Please upload a file or paste your syllabus text.");
         setIsParsing(false);
         return;
       }
 
-      const res = await fetch(`${BACKEND_URL}/api/ai/parse-syllabus`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(body),
-      });
+      const res = await fetch(`${BACKEND_URL}/api/ai/parse-syllabus`, init);
 
       if (!res.ok) {
         const err = await res.json().catch(() => null);
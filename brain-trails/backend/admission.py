@@ -0,0 +1,365 @@
+"""
+Brain Trails - Admission control
+
+Keeps one client from burning the shared Groq quota for everyone else:
+
+- per-client token buckets (keyed by a hash of the Authorization header, or
+  the client IP) with a per-route cost, rejected with 429 + ``Retry-After``.
+  The backend doesn't verify Authorization values, so the first request
+  with a value no bucket exists for is charged to the client's IP too;
+  sending a fresh header on every request can't buy a fresh burst;
+- a per-worker limit on concurrent upstream work, with a bounded wait queue
+  in which interactive chat is always served before bulk quiz/syllabus
+  generation, and a few slots are reserved for interactive requests only.
+
+Bucket state lives in memory by default; ``SQLiteBucketStore`` shares it
+between gunicorn workers on one host. The concurrency limiter serves both
+threads (Flask) and coroutines (ASGI) from the same slots.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+
+class AdmissionRejected(Exception):
+    """The request can't be admitted now; retry after ``retry_after`` seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(now - updated, 0.0) * rate)
+
+
+class MemoryBucketStore:
+    """Per-process token buckets, LRU-bounded by client count."""
+
+    def __init__(self, max_clients=10000, clock=time.time):
+        self.max_clients = max_clients
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, client, cost, rate, burst):
+        """Spend ``cost`` tokens from ``client``'s bucket. Returns 0, or seconds until it would succeed."""
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (burst, now))
+            tokens = _refill(tokens, updated, now, rate, burst)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            self._buckets[client] = (tokens - cost if not wait else tokens, now)
+            self._buckets.move_to_end(client)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def known(self, client):
+        """Whether ``client`` has a bucket."""
+        with self._lock:
+            return client in self._buckets
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS admission_buckets ("
+            " client TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork (gunicorn --preload) must not be reused
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, client, cost, rate, burst):
+        """Spend ``cost`` tokens from ``client``'s bucket. Returns 0, or seconds until it would succeed."""
+        conn = self._connect()
+        now = self._clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM admission_buckets WHERE client = ?", (client,)
+            ).fetchone()
+            tokens = _refill(row[0], row[1], now, rate, burst) if row else burst
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO admission_buckets (client, tokens, updated) VALUES (?, ?, ?)",
+                (client, tokens - cost if not wait else tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def known(self, client):
+        """Whether ``client`` has a bucket."""
+        row = self._connect().execute("SELECT 1 FROM admission_buckets WHERE client = ?", (client,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM admission_buckets").fetchone()[0]
+
+
+class _Waiter:
+    def __init__(self, priority, weight, wake):
+        self.priority = priority
+        self.weight = weight
+        self.wake = wake
+        self.granted = False
+
+
+class Slot:
+    """A held share of the concurrency limit; release it exactly once (extra calls are no-ops)."""
+
+    def __init__(self, limiter, weight, priority):
+        self._limiter = limiter
+        self.weight = weight
+        self.priority = priority
+        self.acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ConcurrencyLimiter:
+    """Weighted slots with a bounded priority queue, shared by threads and coroutines."""
+
+    def __init__(self, limit=16, max_waiting=64, timeout=15.0, interactive_reserve=2):
+        self.limit = max(1, limit)
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.interactive_reserve = min(max(0, interactive_reserve), self.limit - 1)
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._avg_hold = 1.0
+        self._stats = {"admitted": 0, "queued": 0, "queue_full": 0, "queue_timeouts": 0}
+
+    def _capacity(self, priority):
+        return self.limit - (self.interactive_reserve if priority else 0)
+
+    def _weight(self, priority, weight):
+        return min(max(1, int(weight)), self._capacity(priority))
+
+    def _fits(self, priority, weight):
+        return self.in_use + weight <= self._capacity(priority)
+
+    def _try_acquire(self, priority, weight, wake):
+        """Under the lock: a Slot, or a queued waiter. Raises when the queue is full."""
+        ahead = any(entry[0] <= priority for entry in self._waiters)
+        if not ahead and self._fits(priority, weight):
+            self.in_use += weight
+            self._stats["admitted"] += 1
+            return Slot(self, weight, priority), None
+        if len(self._waiters) >= self.max_waiting:
+            self._stats["queue_full"] += 1
+            raise AdmissionRejected("Server is busy; too many queued AI requests", self._retry_after())
+        waiter = _Waiter(priority, weight, wake)
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        self._stats["queued"] += 1
+        return None, waiter
+
+    def _retry_after(self):
+        return self._avg_hold * (1 + len(self._waiters) / self.limit)
+
+    def _give_up(self, waiter):
+        """Under the lock: drop a waiter that timed out, or keep its slot if it was granted meanwhile."""
+        if waiter.granted:
+            self._stats["admitted"] += 1
+            return Slot(self, waiter.weight, waiter.priority)
+        self._waiters = [entry for entry in self._waiters if entry[2] is not waiter]
+        heapq.heapify(self._waiters)
+        self._stats["queue_timeouts"] += 1
+        raise AdmissionRejected("Timed out waiting for an AI slot", self._retry_after())
+
+    def acquire(self, priority="bulk", weight=1):
+        """Block until a slot is free. Raises ``AdmissionRejected`` if the queue is full or the wait times out."""
+        rank = PRIORITIES.get(priority, 1)
+        event = threading.Event()
+        with self._lock:
+            slot, waiter = self._try_acquire(rank, self._weight(rank, weight), event.set)
+        if slot is not None:
+            return slot
+        event.wait(self.timeout)
+        with self._lock:
+            return self._give_up(waiter)
+
+    async def aacquire(self, priority="bulk", weight=1):
+        """Async ``acquire``: waits on the event loop instead of blocking a thread."""
+        rank = PRIORITIES.get(priority, 1)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            slot, waiter = self._try_acquire(rank, self._weight(rank, weight), wake)
+        if slot is not None:
+            return slot
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._lock:
+            return self._give_up(waiter)
+
+    def _release(self, slot):
+        held = time.monotonic() - slot.acquired_at
+        with self._lock:
+            self.in_use -= slot.weight
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+            while self._waiters:
+                priority, _, waiter = self._waiters[0]
+                if not self._fits(priority, waiter.weight):
+                    break
+                heapq.heappop(self._waiters)
+                self.in_use += waiter.weight
+                waiter.granted = True
+                waiter.wake()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update(in_use=self.in_use, waiting=len(self._waiters))
+        snapshot.update(limit=self.limit, interactive_reserve=self.interactive_reserve)
+        return snapshot
+
+
+class AdmissionController:
+    """Per-client rate limits in front of the shared concurrency limiter."""
+
+    def __init__(self, store=None, limiter=None, rate_per_minute=60, burst=20, proxy_hops=1, enabled=True):
+        self.store = store if store is not None else MemoryBucketStore()
+        self.limiter = limiter if limiter is not None else ConcurrencyLimiter()
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.proxy_hops = proxy_hops
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"rate_limited": 0, "new_credentials": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build from ADMISSION_* environment variables (ADMISSION_ENABLED=0 turns it off)."""
+        if os.getenv("ADMISSION_STORE", "memory").lower() == "sqlite":
+            path = os.getenv("ADMISSION_PATH") or os.path.join(tempfile.gettempdir(), "brain_trails_admission.sqlite3")
+            store = SQLiteBucketStore(path)
+        else:
+            store = MemoryBucketStore()
+        limiter = ConcurrencyLimiter(
+            limit=int(os.getenv("ADMISSION_MAX_CONCURRENT", 16)),
+            max_waiting=int(os.getenv("ADMISSION_MAX_WAITING", 64)),
+            timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 15)),
+            interactive_reserve=int(os.getenv("ADMISSION_INTERACTIVE_RESERVE", 2)),
+        )
+        return cls(
+            store, limiter,
+            rate_per_minute=float(os.getenv("ADMISSION_RATE_PER_MINUTE", 60)),
+            burst=float(os.getenv("ADMISSION_BURST", 20)),
+            proxy_hops=int(os.getenv("ADMISSION_PROXY_HOPS", 1)),
+            enabled=os.getenv("ADMISSION_ENABLED", "1").lower() not in ("0", "false", "no", "off"),
+        )
+
+    def client_id(self, headers, remote_addr):
+        """Identify the caller: a hash of its Authorization header, else its IP."""
+        auth = headers.get("Authorization") or headers.get("authorization")
+        if auth:
+            return "auth:" + hashlib.sha256(auth.encode("utf-8")).hexdigest()[:32]
+        return self.ip_id(headers, remote_addr)
+
+    def ip_id(self, headers, remote_addr):
+        """The caller's IP bucket.
+
+        ``X-Forwarded-For`` is trusted only for the hops appended by our own
+        ``proxy_hops`` proxies (Render adds one), so clients can't spoof it.
+        """
+        forwarded = headers.get("X-Forwarded-For") or headers.get("x-forwarded-for")
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()] if forwarded else []
+        if self.proxy_hops and len(hops) >= self.proxy_hops:
+            return "ip:" + hops[-self.proxy_hops]
+        return "ip:" + (remote_addr or "unknown")
+
+    def _take(self, client, cost):
+        wait = self.store.take(client, min(cost, self.burst), self.rate, self.burst)
+        if wait:
+            with self._lock:
+                self._stats["rate_limited"] += 1
+            raise AdmissionRejected("Too many AI requests; slow down", wait)
+
+    def check_rate(self, client, cost=1, ip=None):
+        """Spend ``cost`` from ``client``'s bucket or raise ``AdmissionRejected``.
+
+        ``ip`` (the caller's ``ip_id``) is charged as well while ``client`` is
+        an Authorization value without a bucket yet.
+        """
+        if ip is not None and client != ip and not self.store.known(client):
+            with self._lock:
+                self._stats["new_credentials"] += 1
+            self._take(ip, cost)
+        self._take(client, cost)
+
+    def admit(self, client, priority="bulk", cost=1, weight=1, ip=None):
+        """Rate-check ``client`` and wait for a slot. Returns a ``Slot`` (None when disabled)."""
+        if not self.enabled:
+            return None
+        self.check_rate(client, cost, ip)
+        return self.limiter.acquire(priority, weight)
+
+    async def aadmit(self, client, priority="bulk", cost=1, weight=1, ip=None):
+        """Async ``admit`` for the ASGI routes."""
+        if not self.enabled:
+            return None
+        self.check_rate(client, cost, ip)
+        return await self.limiter.aacquire(priority, weight)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update(self.limiter.stats())
+        snapshot.update(
+            enabled=self.enabled, rate_per_minute=round(self.rate * 60, 2), burst=self.burst,
+            store=type(self.store).__name__,
+        )
+        return snapshot
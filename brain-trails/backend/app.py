@@ -6,13 +6,42 @@ Provides health checks and AI-powered study features via Groq (Llama) and Gemini
 
 import os
 import json
-import re
 import base64
+import hashlib
 import logging
-from flask import Flask, request, jsonify
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+from groq_pool import GroqClientPool
+from key_scheduler import KeyScheduler
+from response_cache import ResponseCache
+from singleflight import SingleFlight, request_fingerprint
+from hedging import HedgePolicy
+from chunking import map_concurrent, merge_syllabi, split_sections
+from json_extract import (
+    JSONExtractionError, JSONScanner, extract_json, validate_question, validate_quiz, validate_syllabus,
+)
+from quiz_topup import QuizTopup, output_tokens as quiz_output_tokens, requested_count
+from prompt_budget import PromptBudget, compress, count_tokens
+from retrieval import NoteRetriever
+from metrics import Metrics
+from admission import AdmissionController, AdmissionRejected
+from jobs import JobQueue, JobQueueFull
+from image_prep import ImageFormatError, ImageLimitError, ImagePreprocessor
+from pdf_extract import PDFExtractor, PDFExtractionError, PDFLimitError, base64_decoded_size
+from warmup import preload
+from model_router import ModelRouter
+from question_bank import QuestionBank
+from chat_sessions import ChatSessions, history_tokens
+import deadlines
+from deadlines import DeadlineExceeded, DeadlinePolicy
+import tracing
+from tracing import Tracer
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,11 +54,24 @@ load_dotenv()
 
 app = Flask(__name__)
 
-# Enable CORS for frontend
-CORS(app)
+# Enable CORS for frontend (CORS_ORIGINS narrows it to a comma-separated list; asgi.py sends the same headers)
+CORS_ORIGINS = [origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()]
+CORS(app, origins=CORS_ORIGINS)
+
+
+def cors_allow_origin(origin):
+    """The ``Access-Control-Allow-Origin`` Flask-CORS sends for a request from ``origin``, or None."""
+    if "*" in CORS_ORIGINS:
+        return "*"
+    return origin if origin in CORS_ORIGINS else None
+
 
 # ─── AI Client Setup ───────────────────────────────────────────
 
+# One keep-alive client per Groq key, shared by all threads in this worker
+groq_pool = GroqClientPool.from_env()
+
+
 def get_groq_keys():
     """Return a list of Groq API keys from env (comma-separated or single)."""
     # Support comma-separated keys: GROQ_API_KEYS=key1,key2,key3
@@ -41,52 +83,461 @@ def get_groq_keys():
     return [single] if single.strip() else []
 
 
-def groq_chat(messages, temperature=0.7, max_tokens=1500):
-    """Try each Groq key in order. Rotate on 401/429 errors."""
-    from groq import Groq
+# Keys are parsed once per worker; health is shared by all its threads
+key_scheduler = KeyScheduler.from_env(get_groq_keys())
+
+# Content-addressed cache for quiz/syllabus generations (AI_CACHE_BACKEND=sqlite shares it across workers)
+response_cache = ResponseCache.from_env()
+
+# Identical in-flight Groq calls share one upstream request (SINGLEFLIGHT_LOCK_DIR extends this across workers)
+groq_flight = SingleFlight.from_env()
+
+# Per-provider latency tracking; AI_HEDGING=1 races Gemini against slow Groq calls
+hedge_policy = HedgePolicy.from_env()
+
+# Short quizzes are topped up with just the missing questions (QUIZ_TOPUP_BUDGET_SECONDS bounds the wait)
+quiz_topup = QuizTopup.from_env()
+
+# Budgeted PDF text extraction; PDF_EXTRACT_WORKERS > 1 fans pages out to a process pool
+pdf_extractor = PDFExtractor.from_env()
+
+# Syllabus photos are sniffed, size-checked and downscaled before they are sent to Gemini
+image_preprocessor = ImagePreprocessor.from_env()
+
+# Stage latencies and upstream counters, served in Prometheus format at /api/metrics
+metrics = Metrics()
+
+# Per-client token buckets and a shared slot limit; interactive chat is served before bulk generation
+admission = AdmissionController.from_env()
+
+# Background workers for ?async=1 syllabus parses; results are polled at /api/jobs/<id>
+job_queue = JobQueue.from_env()
+
+# Subject/topic quizzes are served from previously generated questions; misses and idle refills fill it
+question_bank = QuestionBank.from_env()
+
+# Per-route time budgets (X-Request-Timeout can adjust them); past it, upstream work stops and the route answers 504
+deadline_policy = DeadlinePolicy.from_env()
+
+# Span trees for AI requests sent with X-Trace: <TRACE_TOKEN> or picked at TRACE_SAMPLE_RATE
+tracer = Tracer.from_env()
+
+# Filled in by warm_up(); reported in /api/health
+startup = {"warmup": None}
+
+
+def record_usage(provider, prompt_tokens, completion_tokens):
+    """Count provider-reported token usage (missing values are skipped)."""
+    if prompt_tokens:
+        metrics.inc("llm_tokens_total", prompt_tokens, provider=provider, kind="prompt")
+    if completion_tokens:
+        metrics.inc("llm_tokens_total", completion_tokens, provider=provider, kind="completion")
+
+
+def record_groq_usage(usage):
+    """Count token usage from a Groq completion's (or stream chunk's) usage block."""
+    if usage is not None:
+        record_usage("groq", getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+
+
+def groq_chunk_usage(chunk):
+    """Usage carried by a stream chunk: ``usage``, or Groq's ``x_groq.usage`` on the last chunk."""
+    return getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+
+
+def record_gemini_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        record_usage(
+            "gemini", getattr(usage, "prompt_token_count", 0), getattr(usage, "candidates_token_count", 0)
+        )
+
+
+def record_generation(text, provider):
+    """Count which provider served a generation, and Gemini serving while Groq is configured."""
+    metrics.inc("generations_total", provider=provider, outcome="success" if text else "error")
+    if text and provider == "gemini" and len(key_scheduler):
+        metrics.inc("provider_fallbacks_total")
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def _start_trace():
+    if request.method != "POST" or not request.path.startswith("/api/ai/"):
+        return
+    trace = tracer.start(request.path, request.headers)
+    if trace is not None:
+        g.trace = trace
+        with tracing.span("json_body", bytes=request.content_length or 0):
+            request.get_json(silent=True)
+
+
+@app.after_request
+def _attach_trace(response):
+    trace = g.get("trace")
+    if trace is None:
+        return response
+    if response.is_streamed:
+        # Finished at teardown, once the body has been sent
+        trace.root.set(status=response.status_code)
+        return response
+    tracer.finish(trace, status=response.status_code)
+    if trace.admin:
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Trace-Id"] = trace.id
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            response.set_data(json.dumps({**body, "trace": trace.to_dict()}))
+    return response
+
+
+@app.teardown_request
+def _finish_trace(exc):
+    tracer.finish(g.pop("trace", None))
+
+
+@app.after_request
+def _observe_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe(
+            "http_request_duration_seconds", time.perf_counter() - started,
+            endpoint=endpoint, method=request.method, status=str(response.status_code),
+        )
+    return response
+
+
+# Admission-controlled routes: path -> (priority, rate-limit cost per request, or per job for batches)
+ADMISSION_ROUTES = {
+    "/api/ai/chat": ("interactive", 1),
+    "/api/ai/chat/stream": ("interactive", 1),
+    "/api/ai/generate-quiz": ("bulk", 2),
+    "/api/ai/generate-quiz/stream": ("bulk", 2),
+    "/api/ai/generate-quiz/batch": ("bulk", 2),
+    "/api/ai/parse-syllabus": ("bulk", 3),
+}
+
+
+def admission_plan(path, data):
+    """Return ``(priority, cost, weight)`` for an admission-controlled route, else None.
+
+    A batch costs per job and holds as many slots as jobs it runs at once.
+    """
+    route = ADMISSION_ROUTES.get(path)
+    if route is None:
+        return None
+    priority, cost = route
+    if path == "/api/ai/generate-quiz/batch":
+        jobs = data.get("jobs") if isinstance(data, dict) else None
+        count = len(jobs) if isinstance(jobs, list) and jobs else 1
+        return priority, cost * count, quiz_batch_concurrency(count)
+    return priority, cost, 1
+
+
+def rejection_body(rejected):
+    return {"error": str(rejected), "retry_after": rejected.retry_after}
+
 
-    keys = get_groq_keys()
-    if not keys:
+@app.before_request
+def _start_deadline():
+    deadline = deadline_policy.for_request(request.path, request.headers) if request.method == "POST" else None
+    deadlines.start(deadline)
+
+
+@app.teardown_request
+def _clear_deadline(exc):
+    # Worker threads are reused; runs after the body for streamed responses
+    deadlines.start(None)
+
+
+def deadline_body(exceeded):
+    return {"error": str(exceeded), "deadline_seconds": exceeded.budget}
+
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_error(exceeded):
+    logger.warning(f"Deadline: {request.path} {exceeded}")
+    metrics.inc("deadlines_exceeded_total", stage=exceeded.stage or "unknown")
+    return jsonify(deadline_body(exceeded)), 504
+
+
+@app.before_request
+def _admit_request():
+    plan = admission_plan(request.path, request.get_json(silent=True)) if request.method == "POST" else None
+    if plan is None:
+        return None
+    client = admission.client_id(request.headers, request.remote_addr)
+    ip = admission.ip_id(request.headers, request.remote_addr)
+    try:
+        with tracing.span("admission"):
+            slot = admission.admit(client, *plan, ip=ip)
+    except AdmissionRejected as rejected:
+        logger.warning(f"Admission: rejected {request.path} ({rejected}), retry after {rejected.retry_after}s")
+        return jsonify(rejection_body(rejected)), 429, {"Retry-After": str(rejected.retry_after)}
+    if slot is not None:
+        g.admission_slot = slot
+    return None
+
+
+@app.after_request
+def _release_slot_on_close(response):
+    # Streaming responses keep their slot until the body has been sent; others release at teardown
+    if response.is_streamed and "admission_slot" in g:
+        response.call_on_close(g.pop("admission_slot").release)
+    return response
+
+
+@app.teardown_request
+def _release_slot(exc):
+    slot = g.pop("admission_slot", None)
+    if slot is not None:
+        slot.release()
+
+
+def _groq_completion(messages, temperature, max_tokens, stream=False, model=None):
+    """Run one completion through the healthiest Groq key. Returns (completion, error).
+
+    Keys rotate on 401/429 errors; the scheduler remembers which keys are
+    cooling down so later requests skip them without a wasted round-trip.
+    With ``stream=True`` the completion is a chunk iterator and rotation only
+    happens while the stream is being opened. Each attempt's timeout is capped
+    by the request deadline; once it has passed, ``DeadlineExceeded`` is raised
+    instead of trying the next key.
+    """
+    if not len(key_scheduler):
         return None, "No GROQ_API_KEY(S) configured"
 
     last_error = None
-    for key in keys:
+    tried = set()
+    while True:
+        budget = deadlines.remaining("groq")
+        state = key_scheduler.acquire(exclude=tried)
+        if state is None:
+            break
+        tried.add(state.index)
         try:
-            client = Groq(api_key=key)
-            completion = client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            return completion.choices[0].message.content, None
+            client = groq_pool.get(state.key)
+            with tracing.span("groq_attempt", key=state.index, model=model or GROQ_MODEL):
+                raw = client.chat.completions.with_raw_response.create(
+                    model=model or GROQ_MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=stream,
+                    timeout=groq_pool.timeout(budget),
+                )
+                completion = raw.parse()
+            key_scheduler.record_success(state, raw.headers)
+            metrics.inc("groq_key_attempts_total", key=str(state.index), outcome="success")
+            return completion, None
         except Exception as e:
+            deadlines.check("groq")
             error_str = str(e)
             last_error = error_str
             # If it's an auth or rate limit error, try the next key
-            if "401" in error_str or "429" in error_str or "invalid_api_key" in error_str.lower():
+            if key_scheduler.record_failure(state, e):
+                metrics.inc("groq_key_attempts_total", key=str(state.index), outcome="rotated")
                 continue
             # For other errors, don't retry with different keys
+            metrics.inc("groq_key_attempts_total", key=str(state.index), outcome="error")
             return None, f"AI generation failed: {error_str}"
 
-    return None, f"All {len(keys)} API key(s) failed. Last error: {last_error}"
+    if not tried:
+        wait = key_scheduler.next_available_in()
+        return None, f"All {len(key_scheduler)} API key(s) are cooling down. Retry in {wait:.0f}s"
+    return None, f"All {len(tried)} available API key(s) failed. Last error: {last_error}"
+
+
+def groq_chat(messages, temperature=0.7, max_tokens=1500, model=None):
+    """Return (text, error) for a chat completion on ``model`` (default GROQ_MODEL), rotating keys as needed.
+
+    Concurrent calls with the same prompt fingerprint wait on a single
+    upstream request and share its result.
+    """
+    def call():
+        with metrics.timer("stage_duration_seconds", stage="groq"):
+            completion, error = _groq_completion(messages, temperature, max_tokens, model=model)
+        if completion is None:
+            return None, error
+        record_groq_usage(getattr(completion, "usage", None))
+        return completion.choices[0].message.content, None
+
+    key = request_fingerprint(model or GROQ_MODEL, messages, temperature, max_tokens)
+    (text, error), shared = groq_flight.do(key, call, share_if=lambda result: result[0] is not None)
+    if shared:
+        logger.info("Groq: joined an identical in-flight request")
+    return text, error
+
+
+def groq_chat_stream(messages, temperature=0.7, max_tokens=1500, model=None):
+    """Return (text_chunks, error) where text_chunks yields content deltas as they arrive."""
+    stream, error = _groq_completion(messages, temperature, max_tokens, stream=True, model=model)
+    if stream is None:
+        return None, error
+
+    def deltas():
+        with stream:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                record_groq_usage(groq_chunk_usage(chunk))
+
+    return deltas(), None
+
+
+def gemini_options(stage="gemini"):
+    """``generate_content`` keyword arguments that bound the call by the request deadline."""
+    budget = deadlines.remaining(stage)
+    return {"request_options": {"timeout": budget}} if budget is not None else {}
+
+
+def gemini_stream(gemini, prompt):
+    """Yield text chunks from a streaming Gemini generation."""
+    for chunk in gemini.generate_content(prompt, stream=True, **gemini_options()):
+        if chunk.text:
+            yield chunk.text
+
+
+_gemini_lock = threading.Lock()
+_gemini_model = None  # ((api_key, base_url), GenerativeModel), built once per worker
 
 
 def get_gemini_model():
-    """Return a Gemini GenerativeModel if the key is configured."""
+    """Return the worker's Gemini GenerativeModel if the key is configured.
+
+    ``genai.configure`` and the model are set up on first use (or by
+    ``warm_up``) and reused; a changed ``GEMINI_API_KEY`` rebuilds them.
+    ``GEMINI_BASE_URL`` points the REST transport at a local stand-in
+    (benchmarks); the async client used by asgi.py needs the default gRPC one.
+    """
+    global _gemini_model
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         return None
-    try:
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel("gemini-2.0-flash")
-    except ImportError:
+    config = (api_key, os.getenv("GEMINI_BASE_URL"))
+    cached = _gemini_model
+    if cached is not None and cached[0] == config:
+        return cached[1]
+    with _gemini_lock:
+        if _gemini_model is None or _gemini_model[0] != config:
+            try:
+                import google.generativeai as genai
+            except ImportError:
+                return None
+            if config[1]:
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": config[1]})
+            else:
+                genai.configure(api_key=api_key)
+            _gemini_model = (config, genai.GenerativeModel(GEMINI_MODEL))
+        return _gemini_model[1]
+
+
+def warm_up(async_clients=False):
+    """Import provider SDKs and build this worker's Groq clients and Gemini model before traffic arrives.
+
+    Called per worker by gunicorn.conf.py (post-fork) and by the ASGI lifespan
+    startup; WARMUP=0 skips it. Returns the timings, also kept in ``startup``.
+    """
+    if os.getenv("WARMUP", "1") == "0":
         return None
+    started = time.perf_counter()
+    imports = preload()
+    for key in get_groq_keys():
+        if async_clients:
+            groq_pool.get_async(key)
+        else:
+            groq_pool.get(key)
+    get_gemini_model()
+    timings = {
+        "imports_ms": imports,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        "pid": os.getpid(),
+    }
+    startup["warmup"] = timings
+    logger.info(f"Warm-up: worker {os.getpid()} ready in {timings['total_ms']}ms")
+    return timings
+
+
+def gemini_chat(prompt):
+    """Return (text, error) from Gemini; (None, None) when it isn't configured."""
+    gemini = get_gemini_model()
+    if not gemini:
+        return None, None
+    options = gemini_options()
+    try:
+        with metrics.timer("stage_duration_seconds", stage="gemini"):
+            response = gemini.generate_content(prompt, **options)
+        record_gemini_usage(response)
+        return response.text, None
+    except Exception as e:
+        deadlines.check("gemini")
+        logger.error(f"Gemini generation failed: {str(e)}")
+        return None, f"AI generation failed (Gemini): {str(e)}"
+
+
+def gemini_prompt(messages):
+    """Flatten chat messages into one Gemini prompt, labelling earlier turns by speaker."""
+    speakers = {"user": "Student", "assistant": "AI Familiar"}
+    turns = [
+        f"{speakers[m['role']]}: {m['content']}" if m["role"] in speakers else m["content"] for m in messages[1:-1]
+    ]
+    return "\n\n".join([messages[0]["content"], *turns, messages[-1]["content"]])
+
+
+def generate_text(system_prompt, user_prompt, temperature=0.7, max_tokens=1500, task=None, count=None, model=None,
+                  history=()):
+    """Return (text, error, model) using Groq first and Gemini as the fallback.
+
+    The Groq model is ``model`` if given, else the router's pick for ``task``
+    (see model_router). ``history`` messages (earlier chat turns) go between
+    the system and user prompts. With AI_HEDGING on, Gemini is raced against
+    a slow Groq call instead of waiting for it to fail.
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        *history,
+        {"role": "user", "content": user_prompt},
+    ]
+    input_tokens = count_tokens(user_prompt) + sum(count_tokens(m["content"]) for m in history)
+    model = model or model_router.route(task, input_tokens, count)
+
+    def call_groq():
+        started = time.perf_counter()
+        text, error = groq_chat(messages, temperature=temperature, max_tokens=max_tokens, model=model)
+        if text:
+            model_router.observe(task, model, time.perf_counter() - started)
+        return text, error
+
+    def call_gemini():
+        return gemini_chat(gemini_prompt(messages))
+
+    text, error, provider = hedge_policy.call(
+        ("groq", call_groq),
+        ("gemini", call_gemini if os.getenv("GEMINI_API_KEY") else None),
+    )
+    record_generation(text, provider)
+    return text, error, model if provider == "groq" else GEMINI_MODEL
 
 
 GROQ_MODEL = "llama-3.3-70b-versatile"
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# With MODEL_ROUTING=1, short chat/quiz requests go to GROQ_SMALL_MODEL; by default everything uses GROQ_MODEL
+model_router = ModelRouter.from_env(GROQ_MODEL)
+
+# Prompts are sized for the primary model; context gets what the system prompt and output leave over
+prompt_budget = PromptBudget.for_model(GROQ_MODEL)
 
+# Notes too long for the chat budget are narrowed to the chunks relevant to the question
+note_retriever = NoteRetriever.from_env()
+
+# Multi-turn chat: notes stored once per session, older turns compacted into a running summary
+chat_sessions = ChatSessions.from_env()
 
 
 # ============================================
@@ -99,16 +550,94 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "version": "1.0.0.0",
-        "ai_provider": "groq" if os.getenv("GROQ_API_KEY") else "gemini",
+        "ai_provider": "groq" if len(key_scheduler) else "gemini",
         "features": {
             "ai_chat": True,
+            "ai_chat_stream": True,
             "parse_syllabus": True,
             "generate_quiz": True,
+            "generate_quiz_batch": True,
+            "generate_quiz_stream": True,
             "health": True,
-        }
+            "metrics": True,
+            "jobs": True,
+            "chat_sessions": chat_sessions.enabled,
+        },
+        "groq_pool": groq_pool.stats(),
+        "groq_keys": key_scheduler.snapshot(),
+        "cache": response_cache.stats(),
+        "singleflight": groq_flight.stats(),
+        "hedging": hedge_policy.stats(),
+        "quiz_topup": quiz_topup.stats(),
+        "prompt_budget": prompt_budget.stats(),
+        "note_retrieval": note_retriever.stats(),
+        "admission": admission.stats(),
+        "image_prep": image_preprocessor.stats(),
+        "jobs": job_queue.stats(),
+        "model_routing": model_router.stats(),
+        "question_bank": question_bank.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "deadlines": deadline_policy.stats(),
+        "tracing": tracer.stats(),
+        "startup": startup,
     })
 
 
+@metrics.collector
+def _component_metrics():
+    """Counters the cache, single-flight, key scheduler and hedging components already keep."""
+    cache = response_cache.stats()
+    yield "cache_lookups_total", "counter", "Response cache lookups", {"result": "hit"}, cache["hits"]
+    yield "cache_lookups_total", "counter", "Response cache lookups", {"result": "miss"}, cache["misses"]
+    flight = groq_flight.stats()
+    for role in ("leader", "follower"):
+        yield (
+            "singleflight_calls_total", "counter", "Groq calls that led or joined a shared request",
+            {"role": role}, flight[role + "s"],
+        )
+    for key in key_scheduler.snapshot():
+        labels = {"key": str(key["index"])}
+        yield (
+            "groq_key_healthy", "gauge", "1 if the key is neither cooling down nor quarantined",
+            labels, int(key["status"] == "healthy"),
+        )
+        yield "groq_key_rate_limited_total", "counter", "429 responses per key", labels, key["rate_limited"]
+    gate = admission.stats()
+    for reason in ("rate_limited", "queue_full", "queue_timeouts"):
+        yield "admission_rejections_total", "counter", "Requests rejected with 429", {"reason": reason}, gate[reason]
+    yield "admission_slots_in_use", "gauge", "Upstream slots held by admitted requests", {}, gate["in_use"]
+    yield "admission_waiting", "gauge", "Requests queued for an upstream slot", {}, gate["waiting"]
+    hedges = hedge_policy.stats()
+    yield "hedged_calls_total", "counter", "Calls where Gemini was raced against Groq", {}, hedges["hedged"]
+    jobs = job_queue.stats()
+    for outcome in ("done", "failed", "rejected"):
+        yield "jobs_total", "counter", "Background jobs per outcome", {"outcome": outcome}, jobs[outcome]
+    yield "jobs_pending", "gauge", "Background jobs queued or running in this worker", {}, jobs["pending"]
+    routing = model_router.stats()
+    for tier in ("small", "large"):
+        yield "model_routes_total", "counter", "Groq requests routed per model tier", {"tier": tier}, routing[tier]
+    yield (
+        "model_escalations_total", "counter", "Small-model outputs that failed validation and were retried",
+        {}, routing["escalated"],
+    )
+    bank = question_bank.stats()
+    yield "question_bank_lookups_total", "counter", "Quiz bank lookups", {"result": "hit"}, bank["hits"]
+    yield "question_bank_lookups_total", "counter", "Quiz bank lookups", {"result": "miss"}, bank["misses"]
+    yield "question_bank_questions", "gauge", "Questions in the bank", {}, bank.get("questions") or 0
+    sessions = chat_sessions.stats()
+    yield "chat_sessions", "gauge", "Stored chat sessions", {}, sessions["sessions"]
+    yield (
+        "chat_session_compactions_total", "counter", "Chat histories folded into a running summary",
+        {}, sessions["compactions"],
+    )
+
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (per worker process, like /api/health)."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api", methods=["GET"])
 def api_root():
     """API root with available endpoints."""
@@ -117,9 +646,14 @@ def api_root():
         "version": "1.0.0.0",
         "endpoints": {
             "health": "/api/health",
+            "metrics": "/api/metrics",
             "ai_chat": "/api/ai/chat [POST]",
-            "parse_syllabus": "/api/ai/parse-syllabus [POST]",
+            "ai_chat_stream": "/api/ai/chat/stream [POST, text/event-stream]",
+            "parse_syllabus": "/api/ai/parse-syllabus [POST, ?async=1 for a background job]",
+            "job": "/api/jobs/<job_id> [GET]",
             "generate_quiz": "/api/ai/generate-quiz [POST]",
+            "generate_quiz_batch": "/api/ai/generate-quiz/batch [POST, application/x-ndjson]",
+            "generate_quiz_stream": "/api/ai/generate-quiz/stream [POST, text/event-stream]",
         }
     })
 
@@ -140,57 +674,273 @@ Keep responses concise, friendly, and helpful. Use a slightly magical/RPG tone
 that fits the app's cozy adventure theme. Use emojis sparingly but effectively."""
 
 
+CHAT_MAX_TOKENS = 1500
+
+# Note tokens sent with each chat turn; longer notes are narrowed to the most relevant chunks
+CHAT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CHAT_CONTEXT_TOKENS", 800))
+
+
+@tracing.traced("prompt_build")
+def build_chat_prompt(user_message, note_content, history=()):
+    """Build the user prompt for the AI Familiar from the question and note context.
+
+    The notes get up to ``CHAT_CONTEXT_TOKENS`` of what the system prompt, ``history`` messages,
+    question and reply leave over; longer notes are narrowed to the chunks most relevant to the question.
+    """
+    question = f"Student's question: {user_message}"
+    earlier = "\n".join(message["content"] for message in history)
+    frame = f"{earlier}The student's current notes:\n---\n\n---\n\n{question}"
+    available = min(prompt_budget.context_tokens(STUDY_SYSTEM_PROMPT, frame, CHAT_MAX_TOKENS), CHAT_CONTEXT_TOKENS)
+    notes = prompt_budget.fit(
+        note_retriever.select(note_content, user_message, available), STUDY_SYSTEM_PROMPT, frame, CHAT_MAX_TOKENS,
+        limit=CHAT_CONTEXT_TOKENS,
+    )
+    if not notes:
+        return question
+    return f"The student's current notes:\n---\n{notes}\n---\n\n{question}"
+
+
+CHAT_SUMMARY_SYSTEM_PROMPT = """You summarize a conversation between a student and their AI study companion.
+
+Keep the topics covered, key facts and definitions, what the student struggled with and any open questions.
+Write plain prose under 150 words. Return only the summary."""
+
+CHAT_SUMMARY_MAX_TOKENS = 300
+
+
+def chat_summary_prompt(summary, turns):
+    """User prompt that folds ``turns`` into the running ``summary``."""
+    speakers = {"user": "Student", "assistant": "AI Familiar"}
+    transcript = "\n\n".join(f"{speakers[turn['role']]}: {turn['content']}" for turn in turns)
+    earlier = f"Summary so far:\n{summary}\n\n" if summary else ""
+    return f"{earlier}Conversation to add to the summary:\n{transcript}"
+
+
+def compact_chat_session(session):
+    """Fold the session's oldest turns into its summary once the history is over budget."""
+    folded = chat_sessions.compaction(session)
+    if not folded:
+        return
+    logger.info(f"Chat sessions: compacting {len(folded)} messages ({history_tokens(session)} tokens)")
+    summary, _, _ = generate_text(
+        CHAT_SUMMARY_SYSTEM_PROMPT, chat_summary_prompt(session["summary"], folded),
+        temperature=0.2, max_tokens=CHAT_SUMMARY_MAX_TOKENS, task="summary",
+    )
+    chat_sessions.compact(session, folded, summary)
+
+
+def open_chat_session(data):
+    """Return ``(session, error)`` for a chat request.
+
+    ``session`` is None for stateless requests (no ``sessionId`` and no ``"session": true``,
+    or sessions turned off); ``error`` is set for an unknown or expired ``sessionId``.
+    """
+    if not chat_sessions.enabled:
+        return None, None
+    session_id = data.get("sessionId")
+    if session_id:
+        session = chat_sessions.get(session_id)
+        if session is None:
+            return None, "Unknown or expired chat session; start a new one with \"session\": true and noteContent"
+        if data.get("noteContent") and data["noteContent"] != session["notes"]:
+            # Stored now, so new notes stick even if this turn's generation fails
+            session["notes"] = data["noteContent"]
+            chat_sessions.save(session)
+        return session, None
+    if data.get("session") is True:
+        return chat_sessions.create(data.get("noteContent", "")), None
+    return None, None
+
+
+def chat_turn(data, session):
+    """Return ``(user_prompt, history)``; a session supplies the notes and earlier turns."""
+    if session is None:
+        return build_chat_prompt(data["message"], data.get("noteContent", "")), []
+    history = chat_sessions.history(session)
+    return build_chat_prompt(data["message"], session["notes"], history), history
+
+
 @app.route("/api/ai/chat", methods=["POST"])
 def ai_chat():
-    """AI chat endpoint using Groq (primary) or Gemini (fallback)."""
+    """AI chat endpoint using Groq (primary) or Gemini (fallback).
+
+    With ``"session": true`` or a ``sessionId`` the conversation is kept server-side
+    (see chat_sessions) and the response carries its ``sessionId``.
+    """
     try:
         data = request.get_json(silent=True)
         if not data or "message" not in data:
             logger.warning("AI Chat: Missing 'message' in request body")
             return jsonify({"error": "Missing 'message' in request body"}), 400
 
+        if "text/event-stream" in request.headers.get("Accept", ""):
+            return ai_chat_stream()
+
+        session, session_error = open_chat_session(data)
+        if session_error:
+            return jsonify({"error": session_error}), 404
+
         user_message = data["message"]
-        note_content = data.get("noteContent", "")
-        
         logger.info(f"AI Chat request: {user_message[:50]}...")
-
-        # Build context
-        user_prompt = ""
-        if note_content:
-            user_prompt += f"The student's current notes:\n---\n{note_content[:3000]}\n---\n\n"
-        user_prompt += f"Student's question: {user_message}"
-
-        # Try Groq (with key rotation)
-        messages = [
-            {"role": "system", "content": STUDY_SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ]
-        response_text, error = groq_chat(messages, temperature=0.7, max_tokens=1500)
+        if session is not None:
+            compact_chat_session(session)
+        user_prompt, history = chat_turn(data, session)
+
+        # Groq (with key rotation), then Gemini
+        response_text, error, model = generate_text(
+            STUDY_SYSTEM_PROMPT, user_prompt, temperature=0.7, max_tokens=CHAT_MAX_TOKENS, task="chat",
+            history=history,
+        )
         if response_text:
-            return jsonify({"response": response_text, "model": GROQ_MODEL})
-
-        if error:
-            logger.error(f"Groq failed: {error}")
+            body = {"response": response_text, "model": model}
+            if session is not None:
+                chat_sessions.add_turn(session, user_message, response_text)
+                body["sessionId"] = session["id"]
+            return jsonify(body)
 
-        # Fallback to Gemini
-        gemini = get_gemini_model()
-        if gemini:
-            try:
-                prompt = STUDY_SYSTEM_PROMPT + "\n\n" + user_prompt
-                response = gemini.generate_content(prompt)
-                return jsonify({"response": response.text, "model": "gemini-2.0-flash"})
-            except Exception as e:
-                logger.error(f"Gemini generation failed: {str(e)}")
-                return jsonify({"error": f"AI generation failed (Gemini): {str(e)}"}), 500
-
-        logger.error("No AI provider available or all failed.")
+        logger.error(f"No AI provider available or all failed: {error}")
         return jsonify({"error": error or "No AI provider configured. Please check environment variables on Render."}), 500
 
+    except DeadlineExceeded as e:
+        return deadline_error(e)
     except Exception as e:
         logger.exception("AI Chat: Internal server error")
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 
+def close_stream(chunks):
+    """Close an upstream chunk generator so a finished or abandoned stream releases its connection."""
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        close()
+
+
+def format_sse(payload, event=None):
+    """Format one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+def stream_error_event(error, label, model):
+    """The ``event: error`` ending a stream that ``error`` interrupted (a deadline or an upstream failure)."""
+    if isinstance(error, DeadlineExceeded):
+        logger.warning(f"{label}: {error} ({model})")
+        metrics.inc("deadlines_exceeded_total", stage=error.stage)
+        return format_sse(deadline_body(error), event="error")
+    logger.error(f"{label}: upstream failed mid-stream ({model}): {str(error)}")
+    return format_sse({"error": f"AI generation failed: {str(error)}"}, event="error")
+
+
+def checked_chunks(chunks, deadline):
+    """Yield ``chunks``, raising ``DeadlineExceeded`` once ``deadline`` has passed."""
+    for text in chunks:
+        if deadline is not None:
+            deadline.check("stream")
+        yield text
+
+
+def guard_stream(events, chunks, label, model):
+    """Yield from ``events``; an error ends the stream with ``event: error``. Returns whether they all went out."""
+    try:
+        yield from events
+    except Exception as e:
+        yield stream_error_event(e, label, model)
+        return False
+    finally:
+        close_stream(chunks)
+    return True
+
+
+def chat_messages(user_prompt, history=()):
+    return [
+        {"role": "system", "content": STUDY_SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def chat_chunks(messages):
+    """Return (text_chunks, model, error): a Groq token stream on the routed model, else a Gemini one."""
+    model = model_router.route("chat", sum(count_tokens(m["content"]) for m in messages[1:]))
+    chunks, error = groq_chat_stream(messages, temperature=0.7, max_tokens=CHAT_MAX_TOKENS, model=model)
+    if chunks is not None:
+        return chunks, model, None
+    logger.error(f"Groq stream failed: {error}")
+    gemini = get_gemini_model()
+    if not gemini:
+        return None, None, error or "No AI provider configured. Please check environment variables."
+    return gemini_stream(gemini, gemini_prompt(messages)), GEMINI_MODEL, None
+
+
+def chat_stream_done(session, user_message, reply, model, started, first_token):
+    """The ``event: done`` of a chat stream; records the turn for session chats."""
+    total = time.perf_counter() - started
+    logger.info(f"AI Chat stream: completed in {total * 1000:.0f}ms ({model})")
+    done = {
+        "model": model,
+        "ttft_ms": round((first_token or total) * 1000),
+        "total_ms": round(total * 1000),
+    }
+    if session is not None:
+        chat_sessions.add_turn(session, user_message, reply)
+        done["sessionId"] = session["id"]
+    return format_sse(done, event="done")
+
+
+@app.route("/api/ai/chat/stream", methods=["POST"])
+def ai_chat_stream():
+    """Stream AI chat tokens as server-sent events (Groq first, Gemini fallback).
+
+    Emits ``data: {"delta": ...}`` per chunk, then ``event: done`` with the model
+    and timings (and the ``sessionId`` for session chats), or ``event: error`` if
+    the upstream fails mid-stream. A session only records turns that completed.
+    """
+    data = request.get_json(silent=True)
+    if not data or "message" not in data:
+        logger.warning("AI Chat stream: Missing 'message' in request body")
+        return jsonify({"error": "Missing 'message' in request body"}), 400
+    session, session_error = open_chat_session(data)
+    if session_error:
+        return jsonify({"error": session_error}), 404
+
+    started = time.perf_counter()
+    user_message = data["message"]
+    logger.info(f"AI Chat stream request: {user_message[:50]}...")
+    if session is not None:
+        compact_chat_session(session)
+    user_prompt, history = chat_turn(data, session)
+    chunks, model, error = chat_chunks(chat_messages(user_prompt, history))
+    if chunks is None:
+        return jsonify({"error": error}), 500
+
+    deadline = deadlines.current()
+
+    def generate():
+        reply = []
+        first_token = []
+
+        def deltas():
+            for text in checked_chunks(chunks, deadline):
+                if not first_token:
+                    first_token.append(time.perf_counter() - started)
+                    logger.info(f"AI Chat stream: first token after {first_token[0] * 1000:.0f}ms ({model})")
+                reply.append(text)
+                yield format_sse({"delta": text})
+
+        if (yield from guard_stream(deltas(), chunks, "AI Chat stream", model)):
+            ttft = first_token[0] if first_token else None
+            yield chat_stream_done(session, user_message, "".join(reply), model, started, ttft)
+
+    return sse_response(generate())
+
+
 # ============================================
 # Syllabus Parsing Route
 # ============================================
@@ -227,125 +977,314 @@ Rules:
 7. If not a syllabus, return: {"semester": "", "subjects": []}
 8. Return valid JSON only."""
 
+# Long syllabi are parsed as up to SYLLABUS_MAX_CHUNKS concurrent chunks of SYLLABUS_CHUNK_CHARS
+SYLLABUS_CHUNK_CHARS = int(os.getenv("SYLLABUS_CHUNK_CHARS", 6000))
+SYLLABUS_MAX_CHUNKS = int(os.getenv("SYLLABUS_MAX_CHUNKS", 8))
+
+
+@tracing.traced("syllabus_chunk")
+def _parse_syllabus_chunk(chunk):
+    """Parse one chunk. Returns (parsed, error, model, raw_text).
+
+    Output from a routed small model that fails validation is regenerated once
+    on the large model.
+    """
+    prompt = f"Parse this syllabus:\n{chunk}"
+    model = None
+    while True:
+        result, error, model = generate_text(
+            SYLLABUS_SYSTEM_PROMPT, prompt, temperature=0.2, max_tokens=3000, task="syllabus", model=model,
+        )
+        if not result:
+            return None, error or "No AI provider configured. Check Render environment variables.", model, ""
+        try:
+            parsed, truncated = parse_syllabus_output(result)
+        except JSONExtractionError as e:
+            larger = model_router.escalate(model)
+            if larger:
+                logger.warning(f"Syllabus Parsing: {model} output failed validation, retrying on {larger}")
+                model = larger
+                continue
+            return None, f"Failed to parse AI response as JSON: {str(e)}", model, result.strip()
+        return parsed, None, model, result.strip()
+
+
+def parse_syllabus_output(text):
+    """Extract and validate syllabus JSON from model output. Returns (parsed, truncated)."""
+    try:
+        with metrics.timer("stage_duration_seconds", stage="json_parse"):
+            document, truncated = extract_json(text)
+    except JSONExtractionError:
+        metrics.inc("json_parse_failures_total", kind="syllabus")
+        raise
+    if truncated:
+        metrics.inc("json_truncated_total", kind="syllabus")
+        logger.warning("Syllabus Parsing: AI response was truncated; kept the complete subjects/topics/exams")
+    return validate_syllabus(document), truncated
+
+
+def parse_syllabus_text(syllabus_text):
+    """Map-reduce syllabus parse: chunks are parsed concurrently and merged.
+
+    Returns ``(parsed, error, model, raw_text, chunk_count)``; chunks that fail
+    are skipped as long as at least one succeeds.
+    """
+    with tracing.span("prompt_build") as step:
+        # Whitespace, page numbers and running headers would otherwise eat into each chunk
+        syllabus_text = compress(syllabus_text)
+        chunks = split_sections(syllabus_text, max_chars=SYLLABUS_CHUNK_CHARS, max_chunks=SYLLABUS_MAX_CHUNKS)
+        if len(chunks) > 1:
+            # Later chunks lose the course header, so repeat it to keep subjects attributable
+            header = chunks[0][:400]
+            chunks = [chunks[0]] + [
+                f"(Continuation. The document starts with:\n{header}\n...)\n\n{chunk}" for chunk in chunks[1:]
+            ]
+            logger.info(f"Syllabus Parsing: {len(syllabus_text)} chars split into {len(chunks)} chunks")
+        step.set(chars=len(syllabus_text), chunks=len(chunks))
+
+    results = map_concurrent(_parse_syllabus_chunk, chunks, max_workers=SYLLABUS_MAX_CHUNKS)
+    parsed = [r for r in results if r[0] is not None]
+    if not parsed:
+        _, error, model, raw_text = results[0]
+        return None, error, model, raw_text, len(chunks)
+    for index, (_, error, _, _) in enumerate(results):
+        if error:
+            logger.warning(f"Syllabus Parsing: chunk {index + 1}/{len(chunks)} skipped: {error}")
+    if len(chunks) == 1:
+        merged = parsed[0][0]
+    else:
+        merged = merge_syllabi([r[0] for r in parsed])
+    return merged, None, parsed[0][2], parsed[0][3], len(chunks)
+
+
+def _upload_file_type(mimetype, filename=""):
+    if mimetype == "application/pdf" or (filename or "").lower().endswith(".pdf"):
+        return "pdf"
+    return "image"
+
+
+def read_syllabus_upload():
+    """Read a syllabus request as ``(file_type, content, raw_bytes)``.
+
+    Accepts JSON (``content`` text or base64 ``file_data``), a multipart
+    upload with a ``file`` part, or a raw ``application/pdf`` / ``image/*``
+    body. Size limits are checked before the body is read or decoded;
+    ``PDFLimitError`` means too large, ``ValueError`` a malformed request.
+    """
+    mimetype = request.mimetype or ""
+    if mimetype == "multipart/form-data":
+        # Allow for the multipart boundary and headers around the file part
+        pdf_extractor.check_size((request.content_length or 0) - 16 * 1024)
+        upload = request.files.get("file")
+        if upload is None:
+            raise ValueError("Missing 'file' part in multipart upload")
+        file_type = request.form.get("file_type") or _upload_file_type(upload.mimetype, upload.filename)
+        raw_bytes = upload.stream.read(pdf_extractor.max_bytes + 1)
+        pdf_extractor.check_size(len(raw_bytes))
+        return file_type, "", raw_bytes
+
+    if mimetype in ("application/pdf", "application/octet-stream") or mimetype.startswith("image/"):
+        pdf_extractor.check_size(request.content_length)
+        raw_bytes = request.stream.read(pdf_extractor.max_bytes + 1)
+        pdf_extractor.check_size(len(raw_bytes))
+        return request.args.get("file_type") or _upload_file_type(mimetype), "", raw_bytes
+
+    data = request.get_json(silent=True)
+    if not data:
+        raise ValueError("Missing request body")
+    file_type = data.get("file_type", "text")
+    file_data = data.get("file_data", "")
+    if not isinstance(file_data, str):
+        raise ValueError("'file_data' must be a base64 string")
+    if not isinstance(data.get("content", ""), str):
+        raise ValueError("'content' must be a string")
+    if file_type in ("pdf", "image") and file_data:
+        pdf_extractor.check_size(base64_decoded_size(file_data))
+        try:
+            with tracing.span("base64_decode", chars=len(file_data)):
+                return file_type, "", base64.b64decode(file_data)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid base64 'file_data': {str(e)}") from e
+    return file_type, data.get("content", ""), b""
+
+
+def check_syllabus_upload(file_type, content, raw_bytes):
+    """Return ``(status_code, error)`` if the upload can't be parsed, else None."""
+    if file_type == "text" and not content.strip():
+        return 400, "Missing 'content' for text mode"
+    if file_type in ("pdf", "image") and not raw_bytes:
+        return 400, f"Missing 'file_data' for {file_type} mode"
+    if file_type == "image":
+        # Header-only check, so bad images fail here rather than in a background job
+        try:
+            image_preprocessor.inspect(raw_bytes)
+        except ImageLimitError as e:
+            return 413, str(e)
+        except ImageFormatError as e:
+            return 400, str(e)
+    return None
+
 
 @app.route("/api/ai/parse-syllabus", methods=["POST"])
 def parse_syllabus():
-    """Parse a syllabus using Groq (text) or Gemini (files) with optimized prompts."""
+    """Parse a syllabus using Groq (text) or Gemini (files) with optimized prompts.
+
+    With ``?async=1`` the parse runs on the job queue: the response is
+    ``202`` with a job id to poll at ``/api/jobs/<id>`` (and an optional
+    ``callback_url`` that receives the finished job).
+    """
     try:
-        data = request.get_json(silent=True)
-        if not data:
-            logger.warning("Syllabus Parsing: Missing request body")
-            return jsonify({"error": "Missing request body"}), 400
+        try:
+            file_type, content, raw_bytes = read_syllabus_upload()
+        except PDFLimitError as e:
+            logger.warning(f"Syllabus Parsing: upload rejected: {str(e)}")
+            return jsonify({"error": str(e)}), 413
+        except ValueError as e:
+            logger.warning(f"Syllabus Parsing: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+
+        logger.info(f"Syllabus Parsing request: type={file_type}, bytes={len(raw_bytes)}")
+        invalid = check_syllabus_upload(file_type, content, raw_bytes)
+        if invalid:
+            status, error = invalid
+            return jsonify({"error": error}), status
+
+        if request.args.get("async") in ("1", "true"):
+            return submit_job("parse_syllabus", run_syllabus_job, file_type, content, raw_bytes)
+
+        status, body = run_syllabus_job(file_type, content, raw_bytes)
+        return jsonify(body), status
+
+    except DeadlineExceeded as e:
+        return deadline_error(e)
+    except Exception as e:
+        logger.exception("Syllabus Parsing: Internal server error")
+        return jsonify({
+            "error": f"Syllabus parsing failed: {str(e)}"
+        }), 500
 
-        file_type = data.get("file_type", "text")
-        content = data.get("content", "")
-        file_data = data.get("file_data", "")
 
-        logger.info(f"Syllabus Parsing request: type={file_type}")
+def submit_job(kind, fn, *args):
+    """Queue ``fn(*args)`` on the job queue and answer ``202`` with the URL to poll."""
+    data = request.get_json(silent=True) if request.is_json else None
+    callback_url = request.args.get("callback_url") or (data or {}).get("callback_url")
+    try:
+        job = job_queue.submit(kind, fn, *args, callback_url=callback_url)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except JobQueueFull as e:
+        logger.warning(f"Jobs: rejected {kind} job, queue full")
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 503, {"Retry-After": str(e.retry_after)}
+    status_url = f"/api/jobs/{job['id']}"
+    logger.info(f"Jobs: queued {kind} job {job['id']}")
+    return jsonify({"job_id": job["id"], "status": job["status"], "status_url": status_url}), 202, {
+        "Location": status_url,
+    }
 
-        if file_type == "text" and not content.strip():
-            return jsonify({"error": "Missing 'content' for text mode"}), 400
 
-        if file_type in ("pdf", "image") and not file_data:
-            return jsonify({"error": f"Missing 'file_data' for {file_type} mode"}), 400
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Status of a background job, with its result once ``done`` (or ``error`` once ``failed``)."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job)
+
+
+def run_syllabus_job(file_type, content, raw_bytes):
+    """Extract and parse one validated syllabus upload. Returns ``(status_code, body)``."""
+    # Identical syllabi (same text or same uploaded file) share one parse
+    if file_type == "text":
+        cache_source = content
+    else:
+        cache_source = f"{file_type}:{hashlib.sha256(raw_bytes).hexdigest()}"
+    model_name = GROQ_MODEL if file_type in ("text", "pdf") else GEMINI_MODEL
+    cache_key = response_cache.key(SYLLABUS_SYSTEM_PROMPT, cache_source, model_name, 0.2, 3000)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Syllabus Parsing: served from cache")
+        return 200, {**cached, "cached": True}
+
+    if file_type in ("text", "pdf"):
+        status, body = parse_syllabus_document(file_type, content, raw_bytes)
+    else:
+        status, body = parse_syllabus_image(raw_bytes)
+    if status != 200:
+        return status, body
+    response_cache.set(cache_key, body)
+    return 200, {**body, "cached": False}
+
+
+def extract_syllabus_text(file_type, content, raw_bytes):
+    """Return ``(text, None)`` for a text or PDF upload, or ``(None, (status_code, body))`` if it can't be read."""
+    if file_type == "text":
+        return content, None
+    # Extract only as many pages as the chunk budget needs
+    try:
+        with metrics.timer("stage_duration_seconds", stage="pdf_extract"):
+            text, _, _ = pdf_extractor.extract(raw_bytes, char_budget=SYLLABUS_CHUNK_CHARS * SYLLABUS_MAX_CHUNKS)
+    except PDFLimitError as limit_err:
+        logger.warning(f"Syllabus Parsing: PDF rejected: {str(limit_err)}")
+        return None, (413, {"error": str(limit_err)})
+    except PDFExtractionError as pdf_err:
+        logger.error(f"Syllabus Parsing: PDF extraction failed: {str(pdf_err)}")
+        return None, (400, {"error": f"Failed to read PDF: {str(pdf_err)}"})
+    if not text.strip():
+        return None, (400, {"error": "Could not extract text from this PDF. Try pasting the text manually."})
+    return text, None
+
+
+def parse_syllabus_document(file_type, content, raw_bytes):
+    """Parse a text or PDF syllabus on Groq. Returns ``(status_code, body)``."""
+    syllabus_text, failure = extract_syllabus_text(file_type, content, raw_bytes)
+    if failure:
+        return failure
+    parsed, ai_error, model_name, response_text, chunk_count = parse_syllabus_text(syllabus_text)
+    if parsed is None:
+        logger.error(f"Syllabus Parsing: all chunks failed: {ai_error}")
+        body = {"error": ai_error}
+        if response_text:
+            body["raw_response"] = response_text[:1000]
+        return 500, body
+    return 200, {"data": parsed, "model": model_name, "chunks": chunk_count}
 
-        response_text = ""
 
-        # For text input, prefer Groq with optimized parameters
-        if file_type == "text":
-            # Truncate large content more aggressively to reduce processing time
-            truncated_content = content[:6000] if len(content) > 6000 else content
-            
-            messages = [
-                {"role": "system", "content": SYLLABUS_SYSTEM_PROMPT},
-                {"role": "user", "content": f"Parse this syllabus:\n{truncated_content}"},
-            ]
-            # Reduced temperature and max_tokens for faster, more focused responses
-            result, groq_err = groq_chat(messages, temperature=0.2, max_tokens=3000)
-            if result:
-                response_text = result.strip()
-            else:
-                logger.warning(f"Syllabus Parsing: Groq failed ({groq_err}), trying Gemini fallback")
-                # Fallback to Gemini for text
-                gemini = get_gemini_model()
-                if not gemini:
-                    return jsonify({"error": "No AI provider configured. Check Render environment variables."}), 500
-                prompt = SYLLABUS_SYSTEM_PROMPT + "\n\nSyllabus:\n" + truncated_content
-                response = gemini.generate_content(prompt)
-                response_text = response.text.strip()
-        else:
-            raw_bytes = base64.b64decode(file_data)
-
-            if file_type == "pdf":
-                # Extract text from PDF using pypdf, then send to Groq
-                import io
-                try:
-                    from pypdf import PdfReader
-                    reader = PdfReader(io.BytesIO(raw_bytes))
-                    # Only extract first 10 pages to speed up processing
-                    pages_to_read = min(10, len(reader.pages))
-                    pdf_text = "\n".join(
-                        reader.pages[i].extract_text() or "" 
-                        for i in range(pages_to_read)
-                    )
-                except Exception as pdf_err:
-                    logger.error(f"Syllabus Parsing: PDF extraction failed: {str(pdf_err)}")
-                    return jsonify({"error": f"Failed to read PDF: {str(pdf_err)}"}), 400
-
-                if not pdf_text.strip():
-                    return jsonify({"error": "Could not extract text from this PDF. Try pasting the text manually."}), 400
-
-                # Truncate PDF text more aggressively
-                truncated_pdf = pdf_text[:6000] if len(pdf_text) > 6000 else pdf_text
-                
-                messages = [
-                    {"role": "system", "content": SYLLABUS_SYSTEM_PROMPT},
-                    {"role": "user", "content": f"Parse this syllabus:\n{truncated_pdf}"},
-                ]
-                result, groq_err = groq_chat(messages, temperature=0.2, max_tokens=3000)
-                if result:
-                    response_text = result.strip()
-                else:
-                    logger.error(f"Syllabus Parsing: Groq failed for PDF text: {groq_err}")
-                    return jsonify({"error": groq_err or "Failed to parse PDF text"}), 500
-            else:
-                # For images, try Gemini (multimodal) as last resort
-                gemini = get_gemini_model()
-                if not gemini:
-                    return jsonify({"error": "Image parsing requires Gemini API. Try uploading a PDF or pasting text instead."}), 400
-                
-                try:
-                    response = gemini.generate_content([
-                        SYLLABUS_SYSTEM_PROMPT + "\n\nParse this syllabus image:",
-                        {"mime_type": "image/png", "data": raw_bytes},
-                    ])
-                    response_text = response.text.strip()
-                except Exception as gem_err:
-                    logger.error(f"Syllabus Parsing: Gemini image parsing failed: {str(gem_err)}")
-                    return jsonify({"error": f"Image parsing failed: {str(gem_err)}"}), 500
-
-        # Clean markdown fences
-        response_text = re.sub(r"^```(?:json)?\s*", "", response_text)
-        response_text = re.sub(r"\s*```$", "", response_text)
-
-        parsed = json.loads(response_text)
+def parse_syllabus_image(raw_bytes):
+    """Parse a syllabus image with Gemini (multimodal). Returns ``(status_code, body)``."""
+    gemini = get_gemini_model()
+    if not gemini:
+        return 400, {"error": "Image parsing requires Gemini API. Try uploading a PDF or pasting text instead."}
 
-        return jsonify({
-            "data": parsed,
-            "model": GROQ_MODEL if file_type in ("text", "pdf") else "gemini-2.0-flash",
-        })
+    try:
+        with metrics.timer("stage_duration_seconds", stage="image_prep"):
+            image_bytes, mime_type = image_preprocessor.prepare(raw_bytes)
+    except ImageLimitError as e:
+        return 413, {"error": str(e)}
+    except ImageFormatError as e:
+        return 400, {"error": str(e)}
+
+    options = gemini_options()
+    try:
+        with metrics.timer("stage_duration_seconds", stage="gemini"):
+            response = gemini.generate_content([
+                SYLLABUS_SYSTEM_PROMPT + "\n\nParse this syllabus image:",
+                {"mime_type": mime_type, "data": image_bytes},
+            ], **options)
+        response_text = response.text.strip()
+    except Exception as gem_err:
+        deadlines.check("gemini")
+        logger.error(f"Syllabus Parsing: Gemini image parsing failed: {str(gem_err)}")
+        return 500, {"error": f"Image parsing failed: {str(gem_err)}"}
 
-    except json.JSONDecodeError as e:
+    try:
+        parsed, _ = parse_syllabus_output(response_text)
+    except JSONExtractionError as e:
         logger.error(f"Syllabus Parsing: JSON decode error: {str(e)}")
-        return jsonify({
+        return 500, {
             "error": f"Failed to parse AI response as JSON: {str(e)}",
             "raw_response": response_text[:1000] if response_text else ""
-        }), 500
-    except Exception as e:
-        logger.exception("Syllabus Parsing: Internal server error")
-        return jsonify({
-            "error": f"Syllabus parsing failed: {str(e)}"
-        }), 500
+        }
+    return 200, {"data": parsed, "model": GEMINI_MODEL, "chunks": 1}
 
 
 # ============================================
@@ -372,6 +1311,216 @@ Rules:
 5. Test understanding, not memorization"""
 
 
+@tracing.traced("prompt_build")
+def build_quiz_prompt(data):
+    """Return (user_prompt, error) for a quiz or flashcard request body."""
+    content = data.get("content", "")
+    subject = data.get("subject", "")
+    topic = data.get("topic", "")
+    gen_type = data.get("type", "quiz")  # "quiz" or "flashcard"
+    count = data.get("count", data.get("num_questions", 10))
+    difficulty = data.get("difficulty", "medium")
+    question_types = data.get("question_types", ["mcq"])
+
+    if gen_type == "flashcard":
+        if subject and topic:
+            return (
+                f"Generate exactly {count} flashcard-style question and answer pairs about "
+                f"the topic '{topic}' within the subject '{subject}'.\n"
+                f"Each item MUST have a 'question' field and an 'answer' field.\n"
+                f"Questions should test understanding, not trivial facts.\n"
+                f"Return JSON: {{\"questions\": [{{\"question\": \"...\", \"answer\": \"...\"}}]}}\n"
+                "Return the JSON now."
+            ), None
+        if subject:
+            return (
+                f"Generate exactly {count} flashcard-style question and answer pairs about "
+                f"the subject '{subject}'.\n"
+                f"Each item MUST have a 'question' field and an 'answer' field.\n"
+                f"Cover the most important concepts a student should know.\n"
+                f"Return JSON: {{\"questions\": [{{\"question\": \"...\", \"answer\": \"...\"}}]}}\n"
+                "Return the JSON now."
+            ), None
+        return None, "Flashcard generation requires at least a subject"
+
+    # Original quiz generation
+    if not content.strip() and not subject:
+        return None, "Missing 'content' or 'subject' in request body"
+
+    types_str = ", ".join(question_types)
+    if content.strip():
+        frame = f"Generate {count} {difficulty} questions. Types: {types_str}\n\nContent:\n"
+        return frame + prompt_budget.fit(content, QUIZ_SYSTEM_PROMPT, frame, quiz_max_tokens(data)), None
+    about = f"{subject} - {topic}" if topic else subject
+    return f"Generate {count} {difficulty} questions about '{about}'. Types: {types_str}", None
+
+
+def quiz_max_tokens(data):
+    """Output budget for a quiz request, scaled to its question count and types."""
+    return prompt_budget.output_tokens(quiz_output_tokens(data))
+
+
+def quiz_task(data):
+    """Routing task for a quiz request body."""
+    return "flashcard" if data.get("type") == "flashcard" else "quiz"
+
+
+def quiz_model(data, user_prompt):
+    """The Groq model a quiz request is routed to."""
+    return model_router.route(quiz_task(data), count_tokens(user_prompt), requested_count(data))
+
+
+def quiz_cache_key(data, user_prompt, model):
+    """Cache key of a quiz answered by ``model``, so small- and large-model quizzes are cached apart."""
+    return response_cache.key(QUIZ_SYSTEM_PROMPT, user_prompt, model, 0.4, quiz_max_tokens(data))
+
+
+def banked_quiz(data, client=None):
+    """Response body for a quiz served from the question bank, or None on a miss."""
+    banked = question_bank.take(data, client)
+    if banked is None:
+        return None
+    questions, model = banked
+    logger.info(f"Quiz Generation: served {len(questions)} questions from the question bank")
+    return {"questions": questions, "model": model, "partial": False, "cached": False, "bank": True}
+
+
+def cached_quiz(data, cache_key, client=None):
+    """Cached response body for a quiz, or None when there is none or ``client`` has exhausted the bank."""
+    if question_bank.exhausted(data, client):
+        logger.info("Quiz Generation: client has seen the banked questions, generating a fresh quiz")
+        return None
+    return response_cache.get(cache_key)
+
+
+def run_quiz_job(data, client=None):
+    """Generate one quiz/flashcard set for ``client`` (an admission client id). Returns ``(status_code, body)``."""
+    user_prompt, prompt_error = build_quiz_prompt(data)
+    if prompt_error:
+        return 400, {"error": prompt_error}
+
+    banked = banked_quiz(data, client)
+    if banked is not None:
+        return 200, banked
+
+    model = quiz_model(data, user_prompt)
+    cache_key = quiz_cache_key(data, user_prompt, model)
+    cached = cached_quiz(data, cache_key, client)
+    if cached is not None:
+        logger.info("Quiz Generation: served from cache")
+        return 200, {**cached, "cached": True}
+
+    started = time.perf_counter()
+    while True:
+        # Groq (with key rotation) then Gemini - reduced parameters for faster response
+        result, ai_error, model = generate_text(
+            QUIZ_SYSTEM_PROMPT, user_prompt, temperature=0.4, max_tokens=quiz_max_tokens(data),
+            task=quiz_task(data), count=requested_count(data), model=model,
+        )
+        if not result:
+            logger.error(f"Quiz Generation: all providers failed: {ai_error}")
+            return 500, {"error": ai_error or "No AI provider configured. Check Render environment variables."}
+
+        questions, _, parse_error = parse_quiz_output(result, data)
+        larger = model_router.escalate(model) if parse_error else None
+        if not larger:
+            break
+        logger.warning(f"Quiz Generation: {model} output failed validation, retrying on {larger}")
+        model = larger
+    if parse_error:
+        return 500, {"error": parse_error, "raw_response": result.strip()[:1000]}
+    questions = top_up_quiz(data, user_prompt, result, questions, started)
+    return store_quiz(data, cache_key, questions, model, client)
+
+
+def parse_quiz_output(text, data):
+    """Return (questions, partial, error) from raw model output for a quiz request."""
+    try:
+        with metrics.timer("stage_duration_seconds", stage="json_parse"):
+            document, truncated = extract_json(text)
+            questions, dropped = validate_quiz(document, flashcard=data.get("type") == "flashcard")
+    except JSONExtractionError as e:
+        metrics.inc("json_parse_failures_total", kind="quiz")
+        logger.error(f"Quiz Generation: JSON decode error: {str(e)}")
+        return None, False, f"Failed to parse AI response as JSON: {str(e)}"
+    if truncated:
+        metrics.inc("json_truncated_total", kind="quiz")
+    if truncated or dropped:
+        logger.warning(f"Quiz Generation: kept {len(questions)} questions (truncated={truncated}, dropped={dropped})")
+    if not questions:
+        return None, truncated, "AI response contained no valid questions"
+    return questions, truncated, None
+
+
+def top_up_quiz(data, user_prompt, first_text, questions, started):
+    """Fit ``questions`` to the requested count/types, asking only for the missing ones.
+
+    Follow-ups run while the request is inside the top-up latency budget; one
+    cut short by the request deadline leaves the questions gathered so far.
+    """
+    questions = quiz_topup.fit(questions, data)
+    first_count = len(questions)
+    rounds = 0
+    while quiz_topup.should_top_up(questions, data, time.perf_counter() - started, rounds):
+        missing = quiz_topup.missing(questions, data)
+        topup_prompt = quiz_topup.prompt(user_prompt, questions, missing)
+        try:
+            with metrics.timer("stage_duration_seconds", stage="quiz_topup"):
+                text, error, _ = generate_text(
+                    QUIZ_SYSTEM_PROMPT, topup_prompt, temperature=0.4,
+                    max_tokens=quiz_topup.max_tokens(first_text, questions, missing),
+                    task=quiz_task(data), count=missing,
+                )
+        except DeadlineExceeded as e:
+            logger.warning(f"Quiz top-up: {e}; returning {len(questions)} questions")
+            break
+        rounds += 1
+        extra = parse_quiz_output(text, data)[0] if text else None
+        before = len(questions)
+        questions = quiz_topup.merge(questions, extra, data)
+        quiz_topup.record(
+            data, QUIZ_SYSTEM_PROMPT, user_prompt, first_text, first_count, topup_prompt, text or "",
+            before, len(questions),
+        )
+        logger.info(f"Quiz top-up: asked for {missing}, got {len(questions) - before} ({error or 'ok'})")
+    quiz_topup.finish(questions, data)
+    return questions
+
+
+def store_quiz(data, cache_key, questions, model, client=None):
+    """Build the quiz payload; only quizzes that meet the requested count are cached.
+
+    Every generated quiz feeds the question bank.
+    """
+    question_bank.add(data, questions, model, client)
+    partial = quiz_topup.missing(questions, data) > 0
+    payload = {"questions": questions, "model": model, "partial": partial}
+    if not partial:
+        response_cache.set(cache_key, payload)
+    return 200, {**payload, "cached": False}
+
+
+def refill_question_bank(data, existing):
+    """Generate questions for one bank topic through Groq, avoiding ``existing``. Returns (questions, model)."""
+    user_prompt, _ = build_quiz_prompt(data)
+    if existing:
+        user_prompt = quiz_topup.prompt(user_prompt, existing, requested_count(data))
+    messages = [
+        {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+    text, error = groq_chat(messages, temperature=0.7, max_tokens=quiz_max_tokens(data))
+    if not text:
+        logger.warning(f"Question bank: refill generation failed: {error}")
+        return [], None
+    questions = parse_quiz_output(text, data)[0] or []
+    return quiz_topup.fit(questions, data), GROQ_MODEL
+
+
+# Refills only run while no AI request holds an upstream slot in this worker
+question_bank.set_refill(refill_question_bank, is_idle=lambda: admission.stats()["in_use"] == 0)
+
+
 @app.route("/api/ai/generate-quiz", methods=["POST"])
 def generate_quiz():
     """Generate a quiz or flashcards from study content or a subject/topic."""
@@ -381,88 +1530,16 @@ def generate_quiz():
             logger.warning("Quiz Generation: Missing request body")
             return jsonify({"error": "Missing request body"}), 400
 
-        content = data.get("content", "")
-        subject = data.get("subject", "")
-        topic = data.get("topic", "")
-        gen_type = data.get("type", "quiz")  # "quiz" or "flashcard"
-        count = data.get("count", data.get("num_questions", 10))
-        difficulty = data.get("difficulty", "medium")
-        question_types = data.get("question_types", ["mcq"])
-
-        logger.info(f"Quiz Generation request: type={gen_type}, subject={subject}, topic={topic}")
-
-        # Build the user prompt based on what was provided
-        if gen_type == "flashcard":
-            if subject and topic:
-                user_prompt = (
-                    f"Generate exactly {count} flashcard-style question and answer pairs about "
-                    f"the topic '{topic}' within the subject '{subject}'.\n"
-                    f"Each item MUST have a 'question' field and an 'answer' field.\n"
-                    f"Questions should test understanding, not trivial facts.\n"
-                    f"Return JSON: {{\"questions\": [{{\"question\": \"...\", \"answer\": \"...\"}}]}}\n"
-                    "Return the JSON now."
-                )
-            elif subject:
-                user_prompt = (
-                    f"Generate exactly {count} flashcard-style question and answer pairs about "
-                    f"the subject '{subject}'.\n"
-                    f"Each item MUST have a 'question' field and an 'answer' field.\n"
-                    f"Cover the most important concepts a student should know.\n"
-                    f"Return JSON: {{\"questions\": [{{\"question\": \"...\", \"answer\": \"...\"}}]}}\n"
-                    "Return the JSON now."
-                )
-            else:
-                return jsonify({"error": "Flashcard generation requires at least a subject"}), 400
-        else:
-            # Original quiz generation
-            if not content.strip() and not subject:
-                return jsonify({"error": "Missing 'content' or 'subject' in request body"}), 400
-
-            types_str = ", ".join(question_types)
-            if content.strip():
-                # Truncate content to reduce processing time
-                truncated_content = content[:4000] if len(content) > 4000 else content
-                user_prompt = f"Generate {count} {difficulty} questions. Types: {types_str}\n\nContent:\n{truncated_content}"
-            else:
-                user_prompt = f"Generate {count} {difficulty} questions about '{subject}" + (f" - {topic}" if topic else "") + f"'. Types: {types_str}"
-
-        response_text = ""
-
-        # Try Groq (with key rotation) - reduced parameters for faster response
-        messages = [
-            {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ]
-        result, groq_err = groq_chat(messages, temperature=0.4, max_tokens=3000)
-        if result:
-            response_text = result.strip()
-        else:
-            logger.warning(f"Quiz Generation: Groq failed ({groq_err}), trying Gemini fallback")
-            # Fallback to Gemini
-            gemini = get_gemini_model()
-            if not gemini:
-                return jsonify({"error": groq_err or "No AI provider configured. Check Render environment variables."}), 500
-            prompt = QUIZ_SYSTEM_PROMPT + "\n\n" + user_prompt
-            response = gemini.generate_content(prompt)
-            response_text = response.text.strip()
-
-        # Clean markdown fences
-        response_text = re.sub(r"^```(?:json)?\s*", "", response_text)
-        response_text = re.sub(r"\s*```$", "", response_text)
+        logger.info(
+            f"Quiz Generation request: type={data.get('type', 'quiz')}, "
+            f"subject={data.get('subject', '')}, topic={data.get('topic', '')}"
+        )
 
-        parsed = json.loads(response_text)
+        status, body = run_quiz_job(data, admission.client_id(request.headers, request.remote_addr))
+        return jsonify(body), status
 
-        return jsonify({
-            "questions": parsed.get("questions", []),
-            "model": GROQ_MODEL,
-        })
-
-    except json.JSONDecodeError as e:
-        logger.error(f"Quiz Generation: JSON decode error: {str(e)}")
-        return jsonify({
-            "error": f"Failed to parse AI response as JSON: {str(e)}",
-            "raw_response": response_text[:1000] if response_text else ""
-        }), 500
+    except DeadlineExceeded as e:
+        return deadline_error(e)
     except Exception as e:
         logger.exception("Quiz Generation: Internal server error")
         return jsonify({
@@ -470,6 +1547,211 @@ def generate_quiz():
         }), 500
 
 
+class QuizStream:
+    """Turns streamed model text into one ``question`` SSE event per completed question."""
+
+    def __init__(self, data, cache_key, model):
+        self.data = data
+        self.flashcard = data.get("type") == "flashcard"
+        self.cache_key = cache_key
+        self.model = model
+        self.scanner = JSONScanner(stream_key="questions")
+        self.questions = []
+        self.started = time.perf_counter()
+        self.first_question = None
+
+    def feed(self, text):
+        questions = [validate_question(item, self.flashcard) for item in self.scanner.feed(text)]
+        return self.extend(quiz_topup.fit(self.questions + [q for q in questions if q], self.data))
+
+    def extend(self, questions):
+        """Emit events for questions beyond those already sent (``questions`` keeps the sent prefix)."""
+        events = []
+        for question in questions[len(self.questions):]:
+            if self.first_question is None:
+                self.first_question = time.perf_counter() - self.started
+            self.questions.append(question)
+            events.append(format_sse({"index": len(self.questions) - 1, "question": question}, event="question"))
+        return events
+
+    def finish(self):
+        total = time.perf_counter() - self.started
+        if not self.questions:
+            return format_sse({"error": "AI response contained no valid questions"}, event="error")
+        _, payload = store_quiz(self.data, self.cache_key, self.questions, self.model)
+        partial = payload["partial"]
+        logger.info(
+            f"Quiz stream: {len(self.questions)} questions, first after "
+            f"{(self.first_question or total) * 1000:.0f}ms, total {total * 1000:.0f}ms ({self.model})"
+        )
+        return format_sse({
+            "model": self.model,
+            "count": len(self.questions),
+            "partial": partial,
+            "cached": False,
+            "first_question_ms": round((self.first_question or total) * 1000),
+            "total_ms": round(total * 1000),
+        }, event="done")
+
+
+def cached_quiz_events(cached):
+    """SSE events replaying a cached quiz."""
+    events = [
+        format_sse({"index": i, "question": question}, event="question")
+        for i, question in enumerate(cached.get("questions", []))
+    ]
+    events.append(format_sse({
+        "model": cached.get("model"), "count": len(cached.get("questions", [])),
+        "partial": False, "cached": True,
+    }, event="done"))
+    return events
+
+
+def quiz_chunks(user_prompt, max_tokens, model=None):
+    """Return (text_chunks, model, error): a Groq token stream, else a Gemini one."""
+    messages = [
+        {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+    model = model or GROQ_MODEL
+    chunks, error = groq_chat_stream(messages, temperature=0.4, max_tokens=max_tokens, model=model)
+    if chunks is not None:
+        return chunks, model, None
+    logger.error(f"Groq stream failed: {error}")
+    gemini = get_gemini_model()
+    if not gemini:
+        return None, None, error or "No AI provider configured. Check Render environment variables."
+    return gemini_stream(gemini, QUIZ_SYSTEM_PROMPT + "\n\n" + user_prompt), GEMINI_MODEL, None
+
+
+@app.route("/api/ai/generate-quiz/stream", methods=["POST"])
+def generate_quiz_stream():
+    """Stream quiz questions as server-sent events, each one as soon as it is complete."""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Missing request body"}), 400
+    user_prompt, prompt_error = build_quiz_prompt(data)
+    if prompt_error:
+        return jsonify({"error": prompt_error}), 400
+
+    routed = quiz_model(data, user_prompt)
+    cache_key = quiz_cache_key(data, user_prompt, routed)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return sse_response(cached_quiz_events(cached))
+
+    chunks, model, error = quiz_chunks(user_prompt, quiz_max_tokens(data), model=routed)
+    if chunks is None:
+        return jsonify({"error": error}), 500
+
+    deadline = deadlines.current()
+
+    def generate():
+        quiz = QuizStream(data, cache_key, model)
+
+        def events():
+            for text in checked_chunks(chunks, deadline):
+                yield from quiz.feed(text)
+            if quiz.questions:
+                yield from quiz.extend(top_up_quiz(data, user_prompt, quiz.scanner.text, quiz.questions, quiz.started))
+
+        if (yield from guard_stream(events(), chunks, "Quiz stream", model)):
+            yield quiz.finish()
+
+    return sse_response(generate())
+
+
+# Batch jobs run at most QUIZ_BATCH_CONCURRENCY at once (and never more than 2 per Groq key)
+QUIZ_BATCH_MAX_JOBS = int(os.getenv("QUIZ_BATCH_MAX_JOBS", 50))
+QUIZ_BATCH_CONCURRENCY = int(os.getenv("QUIZ_BATCH_CONCURRENCY", 8))
+
+
+def read_quiz_batch(data):
+    """Return (jobs, error) for a batch request body."""
+    jobs = (data or {}).get("jobs")
+    if not isinstance(jobs, list) or not jobs:
+        return None, "Missing 'jobs' list in request body"
+    if len(jobs) > QUIZ_BATCH_MAX_JOBS:
+        return None, f"Too many jobs ({len(jobs)}); the limit is {QUIZ_BATCH_MAX_JOBS}"
+    return jobs, None
+
+
+def quiz_batch_concurrency(job_count):
+    return max(1, min(QUIZ_BATCH_CONCURRENCY, 2 * max(len(key_scheduler), 1), job_count))
+
+
+def quiz_batch_item(index, job, status, body):
+    """One NDJSON result line; ``job`` echoes subject/topic so clients can match results."""
+    item = {"index": index, "status": status, "subject": job.get("subject", ""), "topic": job.get("topic", "")}
+    if status == 200:
+        item["result"] = body
+    else:
+        item["error"] = body.get("error", "Quiz generation failed")
+    return json.dumps(item) + "\n"
+
+
+def _safe_quiz_job(job, client=None):
+    if not isinstance(job, dict):
+        return 400, {"error": "Each job must be an object"}
+    try:
+        return run_quiz_job(job, client)
+    except DeadlineExceeded as e:
+        return 504, deadline_body(e)
+    except Exception as e:
+        logger.exception("Quiz Batch: job failed")
+        return 500, {"error": f"Quiz generation failed: {str(e)}"}
+
+
+@app.route("/api/ai/generate-quiz/batch", methods=["POST"])
+def generate_quiz_batch():
+    """Run many quiz jobs concurrently, streaming NDJSON results as each completes."""
+    jobs, error = read_quiz_batch(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+
+    concurrency = quiz_batch_concurrency(len(jobs))
+    client = admission.client_id(request.headers, request.remote_addr)
+    logger.info(f"Quiz Batch request: {len(jobs)} jobs, concurrency={concurrency}")
+    deadline = deadlines.current()
+
+    def item(index, status, body):
+        return quiz_batch_item(index, jobs[index] if isinstance(jobs[index], dict) else {}, status, body)
+
+    def generate():
+        started = time.perf_counter()
+        failed = 0
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="quiz-batch")
+        try:
+            # Jobs run under the batch's deadline; whatever is unfinished when it passes is reported as 504
+            futures = {pool.submit(deadlines.bind(_safe_quiz_job), job, client): i for i, job in enumerate(jobs)}
+            pending = set(futures)
+            try:
+                for future in as_completed(futures, timeout=deadline.remaining() if deadline else None):
+                    pending.discard(future)
+                    status, body = future.result()
+                    failed += status != 200
+                    yield item(futures[future], status, body)
+            except FutureTimeout:
+                exceeded = DeadlineExceeded(deadline.seconds, "batch")
+                logger.warning(f"Quiz Batch: {exceeded}; {len(pending)} jobs unfinished")
+                metrics.inc("deadlines_exceeded_total", stage="batch")
+                for index in sorted(futures[future] for future in pending):
+                    failed += 1
+                    yield item(index, 504, deadline_body(exceeded))
+        finally:
+            # A disconnected client drops the jobs that haven't started yet
+            pool.shutdown(wait=False, cancel_futures=True)
+        total_ms = round((time.perf_counter() - started) * 1000)
+        logger.info(f"Quiz Batch: {len(jobs)} jobs, {failed} failed, {total_ms}ms")
+        yield json.dumps({"done": True, "total": len(jobs), "failed": failed, "total_ms": total_ms}) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ============================================
 # Run Server
 # ============================================
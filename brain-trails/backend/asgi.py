@@ -0,0 +1,661 @@
+"""
+ASGI Entry Point for Brain Trails
+
+Serves the slow AI routes natively on asyncio using the AsyncGroq client and
+Gemini's async API, so one worker can keep hundreds of upstream LLM calls in
+flight instead of one per gunicorn thread. Every other route (health, syllabus
+parsing, CORS preflight, ...) is delegated to the Flask app through asgiref's
+WSGI adapter, so both entry points serve the same API.
+
+Async routes run as a task that is cancelled, together with its upstream
+calls, when the client disconnects or shortly after the request deadline
+(upstream timeouts are capped by the deadline, so this is only a backstop).
+
+Run: uvicorn asgi:app --host 0.0.0.0 --port 8080 --workers 2
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from contextvars import ContextVar
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as api
+import deadlines
+import tracing
+from admission import AdmissionRejected
+from deadlines import DeadlineExceeded
+from prompt_budget import count_tokens
+from quiz_topup import requested_count
+from singleflight import request_fingerprint
+
+logger = logging.getLogger(__name__)
+
+flask_asgi = WsgiToAsgi(api.app)
+
+# Admission client id of the request being served (Flask routes read it from ``request``)
+current_client = ContextVar("current_client", default=None)
+
+# Origin header of the request being served, answered with the same CORS headers as Flask-CORS
+current_origin = ContextVar("current_origin", default=None)
+
+# Seconds past the deadline before a route that hasn't answered is cancelled
+DEADLINE_GRACE = 1.0
+
+
+# ─── Async AI clients ──────────────────────────────────────────
+
+async def _async_groq_completion(messages, temperature, max_tokens, stream=False, model=None):
+    """Async twin of app._groq_completion sharing the same key scheduler and pool."""
+    if not len(api.key_scheduler):
+        return None, "No GROQ_API_KEY(S) configured"
+
+    last_error = None
+    tried = set()
+    while True:
+        budget = deadlines.remaining("groq")
+        state = api.key_scheduler.acquire(exclude=tried)
+        if state is None:
+            break
+        tried.add(state.index)
+        try:
+            client = api.groq_pool.get_async(state.key)
+            with tracing.span("groq_attempt", key=state.index, model=model or api.GROQ_MODEL):
+                raw = await client.chat.completions.with_raw_response.create(
+                    model=model or api.GROQ_MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=stream,
+                    timeout=api.groq_pool.timeout(budget),
+                )
+                completion = await raw.parse()
+            api.key_scheduler.record_success(state, raw.headers)
+            api.metrics.inc("groq_key_attempts_total", key=str(state.index), outcome="success")
+            return completion, None
+        except Exception as e:
+            deadlines.check("groq")
+            last_error = str(e)
+            if api.key_scheduler.record_failure(state, e):
+                api.metrics.inc("groq_key_attempts_total", key=str(state.index), outcome="rotated")
+                continue
+            api.metrics.inc("groq_key_attempts_total", key=str(state.index), outcome="error")
+            return None, f"AI generation failed: {last_error}"
+
+    if not tried:
+        wait = api.key_scheduler.next_available_in()
+        return None, f"All {len(api.key_scheduler)} API key(s) are cooling down. Retry in {wait:.0f}s"
+    return None, f"All {len(tried)} available API key(s) failed. Last error: {last_error}"
+
+
+async def async_groq_chat(messages, temperature=0.7, max_tokens=1500, model=None):
+    """Return (text, error) for a chat completion without blocking the event loop.
+
+    Identical concurrent calls on this event loop share one upstream request.
+    """
+    async def call():
+        with api.metrics.timer("stage_duration_seconds", stage="groq"):
+            completion, error = await _async_groq_completion(messages, temperature, max_tokens, model=model)
+        if completion is None:
+            return None, error
+        api.record_groq_usage(getattr(completion, "usage", None))
+        return completion.choices[0].message.content, None
+
+    key = request_fingerprint(model or api.GROQ_MODEL, messages, temperature, max_tokens)
+    (text, error), _ = await api.groq_flight.ado(key, call)
+    return text, error
+
+
+async def async_gemini_text(prompt):
+    """Return (text, error) from Gemini's async API, or (None, None) if it isn't configured."""
+    gemini = api.get_gemini_model()
+    if not gemini:
+        return None, None
+    options = api.gemini_options()
+    try:
+        with api.metrics.timer("stage_duration_seconds", stage="gemini"):
+            response = await gemini.generate_content_async(prompt, **options)
+        api.record_gemini_usage(response)
+        return response.text, None
+    except Exception as e:
+        deadlines.check("gemini")
+        logger.error(f"Gemini generation failed: {str(e)}")
+        return None, f"AI generation failed (Gemini): {str(e)}"
+
+
+async def async_generate_text(system_prompt, user_prompt, temperature=0.7, max_tokens=1500,
+                              task=None, count=None, model=None, history=()):
+    """Async twin of app.generate_text: routed Groq model, then (or hedged against) Gemini."""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        *history,
+        {"role": "user", "content": user_prompt},
+    ]
+    input_tokens = count_tokens(user_prompt) + sum(count_tokens(m["content"]) for m in history)
+    model = model or api.model_router.route(task, input_tokens, count)
+
+    async def call_groq():
+        started = time.perf_counter()
+        text, error = await async_groq_chat(messages, temperature=temperature, max_tokens=max_tokens, model=model)
+        if text:
+            api.model_router.observe(task, model, time.perf_counter() - started)
+        return text, error
+
+    def call_gemini():
+        return async_gemini_text(api.gemini_prompt(messages))
+
+    text, error, provider = await api.hedge_policy.acall(
+        ("groq", call_groq),
+        ("gemini", call_gemini if os.getenv("GEMINI_API_KEY") else None),
+    )
+    api.record_generation(text, provider)
+    return text, error, model if provider == "groq" else api.GEMINI_MODEL
+
+
+async def _async_deltas(stream):
+    async with stream:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            api.record_groq_usage(api.groq_chunk_usage(chunk))
+
+
+async def _async_gemini_deltas(gemini, prompt):
+    response = await gemini.generate_content_async(prompt, stream=True, **api.gemini_options())
+    async for chunk in response:
+        if chunk.text:
+            yield chunk.text
+
+
+# ─── ASGI plumbing ─────────────────────────────────────────────
+
+def _cors_headers():
+    """CORS headers for the current request, from the Flask app's CORS_ORIGINS."""
+    allowed = api.cors_allow_origin(current_origin.get())
+    if allowed is None:
+        return []
+    if allowed == "*":
+        return [(b"access-control-allow-origin", b"*")]
+    return [(b"access-control-allow-origin", allowed.encode("latin-1")), (b"vary", b"Origin")]
+
+
+async def _read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def _send_json(send, status, payload, headers=()):
+    trace = tracing.current()
+    if trace is not None and trace.admin:
+        # Same as the Flask hook: admin traces ride along on JSON responses
+        api.tracer.finish(trace, status=status)
+        payload = {**payload, "trace": trace.to_dict()}
+        headers = [
+            *headers,
+            (b"server-timing", trace.server_timing().encode()),
+            (b"x-trace-id", trace.id.encode()),
+        ]
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *_cors_headers(),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _disconnected(receive):
+    """Return once the client has gone away (the request body has already been read)."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _run_route(route, data, headers, send, receive):
+    """Run ``route``, cancelling it and its upstream calls if the client leaves or the deadline passes.
+
+    Returns quietly after a disconnect and raises ``DeadlineExceeded`` after a timeout.
+    """
+    deadline = deadlines.current()
+    task = asyncio.ensure_future(route(data, headers, send))
+    watcher = asyncio.ensure_future(_disconnected(receive))
+    timeout = deadline.remaining() + DEADLINE_GRACE if deadline else None
+    try:
+        done, _ = await asyncio.wait({task, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if task in done:
+        return task.result()
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    reason = "disconnect" if watcher in done else "deadline"
+    api.metrics.inc("requests_abandoned_total", reason=reason)
+    if reason == "disconnect":
+        logger.info("ASGI: client disconnected, upstream work cancelled")
+        return None
+    raise DeadlineExceeded(deadline.seconds, "request")
+
+
+async def _start_sse(send):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            *_cors_headers(),
+        ],
+    })
+
+
+async def _emit(send, event):
+    await send({"type": "http.response.body", "body": event.encode(), "more_body": True})
+
+
+# ─── Async routes ──────────────────────────────────────────────
+
+async def compact_chat_session(session):
+    """Async twin of ``app.compact_chat_session``."""
+    folded = api.chat_sessions.compaction(session)
+    if not folded:
+        return
+    summary, _, _ = await async_generate_text(
+        api.CHAT_SUMMARY_SYSTEM_PROMPT, api.chat_summary_prompt(session["summary"], folded),
+        0.2, api.CHAT_SUMMARY_MAX_TOKENS, task="summary",
+    )
+    api.chat_sessions.compact(session, folded, summary)
+
+
+async def ai_chat(data, headers, send):
+    """Async /api/ai/chat: same contract as the Flask route."""
+    if not data or "message" not in data:
+        return await _send_json(send, 400, {"error": "Missing 'message' in request body"})
+    if "text/event-stream" in headers.get("accept", ""):
+        return await ai_chat_stream(data, headers, send)
+    session, session_error = api.open_chat_session(data)
+    if session_error:
+        return await _send_json(send, 404, {"error": session_error})
+
+    if session is not None:
+        await compact_chat_session(session)
+    user_prompt, history = api.chat_turn(data, session)
+    text, error, model = await async_generate_text(
+        api.STUDY_SYSTEM_PROMPT, user_prompt, 0.7, api.CHAT_MAX_TOKENS, task="chat", history=history,
+    )
+    if text:
+        body = {"response": text, "model": model}
+        if session is not None:
+            api.chat_sessions.add_turn(session, data["message"], text)
+            body["sessionId"] = session["id"]
+        return await _send_json(send, 200, body)
+    logger.error(f"No AI provider available or all failed: {error}")
+    return await _send_json(send, 500, {"error": error or "No AI provider configured."})
+
+
+async def _chat_chunks(messages):
+    """Async twin of ``app.chat_chunks``: (text_chunks, model, error)."""
+    model = api.model_router.route("chat", sum(count_tokens(m["content"]) for m in messages[1:]))
+    stream, error = await _async_groq_completion(messages, 0.7, api.CHAT_MAX_TOKENS, stream=True, model=model)
+    if stream is not None:
+        return _async_deltas(stream), model, None
+    logger.error(f"Groq stream failed: {error}")
+    gemini = api.get_gemini_model()
+    if not gemini:
+        return None, None, error or "No AI provider configured."
+    return _async_gemini_deltas(gemini, api.gemini_prompt(messages)), api.GEMINI_MODEL, None
+
+
+async def ai_chat_stream(data, headers, send):
+    """Async /api/ai/chat/stream: SSE token stream, Groq first then Gemini."""
+    if not data or "message" not in data:
+        return await _send_json(send, 400, {"error": "Missing 'message' in request body"})
+    session, session_error = api.open_chat_session(data)
+    if session_error:
+        return await _send_json(send, 404, {"error": session_error})
+
+    started = time.perf_counter()
+    if session is not None:
+        await compact_chat_session(session)
+    user_prompt, history = api.chat_turn(data, session)
+    chunks, model, error = await _chat_chunks(api.chat_messages(user_prompt, history))
+    if chunks is None:
+        return await _send_json(send, 500, {"error": error})
+
+    await _start_sse(send)
+    await _stream_chat(send, chunks, model, session, data["message"], started)
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _stream_chat(send, chunks, model, session, message, started):
+    first_token = None
+    reply = []
+    try:
+        async for text in chunks:
+            deadlines.check("stream")
+            if first_token is None:
+                first_token = time.perf_counter() - started
+                logger.info(f"AI Chat stream: first token after {first_token * 1000:.0f}ms ({model})")
+            reply.append(text)
+            await _emit(send, api.format_sse({"delta": text}))
+        await _emit(send, api.chat_stream_done(session, message, "".join(reply), model, started, first_token))
+    except Exception as e:
+        await _emit(send, api.stream_error_event(e, "AI Chat stream", model))
+
+
+async def run_quiz_job(data, client=None):
+    """Async twin of ``app.run_quiz_job``: same bank, cache and contract. Returns ``(status, body)``."""
+    user_prompt, prompt_error = api.build_quiz_prompt(data)
+    if prompt_error:
+        return 400, {"error": prompt_error}
+
+    banked = api.banked_quiz(data, client)
+    if banked is not None:
+        return 200, banked
+
+    model = api.quiz_model(data, user_prompt)
+    cache_key = api.quiz_cache_key(data, user_prompt, model)
+    cached = api.cached_quiz(data, cache_key, client)
+    if cached is not None:
+        return 200, {**cached, "cached": True}
+
+    started = time.perf_counter()
+    while True:
+        text, error, model = await async_generate_text(
+            api.QUIZ_SYSTEM_PROMPT, user_prompt, 0.4, api.quiz_max_tokens(data),
+            task=api.quiz_task(data), count=requested_count(data), model=model,
+        )
+        if not text:
+            logger.error(f"Quiz Generation: all providers failed: {error}")
+            return 500, {"error": error or "No AI provider configured."}
+
+        questions, _, parse_error = api.parse_quiz_output(text, data)
+        larger = api.model_router.escalate(model) if parse_error else None
+        if not larger:
+            break
+        logger.warning(f"Quiz Generation: {model} output failed validation, retrying on {larger}")
+        model = larger
+    if parse_error:
+        return 500, {"error": parse_error, "raw_response": text.strip()[:1000]}
+    questions = await top_up_quiz(data, user_prompt, text, questions, started)
+    return api.store_quiz(data, cache_key, questions, model, client)
+
+
+async def top_up_quiz(data, user_prompt, first_text, questions, started):
+    """Async twin of ``app.top_up_quiz``."""
+    topup = api.quiz_topup
+    questions = topup.fit(questions, data)
+    first_count = len(questions)
+    rounds = 0
+    while topup.should_top_up(questions, data, time.perf_counter() - started, rounds):
+        missing = topup.missing(questions, data)
+        topup_prompt = topup.prompt(user_prompt, questions, missing)
+        try:
+            with api.metrics.timer("stage_duration_seconds", stage="quiz_topup"):
+                text, error, _ = await async_generate_text(
+                    api.QUIZ_SYSTEM_PROMPT, topup_prompt, 0.4, topup.max_tokens(first_text, questions, missing),
+                    task=api.quiz_task(data), count=missing,
+                )
+        except DeadlineExceeded as e:
+            logger.warning(f"Quiz top-up: {e}; returning {len(questions)} questions")
+            break
+        rounds += 1
+        extra = api.parse_quiz_output(text, data)[0] if text else None
+        before = len(questions)
+        questions = topup.merge(questions, extra, data)
+        topup.record(
+            data, api.QUIZ_SYSTEM_PROMPT, user_prompt, first_text, first_count, topup_prompt, text or "",
+            before, len(questions),
+        )
+        logger.info(f"Quiz top-up: asked for {missing}, got {len(questions) - before} ({error or 'ok'})")
+    topup.finish(questions, data)
+    return questions
+
+
+async def generate_quiz(data, headers, send):
+    """Async /api/ai/generate-quiz: same contract (and cache) as the Flask route."""
+    if not data:
+        return await _send_json(send, 400, {"error": "Missing request body"})
+    status, body = await run_quiz_job(data, current_client.get())
+    await _send_json(send, status, body)
+
+
+async def _quiz_chunks(user_prompt, max_tokens, model=None):
+    """Return (text_chunks, model, error): a Groq token stream, else a Gemini one."""
+    messages = [
+        {"role": "system", "content": api.QUIZ_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+    model = model or api.GROQ_MODEL
+    stream, error = await _async_groq_completion(messages, 0.4, max_tokens, stream=True, model=model)
+    if stream is not None:
+        return _async_deltas(stream), model, None
+    logger.error(f"Groq stream failed: {error}")
+    gemini = api.get_gemini_model()
+    if not gemini:
+        return None, None, error or "No AI provider configured."
+    return _async_gemini_deltas(gemini, api.QUIZ_SYSTEM_PROMPT + "\n\n" + user_prompt), api.GEMINI_MODEL, None
+
+
+async def generate_quiz_stream(data, headers, send):
+    """Async /api/ai/generate-quiz/stream: one SSE event per completed question."""
+    if not data:
+        return await _send_json(send, 400, {"error": "Missing request body"})
+    user_prompt, prompt_error = api.build_quiz_prompt(data)
+    if prompt_error:
+        return await _send_json(send, 400, {"error": prompt_error})
+
+    routed = api.quiz_model(data, user_prompt)
+    cache_key = api.quiz_cache_key(data, user_prompt, routed)
+    cached = api.response_cache.get(cache_key)
+    if cached is not None:
+        await _start_sse(send)
+        for event in api.cached_quiz_events(cached):
+            await _emit(send, event)
+        return await send({"type": "http.response.body", "body": b""})
+
+    chunks, model, error = await _quiz_chunks(user_prompt, api.quiz_max_tokens(data), model=routed)
+    if chunks is None:
+        return await _send_json(send, 500, {"error": error})
+
+    await _start_sse(send)
+    await _stream_quiz(send, api.QuizStream(data, cache_key, model), chunks, user_prompt)
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _stream_quiz(send, quiz, chunks, user_prompt):
+    model = quiz.model
+    try:
+        async for text in chunks:
+            deadlines.check("stream")
+            for event in quiz.feed(text):
+                await _emit(send, event)
+        if quiz.questions:
+            topped_up = await top_up_quiz(quiz.data, user_prompt, quiz.scanner.text, quiz.questions, quiz.started)
+            for event in quiz.extend(topped_up):
+                await _emit(send, event)
+        await _emit(send, quiz.finish())
+    except Exception as e:
+        await _emit(send, api.stream_error_event(e, "Quiz stream", model))
+
+
+async def _run_batch_job(limit, index, job):
+    """Run one batch job once ``limit`` allows; ``(index, job, status, body)``, failures included."""
+    async with limit:
+        if not isinstance(job, dict):
+            return index, {}, 400, {"error": "Each job must be an object"}
+        try:
+            return (index, job, *await run_quiz_job(job, current_client.get()))
+        except DeadlineExceeded as e:
+            return index, job, 504, api.deadline_body(e)
+        except Exception as e:
+            logger.exception("Quiz Batch: job failed")
+            return index, job, 500, {"error": f"Quiz generation failed: {str(e)}"}
+
+
+async def _report_unfinished(send, jobs, reported, deadline):
+    """Same as the Flask route: jobs the batch deadline cut off are reported as 504. Returns how many."""
+    exceeded = DeadlineExceeded(deadline.seconds, "batch")
+    logger.warning(f"Quiz Batch: {exceeded}; {len(jobs) - len(reported)} jobs unfinished")
+    api.metrics.inc("deadlines_exceeded_total", stage="batch")
+    for index, job in enumerate(jobs):
+        if index not in reported:
+            job = job if isinstance(job, dict) else {}
+            await _emit(send, api.quiz_batch_item(index, job, 504, api.deadline_body(exceeded)))
+    return len(jobs) - len(reported)
+
+
+async def generate_quiz_batch(data, headers, send):
+    """Async /api/ai/generate-quiz/batch: NDJSON lines in completion order."""
+    jobs, error = api.read_quiz_batch(data)
+    if error:
+        return await _send_json(send, 400, {"error": error})
+
+    limit = asyncio.Semaphore(api.quiz_batch_concurrency(len(jobs)))
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"application/x-ndjson"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            *_cors_headers(),
+        ],
+    })
+    started = time.perf_counter()
+    failed = 0
+    deadline = deadlines.current()
+    tasks = [asyncio.ensure_future(_run_batch_job(limit, i, job)) for i, job in enumerate(jobs)]
+    reported = set()
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=deadline.remaining() if deadline else None):
+            index, job, status, body = await next_done
+            reported.add(index)
+            failed += status != 200
+            await _emit(send, api.quiz_batch_item(index, job, status, body))
+    except asyncio.TimeoutError:
+        failed += await _report_unfinished(send, jobs, reported, deadline)
+    finally:
+        for task in tasks:
+            task.cancel()
+    total_ms = round((time.perf_counter() - started) * 1000)
+    logger.info(f"Quiz Batch: {len(jobs)} jobs, {failed} failed, {total_ms}ms")
+    summary = json.dumps({"done": True, "total": len(jobs), "failed": failed, "total_ms": total_ms}) + "\n"
+    await send({"type": "http.response.body", "body": summary.encode()})
+
+
+ASYNC_ROUTES = {
+    ("POST", "/api/ai/chat"): ai_chat,
+    ("POST", "/api/ai/chat/stream"): ai_chat_stream,
+    ("POST", "/api/ai/generate-quiz"): generate_quiz,
+    ("POST", "/api/ai/generate-quiz/batch"): generate_quiz_batch,
+    ("POST", "/api/ai/generate-quiz/stream"): generate_quiz_stream,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Imports and client construction happen before the worker accepts connections
+            api.warm_up(async_clients=True)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await api.groq_pool.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _send_deadline(send, content_type, error):
+    """Answer 504, or end a response whose headers (``content_type``) are already out."""
+    if content_type is None:
+        return await _send_json(send, 504, api.deadline_body(error))
+    # End the body, with an error event for SSE clients
+    sse = content_type == b"text/event-stream"
+    tail = api.format_sse(api.deadline_body(error), event="error").encode() if sse else b""
+    await send({"type": "http.response.body", "body": tail})
+
+
+async def app(scope, receive, send):
+    """ASGI callable: async AI routes, everything else via the Flask app."""
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+
+    route = ASYNC_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+    if route is None:
+        return await flask_asgi(scope, receive, send)
+
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+    started = time.perf_counter()
+    # Set before admission so time spent queued counts against the budget, like the Flask hooks
+    deadlines.start(api.deadline_policy.for_request(scope["path"], headers))
+    trace = api.tracer.start(scope["path"], headers)
+    response = {}
+
+    async def timed_send(message):
+        # Same measure as the Flask hook: time until the response headers go out
+        if message["type"] == "http.response.start":
+            response["content_type"] = dict(message.get("headers", [])).get(b"content-type", b"")
+            response["status"] = message["status"]
+            api.metrics.observe(
+                "http_request_duration_seconds", time.perf_counter() - started,
+                endpoint=scope["path"], method=scope["method"], status=str(message["status"]),
+            )
+        await send(message)
+
+    with tracing.span("json_body"):
+        data = await _read_json(receive)
+    plan = api.admission_plan(scope["path"], data)
+    remote_addr = (scope.get("client") or ("unknown",))[0]
+    client = api.admission.client_id(headers, remote_addr)
+    ip = api.admission.ip_id(headers, remote_addr)
+    current_client.set(client)
+    current_origin.set(headers.get("origin"))
+    try:
+        with tracing.span("admission"):
+            slot = await api.admission.aadmit(client, *plan, ip=ip) if plan else None
+    except AdmissionRejected as rejected:
+        logger.warning(f"Admission: rejected {scope['path']} ({rejected}), retry after {rejected.retry_after}s")
+        await _send_json(
+            timed_send, 429, api.rejection_body(rejected),
+            headers=[(b"retry-after", str(rejected.retry_after).encode())],
+        )
+        api.tracer.finish(trace, status=429)
+        return
+    try:
+        await _run_route(route, data, headers, timed_send, receive)
+    except DeadlineExceeded as e:
+        logger.warning(f"Deadline: {scope['path']} {e}")
+        api.metrics.inc("deadlines_exceeded_total", stage=e.stage or "unknown")
+        await _send_deadline(timed_send, response.get("content_type"), e)
+    except Exception as e:
+        logger.exception(f"ASGI {scope['path']}: Internal server error")
+        await _send_json(timed_send, 500, {"error": f"Internal server error: {str(e)}"})
+    finally:
+        if slot is not None:
+            slot.release()
+        api.tracer.finish(trace, status=response.get("status"))
@@ -0,0 +1,216 @@
+"""
+Load benchmark for the AI endpoints against local fake Groq and Gemini APIs.
+
+Starts two ``tests.fake_llm.FakeLLMServer`` instances (one answering as
+Groq, one as Gemini) with configurable latency, streaming chunk delay and
+injected 401/429/500 error rates. It then drives ``/api/ai/chat``,
+``/api/ai/generate-quiz`` and ``/api/ai/parse-syllabus`` in-process, at a
+fixed concurrency, through the real handlers, key scheduler, Groq client
+pool and Gemini fallback. For each endpoint it reports p50/p95/p99 latency,
+throughput and upstream calls per request.
+
+Admission control is off (every request comes from one client) unless
+``--admission`` is given. Prompts are distinct so the response cache and
+single-flight stay out of the way unless ``--repeat`` is given.
+
+Usage:
+    python bench.py --requests 200 --concurrency 16 --latency 0.3
+    python bench.py --endpoint chat --stream --chunk-delay 0.02
+    python bench.py --keys 3 --groq-errors 429=0.1,500=0.02 --json
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = ("chat", "quiz", "syllabus")
+
+SYLLABUS_REPLY = json.dumps({
+    "semester": "Fall 2026",
+    "subjects": [{
+        "name": "Biology 101", "code": "BIO101", "emoji": "🔬", "color": "from-emerald-500 to-teal-600",
+        "description": "Cells and genetics", "professor": "Dr. Smith", "credit_hours": 3,
+        "topics": [{"name": "Cells", "sort_order": 0}, {"name": "DNA", "sort_order": 1}],
+        "exams": [{"name": "Midterm", "exam_type": "exam", "exam_date": "2026-10-15T09:00:00Z", "weight_pct": 25}],
+    }],
+})
+
+
+def fake_reply(messages):
+    """Plausible model output for whichever prompt the app sent."""
+    text = "\n".join(message.get("content", "") for message in messages)
+    if "syllabus parser" in text:
+        return SYLLABUS_REPLY
+    if "Quiz generator" in text:
+        counts = re.findall(r"Generate (?:exactly )?(\d+)", text)
+        count = int(counts[-1]) if counts else 5
+        return json.dumps({"questions": [
+            {"type": "mcq", "question": f"Question {i + 1}?", "options": ["A", "B", "C", "D"],
+             "correct_answer": "A", "explanation": "Because."}
+            for i in range(count)
+        ]})
+    return "The mitochondria is the powerhouse of the cell. " * 4
+
+
+def request_for(endpoint, index, stream=False, repeat=False):
+    """``(path, body)`` for the ``index``-th request to ``endpoint``."""
+    n = 0 if repeat else index
+    if endpoint == "chat":
+        path = "/api/ai/chat/stream" if stream else "/api/ai/chat"
+        return path, {"message": f"Explain cell respiration (#{n})", "noteContent": "Cells make ATP."}
+    if endpoint == "quiz":
+        path = "/api/ai/generate-quiz/stream" if stream else "/api/ai/generate-quiz"
+        return path, {"subject": "Biology", "topic": f"Cells #{n}", "count": 5}
+    if endpoint == "syllabus":
+        return "/api/ai/parse-syllabus", {"file_type": "text", "content": f"BIO 101 (#{n})\nWeek 1: Cells\nWeek 2: DNA"}
+    raise ValueError(f"Unknown endpoint '{endpoint}'")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of ``values`` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q / 100 * len(ordered))) - 1]
+
+
+def drive(api, endpoint, requests, concurrency, stream=False, repeat=False):
+    """Send ``requests`` requests with ``concurrency`` workers; returns ``[(status, seconds, ttfb_seconds)]``."""
+    local = threading.local()
+
+    def one(index):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = api.app.test_client()
+        path, body = request_for(endpoint, index, stream, repeat)
+        started = time.perf_counter()
+        response = client.post(path, json=body, buffered=False)
+        ttfb = None
+        for _ in response.response:
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+        response.close()
+        elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, ttfb if ttfb is not None else elapsed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(requests)))
+
+
+def summarize(endpoint, samples, elapsed, upstream, concurrency):
+    latencies = [seconds for _, seconds, _ in samples]
+    ttfbs = [ttfb for _, _, ttfb in samples]
+    statuses = {}
+    for status, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "endpoint": endpoint,
+        "requests": len(samples),
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "ttfb_p50_ms": round(percentile(ttfbs, 50) * 1000, 1),
+        "ttfb_p95_ms": round(percentile(ttfbs, 95) * 1000, 1),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "upstream_per_request": {api: round(count / len(samples), 2) for api, count in upstream.items()},
+    }
+
+
+def benchmark(api, groq, gemini, endpoints=ENDPOINTS, requests=100, concurrency=8, stream=False, repeat=False):
+    """Run each endpoint in turn against the fake servers; returns one summary per endpoint."""
+    results = []
+    for endpoint in endpoints:
+        before = (groq.requests, gemini.requests)
+        started = time.perf_counter()
+        samples = drive(api, endpoint, requests, concurrency, stream=stream, repeat=repeat)
+        elapsed = time.perf_counter() - started
+        upstream = {"groq": groq.requests - before[0], "gemini": gemini.requests - before[1]}
+        results.append(summarize(endpoint, samples, elapsed, upstream, concurrency))
+    return results
+
+
+def parse_rates(text):
+    """``"429=0.1,500=0.02"`` -> ``{429: 0.1, 500: 0.02}``."""
+    rates = {}
+    for item in filter(None, (text or "").split(",")):
+        status, rate = item.split("=")
+        rates[int(status)] = float(rate)
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=ENDPOINTS + ("all",), default="all")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake upstream latency in seconds")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--stream", action="store_true", help="use the streaming chat/quiz endpoints")
+    parser.add_argument("--keys", type=int, default=1, help="number of Groq keys")
+    parser.add_argument("--groq-errors", default="", help="e.g. 429=0.1,500=0.02")
+    parser.add_argument("--gemini-errors", default="")
+    parser.add_argument("--no-gemini", action="store_true", help="run without the Gemini fallback")
+    parser.add_argument("--repeat", action="store_true", help="send identical prompts (cache and single-flight hits)")
+    parser.add_argument("--admission", action="store_true", help="keep admission control on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO/WARNING logs")
+    args = parser.parse_args()
+
+    from tests.fake_llm import FakeLLMServer
+
+    common = dict(latency=args.latency, reply=fake_reply, chunk_delay=args.chunk_delay, seed=args.seed)
+    with FakeLLMServer(error_rates=parse_rates(args.groq_errors), **common) as groq, \
+            FakeLLMServer(error_rates=parse_rates(args.gemini_errors), **common) as gemini:
+        # The app reads keys and endpoints at import time
+        os.environ.pop("GROQ_API_KEY", None)
+        os.environ["GROQ_API_KEYS"] = ",".join(f"bench-key-{i}" for i in range(args.keys))
+        os.environ["GROQ_BASE_URL"] = groq.url
+        if args.no_gemini:
+            os.environ.pop("GEMINI_API_KEY", None)
+        else:
+            os.environ["GEMINI_API_KEY"] = "bench-key"
+            os.environ["GEMINI_BASE_URL"] = gemini.url
+        os.environ.setdefault("WARMUP", "1")
+        import logging
+
+        import app as api
+        from admission import AdmissionController
+
+        # Injected upstream errors make the app log a warning per retry or fallback
+        logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+        if not args.admission:
+            api.admission = AdmissionController(enabled=False)
+        api.warm_up()
+
+        endpoints = ENDPOINTS if args.endpoint == "all" else (args.endpoint,)
+        results = benchmark(api, groq, gemini, endpoints, args.requests, args.concurrency, args.stream, args.repeat)
+        api.groq_pool.close()
+
+    if args.json:
+        errors = {"groq": dict(groq.errors), "gemini": dict(gemini.errors)}
+        print(json.dumps({"results": results, "upstream_errors": errors}, indent=2))
+        return
+    print(f"{'endpoint':<10} {'ok':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'ttfb50':>8} {'req/s':>8}  upstream/req")
+    for r in results:
+        ok = f"{r['statuses'].get('200', 0)}/{r['requests']}"
+        upstream = " ".join(f"{api}={count}" for api, count in r["upstream_per_request"].items())
+        print(
+            f"{r['endpoint']:<10} {ok:>6} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+            f"{r['ttfb_p50_ms']:>8.1f} {r['throughput_rps']:>8.1f}  {upstream}"
+        )
+        errors = {status: count for status, count in r["statuses"].items() if status != "200"}
+        if errors:
+            print(f"{'':<10} non-200: {errors}")
+    print(f"injected upstream errors: groq={dict(groq.errors)} gemini={dict(gemini.errors)}")
+
+
+if __name__ == "__main__":
+    main()
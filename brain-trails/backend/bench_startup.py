@@ -0,0 +1,92 @@
+"""
+Cold-start benchmark: process start to first AI response.
+
+Each trial starts a fresh Python process that imports the app, optionally
+runs ``warm_up()``, and sends one ``/api/ai/chat`` request to a local fake
+Groq server. Three modes are compared:
+
+- ``lazy``: no warm-up; the first request pays for SDK imports and client setup
+- ``warm``: ``warm_up()`` before the first request (a worker without preload)
+- ``preload``: SDKs imported before the timer starts, as in a worker forked
+  from a gunicorn master that preloaded them, then ``warm_up()``
+
+Usage:
+    python bench_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ("lazy", "warm", "preload")
+
+
+def child(mode):
+    """Run one cold start in this process and print its timings as JSON."""
+    if mode == "preload":
+        from warmup import preload
+
+        preload()
+    started = time.perf_counter()
+    import app as api
+
+    imported = time.perf_counter()
+    if mode in ("warm", "preload"):
+        api.warm_up()
+    ready = time.perf_counter()
+    with api.app.test_client() as client:
+        response = client.post("/api/ai/chat", json={"message": "Hi"})
+    done = time.perf_counter()
+    assert response.status_code == 200, response.get_data(as_text=True)
+    print(json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "warmup_ms": (ready - imported) * 1000,
+        "first_request_ms": (done - ready) * 1000,
+        "cold_start_ms": (done - started) * 1000,
+    }))
+
+
+def run_trial(mode, env):
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", mode],
+        env=env, capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    from tests.fake_llm import FakeLLMServer
+
+    with FakeLLMServer() as server:
+        env = {
+            **os.environ,
+            "GROQ_BASE_URL": server.url,
+            "GROQ_API_KEY": "bench-key",
+            "GEMINI_API_KEY": "bench-key",
+            "AI_HEDGING": "0",
+            "WARMUP": "1",
+        }
+        env.pop("GROQ_API_KEYS", None)
+        print(f"{'mode':<8} {'import':>9} {'warm-up':>9} {'1st req':>9} {'total':>9}   (median ms, {args.runs} runs)")
+        for mode in MODES:
+            trials = [run_trial(mode, env) for _ in range(args.runs)]
+            medians = [
+                statistics.median(t[k] for t in trials)
+                for k in ("import_ms", "warmup_ms", "first_request_ms", "cold_start_ms")
+            ]
+            print(f"{mode:<8} " + " ".join(f"{m:>9.1f}" for m in medians))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Brain Trails - Chat sessions
+
+``/api/ai/chat`` is stateless: every follow-up resends the note and the
+model never sees the earlier turns. A client that sends ``"session": true``
+gets a server-side session instead, and later turns send only ``sessionId``
+and the new message:
+
+- the note is stored once (a turn that sends ``noteContent`` replaces it);
+- earlier turns are replayed to the model as chat messages;
+- once the history is over ``history_tokens``, every turn but the last
+  ``keep_turns`` messages is folded into a running summary by the caller's
+  summarizer (turns are dropped if it fails).
+
+Sessions expire ``ttl`` seconds after their last turn. They are stored in a
+``response_cache`` backend: by default a SQLite file shared by every gunicorn
+worker, so a follow-up can land on any worker, or per-process memory (LRU +
+TTL) for a single worker.
+"""
+
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+import logging
+
+from prompt_budget import count_tokens
+from response_cache import MemoryCacheBackend, SQLiteCacheBackend
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def history_tokens(session):
+    """Tokens the session's summary and stored turns add to a prompt."""
+    return count_tokens(session["summary"]) + sum(count_tokens(turn["content"]) for turn in session["turns"])
+
+
+class ChatSessions:
+    """Per-session note context, recent turns and a running summary of older ones."""
+
+    def __init__(self, backend, ttl=21600.0, history_tokens=1200, keep_turns=4, enabled=True):
+        self.backend = backend
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self.keep_turns = max(keep_turns, 2)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "resumed": 0, "expired": 0, "turns": 0, "compactions": 0, "dropped": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build from CHAT_SESSIONS (memory, sqlite or off), CHAT_SESSIONS_* and CHAT_HISTORY_TOKENS."""
+        kind = os.getenv("CHAT_SESSIONS", "sqlite").lower()
+        max_entries = int(os.getenv("CHAT_SESSIONS_MAX", 1000))
+        enabled = kind not in ("0", "off", "none", "disabled")
+        if kind == "memory" or not enabled:
+            backend = MemoryCacheBackend(max_entries=max_entries)
+        else:
+            path = os.getenv("CHAT_SESSIONS_PATH") or os.path.join(
+                tempfile.gettempdir(), "brain_trails_chat_sessions.sqlite3"
+            )
+            backend = SQLiteCacheBackend(path, max_entries=max_entries)
+        return cls(
+            backend,
+            ttl=float(os.getenv("CHAT_SESSIONS_TTL", 21600)),
+            history_tokens=int(os.getenv("CHAT_HISTORY_TOKENS", 1200)),
+            keep_turns=int(os.getenv("CHAT_KEEP_TURNS", 4)),
+            enabled=enabled,
+        )
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def create(self, notes=""):
+        """A new, not yet stored session."""
+        self._count("created")
+        return {"id": uuid.uuid4().hex, "notes": notes or "", "summary": "", "turns": [], "created": time.time()}
+
+    def get(self, session_id):
+        """The stored session, or None if it is unknown or expired."""
+        if not self.enabled or not isinstance(session_id, str):
+            return None
+        value, expired = self.backend.get(session_id)
+        if expired:
+            self._count("expired", expired)
+        if value is None:
+            return None
+        self._count("resumed")
+        return json.loads(value)
+
+    def history(self, session):
+        """Chat messages replaying the session: the summary (if any), then the stored turns."""
+        messages = [{"role": "system", "content": SUMMARY_PREFIX + session["summary"]}] if session["summary"] else []
+        return messages + list(session["turns"])
+
+    def compaction(self, session):
+        """The oldest turns to fold into the summary, or [] while the history fits its budget."""
+        if history_tokens(session) <= self.history_tokens:
+            return []
+        return session["turns"][:-self.keep_turns]
+
+    def compact(self, session, folded, summary):
+        """Replace ``folded`` turns with ``summary``; without one the turns are simply dropped."""
+        session["turns"] = session["turns"][len(folded):]
+        if summary:
+            session["summary"] = summary.strip()
+            self._count("compactions")
+        else:
+            self._count("dropped", len(folded))
+            logger.warning(f"Chat sessions: summary failed, dropped {len(folded)} messages")
+        # Turns that are still over budget on their own go oldest first, keeping the last exchange
+        while history_tokens(session) > self.history_tokens and len(session["turns"]) > 2:
+            session["turns"] = session["turns"][2:]
+            self._count("dropped", 2)
+
+    def add_turn(self, session, message, reply):
+        """Append one exchange and store the session (which restarts its TTL)."""
+        session["turns"] = session["turns"] + [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": reply},
+        ]
+        self._count("turns")
+        self.save(session)
+
+    def save(self, session):
+        """Store ``session`` (which restarts its TTL); failures are logged, never raised."""
+        try:
+            self.backend.set(session["id"], json.dumps(session), self.ttl)
+        except Exception as e:
+            logger.warning(f"Chat sessions: store failed: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update(
+            enabled=self.enabled, sessions=len(self.backend), ttl=self.ttl,
+            history_tokens=self.history_tokens, keep_turns=self.keep_turns,
+        )
+        return snapshot
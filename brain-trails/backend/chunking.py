@@ -0,0 +1,160 @@
+"""
+Brain Trails - Map-reduce chunking for long syllabi
+
+Long documents are split on section boundaries (markdown headings, "Week 3",
+"Unit IV", ALL-CAPS titles, ...) into chunks that each fit one prompt. The
+chunks are parsed concurrently and the per-chunk ``subjects`` are merged back
+into one syllabus, so latency grows with the slowest chunk rather than with
+document length.
+"""
+
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import deadlines
+
+logger = logging.getLogger(__name__)
+
+_MARKDOWN_HEADING = re.compile(r"^\s*#{1,6}\s+\S")
+_KEYWORD_HEADING = re.compile(
+    r"^\s*(week|unit|module|chapter|lecture|part|section|session|topic|lesson)\s*[\dIVXivx]+\b", re.IGNORECASE
+)
+_CAPS_HEADING = re.compile(r"^\s*[A-Z][A-Z0-9 &:/()\-]{3,60}\s*$")
+
+# Scalar subject fields a later chunk may fill in when an earlier one left them empty
+_SUBJECT_FIELDS = ("code", "emoji", "color", "description", "professor", "credit_hours")
+
+
+def is_heading(line):
+    return bool(
+        _MARKDOWN_HEADING.match(line) or _KEYWORD_HEADING.match(line) or _CAPS_HEADING.match(line)
+    )
+
+
+def _sections(text):
+    """Split ``text`` into sections, each starting at a heading line."""
+    sections, current = [], []
+    for line in text.splitlines(keepends=True):
+        if current and is_heading(line):
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("".join(current))
+    return sections
+
+
+def _split_oversized(section, max_chars):
+    """Break a section longer than ``max_chars`` into lines, hard-cutting overlong lines."""
+    pieces = []
+    for line in section.splitlines(keepends=True):
+        while len(line) > max_chars:
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        pieces.append(line)
+    return pieces
+
+
+def _pack(pieces, max_chars):
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def split_sections(text, max_chars=6000, max_chunks=8):
+    """Split ``text`` into at most ``max_chunks`` chunks of at most ``max_chars``.
+
+    Chunks break on section headings where possible. Text beyond
+    ``max_chunks`` chunks is dropped with a warning.
+    """
+    if len(text) <= max_chars:
+        return [text]
+    pieces = []
+    for section in _sections(text):
+        pieces.extend([section] if len(section) <= max_chars else _split_oversized(section, max_chars))
+    chunks = _pack(pieces, max_chars)
+    if len(chunks) > max_chunks:
+        dropped = sum(len(c) for c in chunks[max_chunks:])
+        logger.warning(f"Chunking: {len(chunks)} chunks exceed the limit of {max_chunks}; dropping {dropped} chars")
+        chunks = chunks[:max_chunks]
+    return chunks
+
+
+def map_concurrent(fn, items, max_workers=8):
+    """Apply ``fn`` to ``items`` concurrently, returning results in input order."""
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="chunk") as pool:
+        return list(pool.map(deadlines.bind(fn), items))
+
+
+def _norm(value):
+    return re.sub(r"[^a-z0-9]+", "", str(value or "").lower())
+
+
+def _topic_key(topic):
+    """Topics with the same name are the same topic only if their week and date match too."""
+    return _norm(topic.get("name")), str(topic.get("week") or ""), str(topic.get("date") or "")
+
+
+def _merge_subject(target, subject):
+    for field in _SUBJECT_FIELDS:
+        if not target.get(field) and subject.get(field):
+            target[field] = subject[field]
+
+    # Only topics already merged from earlier chunks count as duplicates: a chunk
+    # may list "Review" or "Lab" once per week
+    seen_topics = {_topic_key(t) for t in target["topics"]}
+    topics = [t for t in subject.get("topics") or [] if isinstance(t, dict) and t.get("name")]
+    for topic in sorted(topics, key=lambda t: t.get("sort_order") if isinstance(t.get("sort_order"), int) else 0):
+        if _topic_key(topic) not in seen_topics:
+            target["topics"].append(dict(topic))
+
+    seen_exams = {(_norm(e.get("name")), e.get("exam_date")) for e in target["exams"]}
+    for exam in subject.get("exams") or []:
+        if not isinstance(exam, dict):
+            continue
+        key = (_norm(exam.get("name")), exam.get("exam_date"))
+        if key not in seen_exams:
+            seen_exams.add(key)
+            target["exams"].append(dict(exam))
+
+
+def merge_syllabi(results):
+    """Merge per-chunk syllabus JSON into one ``{"semester", "subjects"}`` document.
+
+    Subjects are matched by code or name, topics deduplicated across chunks by
+    name, week and date (chunk order, then each chunk's ``sort_order``) and
+    renumbered, and exams deduplicated by name and date.
+    """
+    merged = {"semester": "", "subjects": []}
+    by_code, by_name = {}, {}
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        merged["semester"] = merged["semester"] or result.get("semester") or ""
+        for subject in result.get("subjects") or []:
+            if not isinstance(subject, dict) or not (subject.get("name") or subject.get("code")):
+                continue
+            code, name = _norm(subject.get("code")), _norm(subject.get("name"))
+            target = (code and by_code.get(code)) or (name and by_name.get(name))
+            if not target:
+                target = {**subject, "topics": [], "exams": []}
+                merged["subjects"].append(target)
+            _merge_subject(target, subject)
+            if code:
+                by_code.setdefault(code, target)
+            if name:
+                by_name.setdefault(name, target)
+
+    for subject in merged["subjects"]:
+        for index, topic in enumerate(subject["topics"]):
+            topic["sort_order"] = index
+    return merged
@@ -0,0 +1,168 @@
+"""
+Brain Trails - Request deadlines
+
+Without an overall budget a request could spend the whole gunicorn timeout
+walking every Groq key and then the Gemini fallback, and the worker was
+killed instead of answering. Each AI request now gets a ``Deadline``: a
+per-endpoint budget, which a client can shorten or extend (up to
+``max_seconds``) with the ``X-Request-Timeout`` header, in seconds.
+
+The deadline for the current request lives in a context variable. Key
+rotation, the Gemini fallback and PDF extraction call ``check()`` before
+starting more work, and derive their per-call timeouts from ``remaining()``.
+Functions handed to thread pools are wrapped with ``bind()`` so they see the
+deadline of the request that submitted them. Once the budget is spent,
+``DeadlineExceeded`` is raised and the routes answer 504.
+"""
+
+import os
+import json
+import math
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Request-Timeout"
+
+# Seconds per AI route; all are below gunicorn's 120s worker timeout
+DEFAULT_DEADLINES = {
+    "/api/ai/chat": 30.0,
+    "/api/ai/chat/stream": 60.0,
+    "/api/ai/generate-quiz": 45.0,
+    "/api/ai/generate-quiz/stream": 60.0,
+    "/api/ai/generate-quiz/batch": 110.0,
+    "/api/ai/parse-syllabus": 90.0,
+}
+
+_current = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before ``stage`` could start or finish."""
+
+    def __init__(self, budget, stage=None):
+        during = f" during {stage}" if stage else ""
+        super().__init__(f"Request deadline of {budget:g}s exceeded{during}")
+        self.budget = budget
+        self.stage = stage
+
+
+class Deadline:
+    """A time budget that started when the request arrived."""
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self.seconds = seconds
+        self._clock = clock
+        self._expires_at = clock() + seconds
+
+    def remaining(self):
+        return max(self._expires_at - self._clock(), 0.0)
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage=None):
+        """Raise ``DeadlineExceeded`` if the budget is spent."""
+        if self.expired:
+            raise DeadlineExceeded(self.seconds, stage)
+
+
+class DeadlinePolicy:
+    """Per-endpoint deadlines, optionally overridden by the ``X-Request-Timeout`` header."""
+
+    def __init__(self, deadlines=None, max_seconds=115.0, min_seconds=1.0, enabled=True):
+        self.deadlines = dict(DEFAULT_DEADLINES if deadlines is None else deadlines)
+        self.max_seconds = max_seconds
+        self.min_seconds = min_seconds
+        self.enabled = enabled
+
+    @classmethod
+    def from_env(cls):
+        """Build from REQUEST_DEADLINE* env vars; REQUEST_DEADLINES is JSON mapping a path to seconds."""
+        deadlines = dict(DEFAULT_DEADLINES)
+        overrides = os.getenv("REQUEST_DEADLINES", "").strip()
+        if overrides:
+            try:
+                deadlines.update({path: float(seconds) for path, seconds in json.loads(overrides).items()})
+            except (ValueError, AttributeError, TypeError) as e:
+                logger.warning(f"Deadlines: ignoring invalid REQUEST_DEADLINES ({e})")
+        return cls(
+            deadlines,
+            max_seconds=float(os.getenv("REQUEST_DEADLINE_MAX", 115)),
+            enabled=os.getenv("REQUEST_DEADLINES_ENABLED", "1").lower() not in ("0", "false", "no", "off"),
+        )
+
+    def for_request(self, path, headers):
+        """The ``Deadline`` for a request to ``path``, or None for routes without one."""
+        seconds = self.deadlines.get(path)
+        if not self.enabled or seconds is None:
+            return None
+        requested = headers.get(HEADER) or headers.get(HEADER.lower())
+        if requested:
+            try:
+                value = float(requested)
+            except ValueError:
+                value = None
+            # "nan" and "inf" parse as floats but are not budgets
+            if value is not None and math.isfinite(value):
+                seconds = value
+        return Deadline(min(max(seconds, self.min_seconds), self.max_seconds))
+
+    def stats(self):
+        return {"enabled": self.enabled, "max_seconds": self.max_seconds, "deadlines": self.deadlines}
+
+
+def current():
+    """The current request's ``Deadline``, or None."""
+    return _current.get()
+
+
+def start(deadline):
+    """Make ``deadline`` current; returns a token for ``reset``."""
+    return _current.set(deadline)
+
+
+def reset(token):
+    _current.reset(token)
+
+
+@contextmanager
+def scope(deadline):
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def check(stage=None):
+    """Raise ``DeadlineExceeded`` if the current request's budget is spent."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+def remaining(stage=None):
+    """Seconds left for the current request (None without a deadline); raises if none are left."""
+    deadline = _current.get()
+    if deadline is None:
+        return None
+    deadline.check(stage)
+    return deadline.remaining()
+
+
+def bind(fn):
+    """Wrap ``fn`` to run under the caller's deadline, for use in thread pools.
+
+    The caller's other context variables (the trace span) come along too; each
+    call runs in its own copy, so one bound function can run on many threads.
+    """
+    context = copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
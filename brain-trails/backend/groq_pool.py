@@ -0,0 +1,176 @@
+"""
+Brain Trails - Pooled Groq clients
+
+Keeps one long-lived Groq client per API key so every request reuses the same
+keep-alive HTTP connection pool instead of paying a fresh DNS lookup and TLS
+handshake for each key attempt.
+"""
+
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class GroqClientPool:
+    """Process-wide registry of Groq clients keyed by API key.
+
+    Clients are thread-safe (httpx connection pools are), so a single client per
+    key is shared by every gunicorn thread in the worker.
+    """
+
+    def __init__(self, max_connections=20, max_keepalive=10, keepalive_expiry=30.0,
+                 connect_timeout=5.0, read_timeout=60.0, max_retries=0, async_max_connections=500):
+        self.max_connections = max_connections
+        self.async_max_connections = async_max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+
+        self._clients = {}
+        self._async_clients = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "clients_created": 0,
+            "clients_reused": 0,
+            "requests": 0,
+            "connections_opened": 0,
+            "connections_failed": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Build a pool from GROQ_POOL_* / GROQ_*_TIMEOUT environment variables."""
+        return cls(
+            max_connections=int(os.getenv("GROQ_POOL_MAX_CONNECTIONS", 20)),
+            max_keepalive=int(os.getenv("GROQ_POOL_MAX_KEEPALIVE", 10)),
+            keepalive_expiry=float(os.getenv("GROQ_POOL_KEEPALIVE_EXPIRY", 30)),
+            connect_timeout=float(os.getenv("GROQ_CONNECT_TIMEOUT", 5)),
+            read_timeout=float(os.getenv("GROQ_READ_TIMEOUT", 60)),
+            max_retries=int(os.getenv("GROQ_MAX_RETRIES", 0)),
+            async_max_connections=int(os.getenv("GROQ_ASYNC_POOL_MAX_CONNECTIONS", 500)),
+        )
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _trace(self, event_name, info):
+        """httpcore trace callback: only fires connect events for *new* sockets."""
+        if event_name == "connection.connect_tcp.complete":
+            self._count("connections_opened")
+        elif event_name == "connection.connect_tcp.failed":
+            self._count("connections_failed")
+
+    async def _atrace(self, event_name, info):
+        self._trace(event_name, info)
+
+    def _on_request(self, req):
+        self._count("requests")
+        req.extensions["trace"] = self._trace
+
+    async def _on_async_request(self, req):
+        self._count("requests")
+        req.extensions["trace"] = self._atrace
+
+    def _limits(self, max_connections):
+        import httpx
+
+        return dict(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=min(self.max_keepalive, max_connections),
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+        )
+
+    def timeout(self, budget=None):
+        """Per-call timeout: the configured connect/read timeouts, capped at ``budget`` seconds."""
+        import httpx
+
+        if budget is None:
+            return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        return httpx.Timeout(min(self.read_timeout, budget), connect=min(self.connect_timeout, budget))
+
+    def _build_client(self, key):
+        from groq import Groq, DefaultHttpxClient
+
+        http_client = DefaultHttpxClient(
+            event_hooks={"request": [self._on_request]},
+            **self._limits(self.max_connections),
+        )
+        return Groq(api_key=key, http_client=http_client, max_retries=self.max_retries)
+
+    def _build_async_client(self, key):
+        from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+        http_client = DefaultAsyncHttpxClient(
+            event_hooks={"request": [self._on_async_request]},
+            **self._limits(self.async_max_connections),
+        )
+        return AsyncGroq(api_key=key, http_client=http_client, max_retries=self.max_retries)
+
+    def get(self, key):
+        """Return the shared client for ``key``, creating it on first use."""
+        return self._get_or_build(self._clients, key, self._build_client)
+
+    def get_async(self, key):
+        """Return the shared AsyncGroq client for ``key`` (ASGI mode, one event loop per worker)."""
+        return self._get_or_build(self._async_clients, key, self._build_async_client)
+
+    def _get_or_build(self, registry, key, build):
+        client = registry.get(key)
+        if client is not None:
+            self._count("clients_reused")
+            return client
+
+        with self._lock:
+            client = registry.get(key)
+            if client is None:
+                client = build(key)
+                registry[key] = client
+                self._count("clients_created")
+                logger.info(f"Groq pool: created client #{len(self._clients) + len(self._async_clients)}")
+            else:
+                self._count("clients_reused")
+        return client
+
+    def close(self):
+        """Close every pooled sync client (used on worker shutdown and in tests)."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Groq pool: error closing client: {str(e)}")
+
+    async def aclose(self):
+        """Close every pooled async client; call from the event loop that used them."""
+        with self._lock:
+            clients = list(self._async_clients.values())
+            self._async_clients.clear()
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"Groq pool: error closing async client: {str(e)}")
+
+    def stats(self):
+        """Snapshot of pool counters, safe to serialize as JSON."""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        requests = snapshot["requests"]
+        reused = max(requests - snapshot["connections_opened"] - snapshot["connections_failed"], 0)
+        snapshot["connections_reused"] = reused
+        snapshot["connection_reuse_ratio"] = round(reused / requests, 3) if requests else 0.0
+        snapshot["clients"] = len(self._clients) + len(self._async_clients)
+        snapshot["max_connections"] = self.max_connections
+        snapshot["max_keepalive"] = self.max_keepalive
+        return snapshot
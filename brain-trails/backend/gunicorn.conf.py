@@ -0,0 +1,31 @@
+"""
+Gunicorn settings for the Brain Trails backend.
+
+The app (and the provider SDKs it uses) is imported once in the master and
+shared copy-on-write by the forked workers; each worker then builds its own
+Groq clients and Gemini model before taking traffic. With GUNICORN_PRELOAD=0
+each worker imports the app itself, but the SDKs are still preloaded.
+"""
+
+import os
+
+bind = "0.0.0.0:8080"
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = 120
+accesslog = "-"
+errorlog = "-"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    # Runs in the master before workers are forked: import-only, no sockets or threads
+    from warmup import preload
+
+    preload()
+
+
+def post_worker_init(worker):
+    from app import warm_up
+
+    warm_up()
@@ -0,0 +1,268 @@
+"""
+Brain Trails - Hedged provider calls
+
+Groq is the primary provider and Gemini the fallback. Sequential fallback
+means a slow Groq call adds its whole latency before Gemini even starts. With
+hedging enabled, if Groq hasn't answered within a deadline derived from its
+recent p95 latency, Gemini is started in parallel and whichever returns a
+usable answer first wins; the loser is cancelled (asyncio) or abandoned and
+its result discarded (threads).
+
+Provider callables return ``(text, error)``; a call succeeds when ``text`` is
+truthy.
+"""
+
+import os
+import time
+import asyncio
+import bisect
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import deadlines
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds, shared with the metrics endpoint
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts plus a window of recent samples for quantiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=512):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self._sum += seconds
+            self._recent.append(seconds)
+
+    @property
+    def count(self):
+        return sum(self._counts)
+
+    def quantile(self, q):
+        """Quantile over the recent window, or None without samples."""
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative, running = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return {
+            "count": running,
+            "sum": round(total, 4),
+            "buckets": cumulative,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class HedgePolicy:
+    """Decides when to hedge and tracks per-provider latency."""
+
+    def __init__(self, enabled=False, quantile=0.95, default_delay=4.0, min_delay=0.5,
+                 max_delay=20.0, min_samples=20, max_workers=16):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stats = {"hedged": 0, "primary_wins": 0, "secondary_wins": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build from AI_HEDGING* env vars (hedging is opt-in)."""
+        return cls(
+            enabled=os.getenv("AI_HEDGING", "").lower() in ("1", "true", "yes", "on"),
+            quantile=float(os.getenv("AI_HEDGING_QUANTILE", 0.95)),
+            default_delay=float(os.getenv("AI_HEDGING_DEFAULT_DELAY", 4.0)),
+            min_delay=float(os.getenv("AI_HEDGING_MIN_DELAY", 0.5)),
+            max_delay=float(os.getenv("AI_HEDGING_MAX_DELAY", 20.0)),
+        )
+
+    def histogram(self, provider):
+        with self._lock:
+            if provider not in self.histograms:
+                self.histograms[provider] = LatencyHistogram()
+            return self.histograms[provider]
+
+    def observe(self, provider, seconds):
+        self.histogram(provider).observe(seconds)
+
+    def delay_for(self, provider):
+        """Hedge deadline for ``provider``: its recent p95, clamped, or a default while warming up."""
+        hist = self.histogram(provider)
+        if hist.count < self.min_samples:
+            return self.default_delay
+        return min(max(hist.quantile(self.quantile), self.min_delay), self.max_delay)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+            return self._executor
+
+    def timed(self, provider, fn):
+        """Wrap ``fn`` so successful calls feed ``provider``'s latency histogram."""
+        def run():
+            started = time.perf_counter()
+            text, error = fn()
+            if text:
+                self.observe(provider, time.perf_counter() - started)
+            return text, error
+        return run
+
+    def call(self, primary, secondary):
+        """Run ``primary`` then ``secondary`` as ``(name, fn)`` pairs.
+
+        Returns ``(text, error, provider)``. Without hedging this is a plain
+        sequential fallback; with hedging the secondary starts once the
+        primary exceeds its deadline or fails.
+        """
+        primary_name, primary_fn = primary
+        secondary_name, secondary_fn = secondary
+        primary_fn = self.timed(primary_name, primary_fn)
+        secondary_fn = self.timed(secondary_name, secondary_fn) if secondary_fn else None
+
+        if not self.enabled or secondary_fn is None:
+            text, error = primary_fn()
+            if text or secondary_fn is None:
+                return text, error, primary_name
+            logger.warning(f"{primary_name} failed ({error}), falling back to {secondary_name}")
+            text, secondary_error = secondary_fn()
+            return text, secondary_error or error, secondary_name
+
+        return self._race(primary_name, primary_fn, secondary_name, secondary_fn)
+
+    def _race(self, primary_name, primary_fn, secondary_name, secondary_fn):
+        pool = self._pool()
+        delay = self.delay_for(primary_name)
+        # Pool threads run under the caller's request deadline
+        futures = {pool.submit(deadlines.bind(primary_fn)): primary_name}
+        done, _ = wait(futures, timeout=delay)
+        if done:
+            text, error = next(iter(done)).result()
+            if text:
+                self._count("primary_wins")
+                return text, error, primary_name
+            logger.warning(f"{primary_name} failed ({error}), falling back to {secondary_name}")
+            text, secondary_error = secondary_fn()
+            return text, secondary_error or error, secondary_name
+
+        logger.info(f"Hedging: {primary_name} exceeded {delay:.2f}s, starting {secondary_name}")
+        self._count("hedged")
+        futures[pool.submit(deadlines.bind(secondary_fn))] = secondary_name
+        errors = []
+        pending = set(futures)
+        while pending:
+            try:
+                budget = deadlines.remaining("hedging")
+            except deadlines.DeadlineExceeded:
+                for loser in pending:
+                    loser.cancel()
+                raise
+            done, pending = wait(pending, timeout=budget, return_when=FIRST_COMPLETED)
+            for future in done:
+                text, error = future.result()
+                if text:
+                    winner = futures[future]
+                    self._count("primary_wins" if winner == primary_name else "secondary_wins")
+                    for loser in pending:
+                        # Not-yet-started calls are cancelled; running ones are abandoned
+                        loser.cancel()
+                    return text, None, winner
+                errors.append(error)
+        return None, "; ".join(e for e in errors if e), primary_name
+
+    async def acall(self, primary, secondary):
+        """Asyncio version of ``call``; the losing task is cancelled outright."""
+        primary_name, primary_fn = primary
+        secondary_name, secondary_fn = secondary
+
+        async def timed(provider, fn):
+            started = time.perf_counter()
+            text, error = await fn()
+            if text:
+                self.observe(provider, time.perf_counter() - started)
+            return text, error
+
+        first = asyncio.ensure_future(timed(primary_name, primary_fn))
+        if not self.enabled or secondary_fn is None:
+            text, error = await first
+            if text or secondary_fn is None:
+                return text, error, primary_name
+            text, secondary_error = await timed(secondary_name, secondary_fn)
+            return text, secondary_error or error, secondary_name
+
+        return await self._arace(first, primary_name, secondary_name, lambda: timed(secondary_name, secondary_fn))
+
+    async def _arace(self, first, primary_name, secondary_name, start_secondary):
+        delay = self.delay_for(primary_name)
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            text, error = first.result()
+            if text:
+                self._count("primary_wins")
+                return text, error, primary_name
+            text, secondary_error = await start_secondary()
+            return text, secondary_error or error, secondary_name
+
+        logger.info(f"Hedging: {primary_name} exceeded {delay:.2f}s, starting {secondary_name}")
+        self._count("hedged")
+        second = asyncio.ensure_future(start_secondary())
+        names = {first: primary_name, second: secondary_name}
+        pending, errors = {first, second}, []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                text, error = task.result()
+                if text:
+                    for loser in pending:
+                        loser.cancel()
+                    winner = names[task]
+                    self._count("primary_wins" if winner == primary_name else "secondary_wins")
+                    return text, None, winner
+                errors.append(error)
+        return None, "; ".join(e for e in errors if e), primary_name
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            providers = list(self.histograms)
+        snapshot["enabled"] = self.enabled
+        snapshot["latency"] = {
+            name: {
+                "count": self.histogram(name).count,
+                "p50": self.histogram(name).quantile(0.5),
+                "p95": self.histogram(name).quantile(0.95),
+                "hedge_delay": self.delay_for(name),
+            }
+            for name in providers
+        }
+        return snapshot
@@ -0,0 +1,222 @@
+"""
+Brain Trails - Image preprocessing for syllabus uploads
+
+Syllabus photos go to Gemini as inline image data, and phone cameras produce
+multi-megabyte images at resolutions far beyond what reading printed text
+needs. Uploads are sniffed for their real format (the client's MIME type is
+not trusted), their dimensions are read from the header so oversize images
+are rejected before decoding, and, when Pillow is installed, they are
+downscaled and re-encoded as JPEG. Without Pillow, formats Gemini accepts
+are passed through with their correct MIME type.
+"""
+
+import io
+import os
+import importlib.util
+import struct
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pillow is optional: without it images are validated and passed through unchanged
+PILLOW = importlib.util.find_spec("PIL") is not None
+
+# Formats Gemini accepts as inline image data
+GEMINI_IMAGE_TYPES = ("image/png", "image/jpeg", "image/webp", "image/heic", "image/heif")
+
+
+class ImageLimitError(ValueError):
+    """The image exceeds the configured size or pixel limits."""
+
+
+class ImageFormatError(ValueError):
+    """The upload is not an image format we can send to the model."""
+
+
+def sniff_mime(data):
+    """MIME type from the file's magic bytes, or None if unrecognised."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[4:8] == b"ftyp":
+        brand = data[8:12]
+        if brand in (b"heic", b"heix", b"heim", b"heis"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+    if data.startswith(b"BM"):
+        return "image/bmp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    return None
+
+
+def image_size(data, mime):
+    """``(width, height)`` read from the header without decoding, or None if unknown."""
+    try:
+        if mime == "image/png":
+            return struct.unpack(">II", data[16:24])
+        if mime == "image/gif":
+            return struct.unpack("<HH", data[6:10])
+        if mime == "image/webp":
+            chunk = data[12:16]
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L":
+                bits = int.from_bytes(data[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        if mime == "image/jpeg":
+            return _jpeg_size(data)
+    except struct.error:
+        return None
+    return None
+
+
+def _jpeg_size(data):
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        (length,) = struct.unpack(">H", data[offset + 2:offset + 4])
+        # Start-of-frame markers carry the dimensions (C4, C8 and CC are not frames)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def _on_white(image):
+    """RGB copy of ``image`` with any transparency composited onto white.
+
+    JPEG has no alpha channel, and a plain ``convert("RGB")`` turns transparent
+    pixels (usually ``(0, 0, 0, 0)``) black, hiding dark text on screenshots.
+    """
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, image).convert("RGB")
+    return image.convert("RGB")
+
+
+class ImagePreprocessor:
+    """Validate, downscale and re-encode syllabus images before they are uploaded to Gemini."""
+
+    def __init__(self, max_bytes=10 * 1024 * 1024, max_pixels=40_000_000, max_side=2048, jpeg_quality=85):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        self._stats = {"images": 0, "resized": 0, "reencoded": 0, "passthrough": 0, "bytes_in": 0, "bytes_out": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build from IMAGE_* env vars."""
+        return cls(
+            max_bytes=int(os.getenv("IMAGE_MAX_BYTES", os.getenv("PDF_MAX_BYTES", 10 * 1024 * 1024))),
+            max_pixels=int(os.getenv("IMAGE_MAX_PIXELS", 40_000_000)),
+            max_side=int(os.getenv("IMAGE_MAX_SIDE", 2048)),
+            jpeg_quality=int(os.getenv("IMAGE_JPEG_QUALITY", 85)),
+        )
+
+    def inspect(self, raw_bytes):
+        """Return ``(mime, size)`` for an acceptable image. Raises ``ImageLimitError`` or ``ImageFormatError``.
+
+        Only the header is read, so this is cheap enough to run before a job is queued.
+        """
+        if len(raw_bytes) > self.max_bytes:
+            raise ImageLimitError(f"Image is {len(raw_bytes) // 1024} KB; the limit is {self.max_bytes // 1024} KB")
+        mime = sniff_mime(raw_bytes)
+        if mime is None:
+            raise ImageFormatError("Unrecognised image format; upload a PNG, JPEG, WebP or HEIC image")
+        if mime not in GEMINI_IMAGE_TYPES and not PILLOW:
+            raise ImageFormatError(f"{mime} images are not supported; upload a PNG, JPEG, WebP or HEIC image")
+        size = image_size(raw_bytes, mime)
+        if size and size[0] * size[1] > self.max_pixels:
+            raise ImageLimitError(
+                f"Image is {size[0]}x{size[1]} pixels; the limit is {self.max_pixels // 1_000_000} megapixels"
+            )
+        return mime, size
+
+    def prepare(self, raw_bytes):
+        """Return ``(image_bytes, mime)`` ready for Gemini, downscaled and re-encoded when that helps."""
+        started = time.perf_counter()
+        mime, size = self.inspect(raw_bytes)
+        data, out_mime, action = raw_bytes, mime, "passthrough"
+        if PILLOW:
+            data, out_mime, action = self._reencode(raw_bytes, mime)
+        elif size and max(size) > self.max_side:
+            logger.info("Image prep: Pillow is not installed, sending the image at full resolution")
+
+        with self._lock:
+            self._stats["images"] += 1
+            self._stats[action] += 1
+            self._stats["bytes_in"] += len(raw_bytes)
+            self._stats["bytes_out"] += len(data)
+        logger.info(
+            f"Image prep: {mime} {size[0] if size else '?'}x{size[1] if size else '?'} {len(raw_bytes) // 1024} KB "
+            f"-> {out_mime} {len(data) // 1024} KB ({action}) in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        return data, out_mime
+
+    def _reencode(self, raw_bytes, mime):
+        try:
+            data, resized = self._to_jpeg(raw_bytes)
+        except ImageLimitError:
+            raise
+        except Exception as e:
+            if mime in GEMINI_IMAGE_TYPES:
+                logger.warning(f"Image prep: could not re-encode {mime}, sending it unchanged: {str(e)}")
+                return raw_bytes, mime, "passthrough"
+            raise ImageFormatError(f"Could not read {mime} image: {str(e)}") from e
+
+        if resized:
+            return data, "image/jpeg", "resized"
+        # Never send a larger file than we were given in a format Gemini already accepts
+        if mime in GEMINI_IMAGE_TYPES and len(data) >= len(raw_bytes):
+            return raw_bytes, mime, "passthrough"
+        return data, "image/jpeg", "reencoded"
+
+    def _to_jpeg(self, raw_bytes):
+        """Decode, orient, downscale and flatten ``raw_bytes``; returns ``(jpeg_bytes, resized)``."""
+        from PIL import Image, ImageOps
+
+        image = Image.open(io.BytesIO(raw_bytes))
+        if image.width * image.height > self.max_pixels:
+            raise ImageLimitError(f"Image is {image.width}x{image.height} pixels")
+        resized = max(image.size) > self.max_side
+        if resized and image.format == "JPEG":
+            # Let the JPEG decoder skip detail we are about to throw away (DCT scaling)
+            image.draft("RGB", (self.max_side, self.max_side))
+        image = ImageOps.exif_transpose(image)
+        if resized:
+            image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+        if image.mode not in ("RGB", "L") or "transparency" in image.info:
+            image = _on_white(image)
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=self.jpeg_quality, optimize=True)
+        return out.getvalue(), resized
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["pillow"] = PILLOW
+        snapshot["max_side"] = self.max_side
+        return snapshot
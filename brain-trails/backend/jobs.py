@@ -0,0 +1,306 @@
+"""
+Brain Trails - Background jobs
+
+Long parses (a 30-page syllabus PDF, an image through Gemini) can run past
+proxy and client timeouts. ``JobQueue`` runs them on a small worker pool
+instead: the request returns a job id at once, and the client polls
+``/api/jobs/<id>`` (or receives a webhook) for the result.
+
+Job records are JSON documents in a bounded TTL store:
+- ``SQLiteJobStore``: a local SQLite file shared by every gunicorn worker,
+  the default, so a poll can land on any worker
+- ``MemoryJobStore``: per-process OrderedDict, for a single worker or tests
+
+The worker pool itself is per process; ``max_pending`` bounds how many jobs
+one worker accepts before answering 503. Each job runs under its own
+``deadline`` (from when it starts running), so a hung upstream call fails the
+job with 504 instead of holding a worker thread forever.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import secrets
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+import deadlines
+from deadlines import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("done", "failed")
+
+# Seconds a client is asked to wait after a 503 from a full queue
+RETRY_AFTER = 5
+
+
+class JobQueueFull(Exception):
+    """Raised by ``JobQueue.submit`` when this worker already has ``max_pending`` jobs."""
+
+    def __init__(self, retry_after):
+        super().__init__("Job queue is full")
+        self.retry_after = retry_after
+
+
+class MemoryJobStore:
+    """In-process TTL store of job records. Finished jobs are evicted first when full."""
+
+    def __init__(self, max_jobs=500, clock=time.time):
+        self.max_jobs = max_jobs
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def put(self, job_id, record, ttl):
+        """Insert or replace ``record`` (a JSON string) and return how many jobs were evicted."""
+        finished = json.loads(record)["status"] in FINISHED
+        with self._lock:
+            now = self._clock()
+            self._jobs[job_id] = (record, now + ttl, finished)
+            self._jobs.move_to_end(job_id)
+            expired = [key for key, (_, expires_at, _) in self._jobs.items() if expires_at <= now]
+            for key in expired:
+                del self._jobs[key]
+            evicted = len(expired)
+            while len(self._jobs) > self.max_jobs:
+                oldest = next((key for key, entry in self._jobs.items() if entry[2]), None)
+                if oldest is None:
+                    oldest = next(iter(self._jobs))
+                del self._jobs[oldest]
+                evicted += 1
+            return evicted
+
+    def get(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                del self._jobs[job_id]
+                return None
+            return entry[0]
+
+    def __len__(self):
+        return len(self._jobs)
+
+
+class SQLiteJobStore:
+    """TTL store of job records in a SQLite file, safe to share between processes."""
+
+    def __init__(self, path, max_jobs=500, clock=time.time):
+        self.path = path
+        self.max_jobs = max_jobs
+        self._clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " record TEXT NOT NULL,"
+                " finished INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork (gunicorn --preload) must not be reused
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def put(self, job_id, record, ttl):
+        """Insert or replace ``record`` (a JSON string) and return how many jobs were evicted."""
+        conn = self._connect()
+        now = self._clock()
+        finished = int(json.loads(record)["status"] in FINISHED)
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, record, finished, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, record, finished, now + ttl, now),
+        )
+        evicted = conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,)).rowcount
+        overflow = len(self) - self.max_jobs
+        if overflow > 0:
+            evicted += conn.execute(
+                "DELETE FROM jobs WHERE id IN ("
+                " SELECT id FROM jobs ORDER BY finished DESC, updated_at ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+        return evicted
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT record FROM jobs WHERE id = ? AND expires_at > ?", (job_id, self._clock())
+        ).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+class JobQueue:
+    """Run ``fn(*args) -> (status_code, body)`` in the background and keep the outcome for polling."""
+
+    def __init__(self, store, workers=2, max_pending=32, ttl=3600.0, webhook_hosts=(), webhook_timeout=10.0,
+                 deadline=300.0):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.deadline = deadline
+        self.webhook_hosts = {host.lower() for host in webhook_hosts}
+        self.webhook_timeout = webhook_timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._stats = {
+            "submitted": 0, "rejected": 0, "done": 0, "failed": 0,
+            "evicted": 0, "webhooks_sent": 0, "webhook_errors": 0, "timed_out": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Build a queue from JOB_* environment variables."""
+        max_jobs = int(os.getenv("JOB_MAX_STORED", 500))
+        if os.getenv("JOB_STORE", "sqlite").lower() == "memory":
+            store = MemoryJobStore(max_jobs=max_jobs)
+        else:
+            path = os.getenv("JOB_STORE_PATH") or os.path.join(tempfile.gettempdir(), "brain_trails_jobs.sqlite3")
+            store = SQLiteJobStore(path, max_jobs=max_jobs)
+        hosts = [host.strip() for host in os.getenv("JOB_WEBHOOK_HOSTS", "").split(",") if host.strip()]
+        return cls(
+            store,
+            workers=int(os.getenv("JOB_WORKERS", 2)),
+            max_pending=int(os.getenv("JOB_MAX_PENDING", 32)),
+            ttl=float(os.getenv("JOB_TTL_SECONDS", 3600)),
+            webhook_hosts=hosts,
+            deadline=float(os.getenv("JOB_DEADLINE_SECONDS", 300)),
+        )
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _pool(self):
+        # Created on first use and again after a fork, so a preloaded app never
+        # hands a parent's (threadless) executor to a gunicorn worker
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+                self._pid = os.getpid()
+                self._pending = 0
+            return self._executor
+
+    def _save(self, record):
+        try:
+            evicted = self.store.put(record["id"], json.dumps(record), self.ttl)
+        except Exception as e:
+            logger.warning(f"Jobs: store failed for {record['id']}: {str(e)}")
+            return
+        if evicted:
+            self._count("evicted", evicted)
+
+    def check_callback(self, url):
+        """Raise ValueError unless ``url`` is an http(s) URL on an allowed webhook host."""
+        parsed = urlparse(url or "")
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError("'callback_url' must be an http(s) URL")
+        if parsed.hostname.lower() not in self.webhook_hosts:
+            raise ValueError(f"Webhook host '{parsed.hostname}' is not allowed")
+
+    def submit(self, kind, fn, *args, callback_url=None):
+        """Queue a job and return its initial record. Raises ``JobQueueFull``."""
+        if callback_url is not None:
+            self.check_callback(callback_url)
+        pool = self._pool()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise JobQueueFull(retry_after=RETRY_AFTER)
+            self._pending += 1
+            self._stats["submitted"] += 1
+        now = time.time()
+        record = {
+            "id": secrets.token_urlsafe(16), "kind": kind, "status": "queued", "created_at": now, "updated_at": now,
+        }
+        self._save(record)
+        try:
+            pool.submit(self._run, record, fn, args, callback_url)
+        except RuntimeError:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return record
+
+    def _run(self, record, fn, args, callback_url):
+        try:
+            self._save({**record, "status": "running", "updated_at": time.time()})
+            try:
+                with deadlines.scope(Deadline(self.deadline) if self.deadline else None):
+                    status_code, body = fn(*args)
+            except DeadlineExceeded as e:
+                logger.warning(f"Jobs: {record['kind']} job {record['id']} {e}")
+                self._count("timed_out")
+                status_code, body = 504, {"error": str(e), "deadline_seconds": e.budget}
+            except Exception as e:
+                logger.exception(f"Jobs: {record['kind']} job {record['id']} raised")
+                status_code, body = 500, {"error": f"Job failed: {str(e)}"}
+            status = "done" if status_code < 400 else "failed"
+            record = {
+                **record, "status": status, "status_code": status_code, "result": body, "updated_at": time.time(),
+            }
+            if status == "failed":
+                record["error"] = body.get("error", "Job failed")
+            self._save(record)
+            self._count(status)
+            logger.info(f"Jobs: {record['kind']} job {record['id']} {status} ({status_code})")
+        finally:
+            with self._lock:
+                self._pending -= 1
+        if callback_url:
+            self._notify(callback_url, record)
+
+    def _notify(self, url, record):
+        try:
+            response = requests.post(url, json=record, timeout=self.webhook_timeout, allow_redirects=False)
+            response.raise_for_status()
+            self._count("webhooks_sent")
+        except Exception as e:
+            logger.warning(f"Jobs: webhook for {record['id']} failed: {str(e)}")
+            self._count("webhook_errors")
+
+    def get(self, job_id):
+        """Return the job record, or None if unknown or expired."""
+        try:
+            record = self.store.get(job_id)
+        except Exception as e:
+            logger.warning(f"Jobs: lookup failed for {job_id}: {str(e)}")
+            return None
+        return json.loads(record) if record else None
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["pending"] = self._pending
+        snapshot["workers"] = self.workers
+        snapshot["max_pending"] = self.max_pending
+        snapshot["store"] = type(self.store).__name__
+        try:
+            snapshot["stored"] = len(self.store)
+        except Exception:
+            snapshot["stored"] = None
+        return snapshot
@@ -0,0 +1,256 @@
+"""
+Brain Trails - Tolerant JSON extraction from model output
+
+Models wrap JSON in code fences, add prose after it, or get cut off at
+``max_tokens``. ``JSONScanner`` walks the text once, tracking string and
+bracket state, so it can:
+
+- find the first top-level object (or array) and ignore anything around it;
+- repair a truncated document by cutting back to the last complete element
+  and closing the open brackets, keeping every finished question/topic;
+- emit elements of one array (e.g. ``questions``) as soon as each is
+  complete, when fed a token stream.
+
+The ``validate_*`` helpers then check results against the documented quiz
+and syllabus schemas, dropping malformed items instead of failing the request.
+"""
+
+import json
+from collections import deque
+
+import tracing
+
+QUESTION_TYPES = ("mcq", "true_false", "fill_blank", "short_answer")
+EXAM_TYPES = ("exam", "quiz", "assignment", "project", "presentation", "other")
+
+
+class JSONExtractionError(ValueError):
+    """No usable JSON document was found in the model output."""
+
+
+def _closers(stack):
+    return "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+
+class JSONScanner:
+    """Single-pass, incremental scanner over model output containing JSON."""
+
+    def __init__(self, stream_key=None):
+        self.stream_key = stream_key
+        self.text = ""
+        self.start = None
+        self.end = None
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        # Positions where the text can be cut and closed into valid JSON
+        self._cuts = deque(maxlen=32)
+        # Top-level key tracking, to find the array named ``stream_key``
+        self._expect_key = False
+        self._last_key = None
+        self._array_depth = None
+        self._item_start = None
+
+    @property
+    def complete(self):
+        return self.end is not None
+
+    def feed(self, chunk):
+        """Consume more text; returns the ``stream_key`` elements completed by it."""
+        offset = len(self.text)
+        self.text += chunk
+        items = []
+        for i in range(offset, len(self.text)):
+            if self.end is not None:
+                break
+            item = self._step(self.text[i], i)
+            if item is not None:
+                items.append(item)
+        return items
+
+    def _step(self, ch, i):
+        if self.start is None:
+            if ch in "{[":
+                self.start = i
+                self._open(ch, i)
+            return None
+        if self._in_string:
+            self._string_char(ch, i)
+            return None
+        return self._structural(ch, i)
+
+    def _structural(self, ch, i):
+        if ch == '"':
+            self._begin_item(i)
+            self._in_string = True
+            self._string_start = i
+        elif ch in "{[":
+            self._begin_item(i)
+            self._open(ch, i)
+        elif ch in "}]":
+            return self._close(ch, i)
+        elif ch == ",":
+            self._cuts.append((i, _closers(self._stack)))
+            if len(self._stack) == 1:
+                self._expect_key = True
+            return self._end_scalar(i)
+        elif ch == ":":
+            if len(self._stack) == 1:
+                self._expect_key = False
+        elif not ch.isspace():
+            self._begin_item(i)
+        return None
+
+    def _string_char(self, ch, i):
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if len(self._stack) == 1 and self._stack[0] == "{" and self._expect_key:
+                self._last_key = json.loads(self.text[self._string_start:i + 1])
+
+    def _open(self, ch, i):
+        depth = len(self._stack)
+        if self.stream_key is not None and ch == "[" and self._array_depth is None:
+            top_level_array = depth == 0
+            keyed_array = depth == 1 and not self._expect_key and self._last_key == self.stream_key
+            if top_level_array or keyed_array:
+                self._array_depth = depth + 1
+        self._stack.append(ch)
+        if depth == 0 and ch == "{":
+            self._expect_key = True
+        if ch == "[" or depth == 0:
+            # Cutting right after a nested "{" would leave an empty element behind
+            self._cuts.append((i + 1, _closers(self._stack)))
+
+    def _close(self, ch, i):
+        item = None
+        if self._array_depth is not None and len(self._stack) == self._array_depth and ch == "]":
+            item = self._end_scalar(i)
+            self._array_depth = -1
+        self._stack.pop()
+        if not self._stack:
+            self.end = i + 1
+            return item
+        self._cuts.append((i + 1, _closers(self._stack)))
+        if len(self._stack) == self._array_depth and self._item_start is not None:
+            try:
+                item = json.loads(self.text[self._item_start:i + 1])
+            except json.JSONDecodeError:
+                item = None
+            self._item_start = None
+        return item
+
+    def _begin_item(self, i):
+        if self._array_depth is not None and len(self._stack) == self._array_depth and self._item_start is None:
+            self._item_start = i
+
+    def _end_scalar(self, i):
+        if self._array_depth is None or len(self._stack) != self._array_depth or self._item_start is None:
+            return None
+        raw = self.text[self._item_start:i].strip()
+        self._item_start = None
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+
+    def result(self):
+        """Return ``(document, truncated)`` for the text seen so far.
+
+        Raises ``JSONExtractionError`` if no object or array can be recovered.
+        """
+        if self.start is None:
+            raise JSONExtractionError("No JSON object found in AI response")
+        if self.end is not None:
+            try:
+                return json.loads(self.text[self.start:self.end]), False
+            except json.JSONDecodeError as e:
+                raise JSONExtractionError(f"Malformed JSON in AI response: {str(e)}") from e
+        for position, closers in reversed(self._cuts):
+            try:
+                return json.loads(self.text[self.start:position] + closers), True
+            except json.JSONDecodeError:
+                continue
+        raise JSONExtractionError("AI response was truncated before any complete JSON element")
+
+
+def extract_json(text):
+    """Parse the first JSON object/array in ``text``, repairing truncation.
+
+    Returns ``(document, truncated)``.
+    """
+    scanner = JSONScanner()
+    # The scan skips code fences and prose; json.loads then runs on the document it found
+    with tracing.span("json_scan", chars=len(text)):
+        scanner.feed(text)
+    with tracing.span("json_loads"):
+        return scanner.result()
+
+
+# ─── Schema validation ─────────────────────────────────────────
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ""
+
+
+def validate_question(item, flashcard=False):
+    """Return a cleaned question dict, or None if ``item`` doesn't fit the schema."""
+    if not isinstance(item, dict) or not _text(item.get("question")):
+        return None
+    if flashcard:
+        return item if _text(item.get("answer")) else None
+
+    question = dict(item)
+    if not question.get("correct_answer") and question.get("answer"):
+        question["correct_answer"] = question["answer"]
+    if not _text(str(question.get("correct_answer") or "")):
+        return None
+    options = question.get("options")
+    if question.get("type") not in QUESTION_TYPES:
+        question["type"] = "mcq" if isinstance(options, list) and len(options) > 2 else "short_answer"
+    if question["type"] == "true_false":
+        question["options"] = ["True", "False"]
+    elif question["type"] == "mcq" and not (isinstance(options, list) and len(options) >= 2):
+        return None
+    return question
+
+
+def validate_quiz(document, flashcard=False):
+    """Return ``(questions, dropped)`` from a quiz document (object or bare array)."""
+    items = document if isinstance(document, list) else (document or {}).get("questions")
+    if not isinstance(items, list):
+        raise JSONExtractionError("AI response has no 'questions' list")
+    questions = [q for q in (validate_question(item, flashcard) for item in items) if q is not None]
+    return questions, len(items) - len(questions)
+
+
+def _named_items(items):
+    cleaned = []
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, str) and item.strip():
+            item = {"name": item.strip()}
+        if isinstance(item, dict) and _text(item.get("name")):
+            cleaned.append(dict(item))
+    return cleaned
+
+
+def validate_syllabus(document):
+    """Coerce a syllabus document to ``{"semester", "subjects"}`` with named topics and exams."""
+    if not isinstance(document, dict):
+        raise JSONExtractionError("AI response is not a syllabus object")
+    subjects = []
+    for subject in _named_items(document.get("subjects")):
+        topics = _named_items(subject.get("topics"))
+        for index, topic in enumerate(topics):
+            if not isinstance(topic.get("sort_order"), int):
+                topic["sort_order"] = index
+        exams = _named_items(subject.get("exams"))
+        for exam in exams:
+            if exam.get("exam_type") not in EXAM_TYPES:
+                exam["exam_type"] = "other"
+        subjects.append({**subject, "topics": topics, "exams": exams})
+    return {**document, "semester": _text(document.get("semester")), "subjects": subjects}
@@ -0,0 +1,194 @@
+"""
+Brain Trails - Groq key scheduler
+
+Tracks the health of every configured Groq API key so requests skip keys that
+are rate-limited (429, timed cooldown) or rejected (401, long quarantine) and
+spread load across the healthy ones, least-recently-used first.
+"""
+
+import os
+import re
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Groq reports resets as Go-style durations, e.g. "2m59.56s", "7.66s", "120ms"
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value):
+    """Parse a ``retry-after`` / ``x-ratelimit-reset-*`` value into seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def classify_error(exc):
+    """Return "rate_limited", "auth" or "other" for a Groq SDK exception."""
+    status = getattr(exc, "status_code", None)
+    text = str(exc)
+    if status == 429 or (status is None and "429" in text):
+        return "rate_limited"
+    if status == 401 or "invalid_api_key" in text.lower() or (status is None and "401" in text):
+        return "auth"
+    return "other"
+
+
+class KeyState:
+    """Mutable health record for a single API key. Guarded by the scheduler lock."""
+
+    def __init__(self, index, key):
+        self.index = index
+        self.key = key
+        self.last_used = 0.0
+        self.cooldown_until = 0.0
+        self.quarantined_until = 0.0
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.requests = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.auth_failures = 0
+        self.errors = 0
+
+    def available_at(self):
+        return max(self.cooldown_until, self.quarantined_until)
+
+
+class KeyScheduler:
+    """Thread-safe picker over a fixed list of Groq API keys."""
+
+    def __init__(self, keys, rate_limit_cooldown=30.0, auth_quarantine=3600.0, clock=time.monotonic):
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.auth_quarantine = auth_quarantine
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._states = [KeyState(i, key) for i, key in enumerate(keys)]
+
+    @classmethod
+    def from_env(cls, keys):
+        """Build a scheduler for ``keys`` with GROQ_KEY_* timing overrides."""
+        return cls(
+            keys,
+            rate_limit_cooldown=float(os.getenv("GROQ_KEY_COOLDOWN_SECONDS", 30)),
+            auth_quarantine=float(os.getenv("GROQ_KEY_QUARANTINE_SECONDS", 3600)),
+        )
+
+    def __len__(self):
+        return len(self._states)
+
+    def acquire(self, exclude=()):
+        """Reserve the least-recently-used healthy key not in ``exclude``.
+
+        Returns None when every remaining key is cooling down or quarantined.
+        """
+        now = self._clock()
+        with self._lock:
+            healthy = [
+                s for s in self._states
+                if s.index not in exclude and s.available_at() <= now
+            ]
+            if not healthy:
+                return None
+            state = min(healthy, key=lambda s: s.last_used)
+            state.last_used = now
+            state.requests += 1
+            return state
+
+    def next_available_in(self):
+        """Seconds until the soonest key leaves cooldown (0 if one is ready)."""
+        if not self._states:
+            return 0.0
+        now = self._clock()
+        with self._lock:
+            return max(min(s.available_at() for s in self._states) - now, 0.0)
+
+    def record_success(self, state, headers=None):
+        """Note a successful call and pre-emptively cool down an exhausted key."""
+        with self._lock:
+            state.successes += 1
+            self._apply_rate_headers(state, headers, exhausted_only=True)
+
+    def record_failure(self, state, exc):
+        """Update key health from an exception. Returns True if another key should be tried."""
+        kind = classify_error(exc)
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        with self._lock:
+            if kind == "rate_limited":
+                state.rate_limited += 1
+                if not self._apply_rate_headers(state, headers, exhausted_only=False):
+                    state.cooldown_until = self._clock() + self.rate_limit_cooldown
+                logger.warning(
+                    f"Groq key #{state.index} rate-limited; cooling down "
+                    f"{state.cooldown_until - self._clock():.1f}s"
+                )
+                return True
+            if kind == "auth":
+                state.auth_failures += 1
+                state.quarantined_until = self._clock() + self.auth_quarantine
+                logger.error(f"Groq key #{state.index} rejected (401); quarantined {self.auth_quarantine:.0f}s")
+                return True
+            state.errors += 1
+            return False
+
+    def _apply_rate_headers(self, state, headers, exhausted_only):
+        """Set a cooldown from Groq rate-limit headers. Returns True if one was applied."""
+        if not headers:
+            return False
+        state.remaining_requests = _to_int(headers.get("x-ratelimit-remaining-requests"))
+        state.remaining_tokens = _to_int(headers.get("x-ratelimit-remaining-tokens"))
+
+        waits = []
+        if not exhausted_only:
+            waits.append(parse_duration(headers.get("retry-after")))
+        if state.remaining_requests == 0:
+            waits.append(parse_duration(headers.get("x-ratelimit-reset-requests")))
+        if state.remaining_tokens == 0:
+            waits.append(parse_duration(headers.get("x-ratelimit-reset-tokens")))
+        waits = [w for w in waits if w is not None]
+        if not waits:
+            return False
+        state.cooldown_until = max(state.cooldown_until, self._clock() + max(waits))
+        return True
+
+    def snapshot(self):
+        """Per-key counters for /api/health. Never includes key material."""
+        now = self._clock()
+        with self._lock:
+            return [
+                {
+                    "index": s.index,
+                    "status": (
+                        "quarantined" if s.quarantined_until > now
+                        else "cooldown" if s.cooldown_until > now
+                        else "healthy"
+                    ),
+                    "available_in": round(max(s.available_at() - now, 0.0), 1),
+                    "requests": s.requests,
+                    "successes": s.successes,
+                    "rate_limited": s.rate_limited,
+                    "auth_failures": s.auth_failures,
+                    "errors": s.errors,
+                    "remaining_requests": s.remaining_requests,
+                    "remaining_tokens": s.remaining_tokens,
+                }
+                for s in self._states
+            ]
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,132 @@
+"""
+Brain Trails - Prometheus metrics
+
+A small in-process registry rendered in the Prometheus text format at
+``/api/metrics``. Stage latencies use the same ``LatencyHistogram`` (and
+bucket bounds) as hedging, without its quantile window, so recording is a
+dict lookup, a lock and a bisect; in traced requests stage timers also open
+a span (see tracing). Counters that other components already keep (cache,
+single-flight, key scheduler, hedging) are read by collectors at scrape time
+instead of being double-counted on the request path.
+
+Metrics are per worker process, like ``/api/health``.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import tracing
+from hedging import LATENCY_BUCKETS, LatencyHistogram
+
+PREFIX = "brain_trails_"
+
+# name -> (type, help)
+METRICS = {
+    "http_request_duration_seconds": (
+        "histogram", "Time to response headers per endpoint (time to first byte for streams)",
+    ),
+    "stage_duration_seconds": (
+        "histogram", "Latency of internal stages: groq, gemini, pdf_extract, image_prep, json_parse, quiz_topup",
+    ),
+    "groq_key_attempts_total": ("counter", "Groq calls per key index and outcome (success, rotated, error)"),
+    "generations_total": ("counter", "Text generations per serving provider and outcome"),
+    "provider_fallbacks_total": ("counter", "Generations served by Gemini while Groq was configured"),
+    "llm_tokens_total": ("counter", "Tokens reported by the provider's usage data"),
+    "json_parse_failures_total": ("counter", "Model outputs with no usable JSON, per kind"),
+    "json_truncated_total": ("counter", "Model outputs repaired after truncation, per kind"),
+    "deadlines_exceeded_total": ("counter", "Requests answered 504 because their deadline passed, per stage"),
+    "requests_abandoned_total": ("counter", "Requests whose upstream work was cancelled, per reason"),
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Counters and histograms keyed by name and label set."""
+
+    def __init__(self, prefix=PREFIX, buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram(self.buckets, window=0))
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the ``with`` block (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            with tracing.span(labels.get("stage", name)):
+                yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def collector(self, fn):
+        """Register ``fn() -> [(name, type, help, labels_dict, value), ...]``, called on every render."""
+        self._collectors.append(fn)
+        return fn
+
+    def value(self, name, **labels):
+        """Current counter value (0 if never incremented)."""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        families = {}
+        for (name, labels), value in counters:
+            families.setdefault(name, []).append(f"{self.prefix}{name}{_labels(labels)} {_value(value)}")
+        for (name, labels), histogram in histograms:
+            snapshot = histogram.snapshot()
+            lines = families.setdefault(name, [])
+            for bound, count in snapshot["buckets"]:
+                bucket_labels = labels + (("le", _value(bound)),)
+                lines.append(f"{self.prefix}{name}_bucket{_labels(bucket_labels)} {count}")
+            lines.append(f"{self.prefix}{name}_sum{_labels(labels)} {_value(float(snapshot['sum']))}")
+            lines.append(f"{self.prefix}{name}_count{_labels(labels)} {snapshot['count']}")
+
+        described = dict(METRICS)
+        for collect in self._collectors:
+            for name, kind, help_text, labels, value in collect():
+                described.setdefault(name, (kind, help_text))
+                line = f"{self.prefix}{name}{_labels(tuple(sorted(labels.items())))} {_value(value)}"
+                families.setdefault(name, []).append(line)
+
+        out = []
+        for name, lines in families.items():
+            kind, help_text = described.get(name, ("untyped", ""))
+            out.append(f"# HELP {self.prefix}{name} {help_text}")
+            out.append(f"# TYPE {self.prefix}{name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
@@ -0,0 +1,140 @@
+"""
+Brain Trails - Model routing
+
+Every Groq call used to go to the 70B model, including a one-line chat
+question or five true/false questions that a small model answers several
+times faster. ``ModelRouter`` picks the model per request from a two-tier
+table:
+
+- a request goes to the small model when its prompt and requested question
+  count are within its task's limits, and to the large model otherwise;
+- each task has a latency SLO. When the large model's recent p95 for a task
+  is over it, the task's limits are stretched so more requests go small;
+- callers ``escalate()`` to the large model when small-model output fails
+  schema validation.
+
+Routing is opt-in (``MODEL_ROUTING=1``): by default, and for unknown tasks,
+everything goes to the large model.
+"""
+
+import json
+import os
+import threading
+import logging
+
+from hedging import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SMALL_MODEL = "llama-3.1-8b-instant"
+
+# Per task: small-model limits (prompt tokens, requested count) and the latency SLO in seconds.
+# Syllabi are long and deeply nested, so they always go to the large model; chat-history
+# summaries (see chat_sessions) are plain prose, so the small model takes fairly long ones.
+DEFAULT_ROUTES = {
+    "chat": {"max_input_tokens": 300, "max_count": None, "slo_seconds": 2.0},
+    "flashcard": {"max_input_tokens": 300, "max_count": 10, "slo_seconds": 4.0},
+    "quiz": {"max_input_tokens": 300, "max_count": 5, "slo_seconds": 6.0},
+    "syllabus": {"max_input_tokens": 0, "max_count": None, "slo_seconds": 15.0},
+    "summary": {"max_input_tokens": 2000, "max_count": None, "slo_seconds": 4.0},
+}
+
+
+class ModelRouter:
+    """Chooses between a small and a large Groq model per request."""
+
+    def __init__(self, large_model, small_model=DEFAULT_SMALL_MODEL, routes=None, enabled=True,
+                 slo_stretch=2.0, min_samples=20):
+        self.large_model = large_model
+        self.small_model = small_model or large_model
+        self.routes = {task: dict(rule) for task, rule in (routes or DEFAULT_ROUTES).items()}
+        self.enabled = enabled
+        self.slo_stretch = slo_stretch
+        self.min_samples = min_samples
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._stats = {"small": 0, "large": 0, "stretched": 0, "escalated": 0}
+
+    @classmethod
+    def from_env(cls, large_model):
+        """Build from MODEL_ROUTING, GROQ_SMALL_MODEL and MODEL_ROUTES (JSON overrides per task)."""
+        routes = {task: dict(rule) for task, rule in DEFAULT_ROUTES.items()}
+        overrides = os.getenv("MODEL_ROUTES", "").strip()
+        if overrides:
+            try:
+                for task, rule in json.loads(overrides).items():
+                    routes.setdefault(task, {"max_input_tokens": 0, "max_count": None, "slo_seconds": None})
+                    routes[task].update(rule)
+            except (ValueError, AttributeError) as e:
+                logger.warning(f"Model routing: ignoring invalid MODEL_ROUTES ({e})")
+        return cls(
+            large_model,
+            small_model=os.getenv("GROQ_SMALL_MODEL", DEFAULT_SMALL_MODEL),
+            routes=routes,
+            enabled=os.getenv("MODEL_ROUTING", "0").lower() in ("1", "true", "yes", "on"),
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def histogram(self, task, model):
+        with self._lock:
+            if (task, model) not in self.histograms:
+                self.histograms[(task, model)] = LatencyHistogram()
+            return self.histograms[(task, model)]
+
+    def observe(self, task, model, seconds):
+        """Record a successful call's latency (tasks outside the table are ignored)."""
+        if task in self.routes:
+            self.histogram(task, model).observe(seconds)
+
+    def over_slo(self, task):
+        """True when the large model's recent p95 for ``task`` exceeds the task's SLO."""
+        slo = self.routes.get(task, {}).get("slo_seconds")
+        hist = self.histogram(task, self.large_model)
+        if not slo or hist.count < self.min_samples:
+            return False
+        return hist.quantile(0.95) > slo
+
+    def route(self, task, input_tokens, count=None):
+        """Model for one request of ``task`` with a ``input_tokens`` prompt asking for ``count`` items."""
+        rule = self.routes.get(task)
+        if not self.enabled or rule is None or self.small_model == self.large_model:
+            return self.large_model
+        stretch = 1.0
+        if self.over_slo(task):
+            stretch = self.slo_stretch
+            self._count("stretched")
+        max_count = rule.get("max_count")
+        fits = input_tokens <= (rule.get("max_input_tokens") or 0) * stretch and (
+            count is None or max_count is None or count <= max_count * stretch
+        )
+        self._count("small" if fits else "large")
+        return self.small_model if fits else self.large_model
+
+    def escalate(self, model):
+        """The model to retry with after ``model``'s output failed validation, or None."""
+        if model != self.small_model or self.small_model == self.large_model:
+            return None
+        self._count("escalated")
+        return self.large_model
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            histograms = dict(self.histograms)
+        latency = {}
+        for (task, model), hist in sorted(histograms.items()):
+            p95 = hist.quantile(0.95)
+            latency.setdefault(task, {})[model] = {
+                "count": hist.count, "p95": round(p95, 3) if p95 is not None else None,
+            }
+        return {
+            "enabled": self.enabled,
+            "small_model": self.small_model,
+            "large_model": self.large_model,
+            "routes": self.routes,
+            "latency": latency,
+            **stats,
+        }
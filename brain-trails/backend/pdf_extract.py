@@ -0,0 +1,173 @@
+"""
+Brain Trails - PDF text extraction for syllabus uploads
+
+Only the first few thousand characters of a syllabus reach the model, so
+pages are extracted lazily and extraction stops once the character budget is
+met. Size and page-count limits are checked before any page content is
+decoded. Large documents can fan pages out to a process pool (pypdf text
+extraction is CPU-bound and holds the GIL); workers open the PDF from a temp
+file so the bytes are not pickled once per page. Extraction stops with
+``deadlines.DeadlineExceeded`` once the request's deadline has passed.
+"""
+
+import io
+import os
+import time
+import tempfile
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import deadlines
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class PDFLimitError(ValueError):
+    """The upload exceeds the configured size or page limits."""
+
+
+class PDFExtractionError(ValueError):
+    """The upload could not be read as a PDF."""
+
+
+def base64_decoded_size(data):
+    """Exact decoded length of a base64 string, without decoding it."""
+    data = data.rstrip()
+    return len(data) * 3 // 4 - (len(data) - len(data.rstrip("=")))
+
+
+class PDFExtractor:
+    """Budgeted, optionally page-parallel text extraction with pypdf."""
+
+    def __init__(self, max_bytes=10 * 1024 * 1024, max_document_pages=300, max_pages=40,
+                 char_budget=6000, workers=0, parallel_min_pages=4):
+        self.max_bytes = max_bytes
+        self.max_document_pages = max_document_pages
+        self.max_pages = max_pages
+        self.char_budget = char_budget
+        self.workers = workers
+        self.parallel_min_pages = parallel_min_pages
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @classmethod
+    def from_env(cls):
+        """Build from PDF_* env vars (process pool disabled unless PDF_EXTRACT_WORKERS > 1)."""
+        return cls(
+            max_bytes=int(os.getenv("PDF_MAX_BYTES", 10 * 1024 * 1024)),
+            max_document_pages=int(os.getenv("PDF_MAX_DOCUMENT_PAGES", 300)),
+            max_pages=int(os.getenv("PDF_MAX_PAGES", 40)),
+            workers=int(os.getenv("PDF_EXTRACT_WORKERS", 0)),
+        )
+
+    def check_size(self, size):
+        if size is not None and size > self.max_bytes:
+            raise PDFLimitError(f"File is {size // 1024} KB; the limit is {self.max_bytes // 1024} KB")
+
+    def extract(self, raw_bytes, char_budget=None):
+        """Extract text until ``char_budget`` characters are collected.
+
+        Returns ``(text, pages_read, page_count)``. Raises ``PDFLimitError``
+        or ``PDFExtractionError``.
+        """
+        from pypdf import PdfReader
+
+        self.check_size(len(raw_bytes))
+        budget = char_budget or self.char_budget
+        try:
+            reader = PdfReader(io.BytesIO(raw_bytes))
+            page_count = len(reader.pages)
+        except Exception as e:
+            raise PDFExtractionError(str(e)) from e
+        if page_count > self.max_document_pages:
+            raise PDFLimitError(f"PDF has {page_count} pages; the limit is {self.max_document_pages}")
+
+        to_read = min(page_count, self.max_pages)
+        started = time.perf_counter()
+        if self.workers > 1 and to_read >= self.parallel_min_pages:
+            parts = self._extract_parallel(raw_bytes, to_read, budget)
+        else:
+            parts = self._extract_serial(reader, to_read, budget)
+        logger.info(
+            f"PDF extraction: {len(parts)}/{page_count} pages, {sum(len(p) for p in parts)} chars "
+            f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        return "\n".join(parts), len(parts), page_count
+
+    def _extract_serial(self, reader, to_read, budget):
+        parts, total = [], 0
+        for index in range(to_read):
+            deadlines.check("pdf_extract")
+            started = time.perf_counter()
+            try:
+                text = reader.pages[index].extract_text() or ""
+            except Exception as e:
+                raise PDFExtractionError(f"page {index + 1}: {e}") from e
+            _log_page(index, to_read, text, time.perf_counter() - started)
+            parts.append(text)
+            total += len(text) + 1
+            if total >= budget:
+                break
+        return parts
+
+    def _extract_parallel(self, raw_bytes, to_read, budget):
+        """Extract pages in windows of ``workers`` pages, stopping after the window that fills the budget."""
+        pool = self._pool()
+        parts, total = [], 0
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+            tmp.write(raw_bytes)
+            tmp.flush()
+            for window_start in range(0, to_read, self.workers):
+                indices = range(window_start, min(window_start + self.workers, to_read))
+                futures = [pool.submit(_extract_page, tmp.name, index) for index in indices]
+                for index, future in zip(indices, futures):
+                    seconds_left = deadlines.remaining("pdf_extract")
+                    try:
+                        text, elapsed = future.result(timeout=seconds_left)
+                    except FutureTimeout:
+                        for pending in futures:
+                            pending.cancel()
+                        raise deadlines.DeadlineExceeded(deadlines.current().seconds, "pdf_extract")
+                    except Exception as e:
+                        raise PDFExtractionError(f"page {index + 1}: {e}") from e
+                    _log_page(index, to_read, text, elapsed)
+                    parts.append(text)
+                    total += len(text) + 1
+                if total >= budget:
+                    break
+        return parts
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+def _log_page(index, to_read, text, elapsed):
+    tracing.record("pdf_page", elapsed, page=index + 1, chars=len(text))
+    logger.info(f"PDF extraction: page {index + 1}/{to_read} took {elapsed * 1000:.1f}ms ({len(text)} chars)")
+
+
+# Per-process reader cache so a worker parses each temp file's xref once
+_worker_reader = {}
+
+
+def _extract_page(path, index):
+    from pypdf import PdfReader
+
+    started = time.perf_counter()
+    key = (path, os.stat(path).st_mtime_ns)
+    if key not in _worker_reader:
+        _worker_reader.clear()
+        _worker_reader[key] = PdfReader(path)
+    text = _worker_reader[key].pages[index].extract_text() or ""
+    return text, time.perf_counter() - started
@@ -0,0 +1,154 @@
+"""
+Brain Trails - Token-budgeted prompt assembly
+
+Prompts used to slice their context at fixed character counts (notes at
+3000, quiz content at 4000), whatever the model or the output size. Here
+the context gets whatever is left of the model's input budget once the
+system prompt, the rest of the prompt and the requested output are
+reserved, and it is compressed before anything is cut:
+
+- whitespace runs, decorative rules, page numbers and running
+  headers/footers (short lines repeated three or more times) are dropped;
+- only then is the text truncated, at a paragraph or line boundary.
+
+``count_tokens`` approximates the Llama 3 / Gemini BPE tokenizers locally
+(words, 3-digit number groups, punctuation and whitespace runs) and errs
+on the high side.
+"""
+
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# (context window, max output tokens) per model
+MODEL_LIMITS = {
+    "llama-3.3-70b-versatile": (131072, 32768),
+    "llama-3.1-8b-instant": (131072, 131072),
+    "gemini-2.0-flash": (1048576, 8192),
+}
+DEFAULT_LIMITS = (8192, 2048)
+
+TRUNCATION_MARKER = "\n[... truncated]"
+
+_PIECES = re.compile(r"[A-Za-z]+|\d{1,3}|\s{2,}|\n|[^\sA-Za-z\d]")
+_RULE = re.compile(r"^[\s\-=_*~#.·•|+]{3,}$")
+_PAGE_NUMBER = re.compile(r"^(page\s+)?\d{1,4}(\s*(of|/)\s*\d{1,4})?$", re.IGNORECASE)
+_SPACES = re.compile(r"[ \t\u00a0]{2,}")
+_INVISIBLE = re.compile("[\u200b\u200c\u200d\ufeff]")
+
+
+def count_tokens(text):
+    """Approximate token count of ``text``."""
+    count = 0
+    for piece in _PIECES.findall(text or ""):
+        count += 1 + (len(piece) - 1) // 8 if piece[0].isalpha() else 1
+    return count
+
+
+def compress(text):
+    """Drop low-information whitespace and boilerplate, keeping the line structure."""
+    text = _INVISIBLE.sub("", (text or "").replace("\r\n", "\n").replace("\r", "\n"))
+    lines = []
+    for line in text.split("\n"):
+        stripped = line.strip()
+        indent = line[:len(line) - len(line.lstrip())].replace("\t", "  ")[:8]
+        lines.append(indent + _SPACES.sub(" ", stripped) if stripped else "")
+
+    repeats = Counter(line.strip() for line in lines if len(line.strip()) >= 12)
+    kept, seen = [], set()
+    for line in lines:
+        stripped = line.strip()
+        if stripped and (_RULE.match(stripped) or _PAGE_NUMBER.match(stripped)):
+            continue
+        if repeats.get(stripped, 0) >= 3 and len(stripped) <= 80:
+            # Running header/footer: keep its first occurrence only
+            if stripped in seen:
+                continue
+            seen.add(stripped)
+        if not stripped and (not kept or not kept[-1]):
+            continue
+        kept.append(line)
+    return "\n".join(kept).strip()
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut ``text`` to about ``max_tokens``, preferring a paragraph, line or sentence boundary."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    # Estimate the cut position from the text's own chars-per-token ratio, then walk back
+    end = int(len(text) * max_tokens / count_tokens(text))
+    while end > 0 and count_tokens(text[:end]) > max_tokens:
+        end = int(end * 0.9)
+    head = text[:end]
+    for boundary in ("\n\n", "\n", ". "):
+        cut = head.rfind(boundary)
+        if cut >= end * 0.8:
+            head = head[:cut + (1 if boundary == ". " else 0)]
+            break
+    return head.rstrip() + TRUNCATION_MARKER
+
+
+class PromptBudget:
+    """Splits one model's token budget between system prompt, context and output."""
+
+    def __init__(self, model, context_window, max_input_tokens=6000, max_output_tokens=8192):
+        self.model = model
+        self.context_window = context_window
+        self.max_input_tokens = min(max_input_tokens, context_window)
+        self.max_output_tokens = max_output_tokens
+        self._lock = threading.Lock()
+        self._stats = {"prompts": 0, "compressed_tokens_saved": 0, "truncated": 0, "truncated_tokens": 0}
+
+    @classmethod
+    def for_model(cls, model):
+        """Budget for ``model``; PROMPT_MAX_INPUT_TOKENS caps the prompt size (default 6000)."""
+        context_window, max_output = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+        return cls(
+            model, context_window,
+            max_input_tokens=int(os.getenv("PROMPT_MAX_INPUT_TOKENS", 6000)),
+            max_output_tokens=max_output,
+        )
+
+    def output_tokens(self, wanted):
+        """Clamp a requested ``max_tokens`` to what the model can produce."""
+        return max(1, min(int(wanted), self.max_output_tokens))
+
+    def context_tokens(self, system_prompt, frame, max_output):
+        """Tokens left for context once the system prompt, the prompt frame and the output are reserved."""
+        reserved = count_tokens(system_prompt) + count_tokens(frame)
+        available = min(self.max_input_tokens, self.context_window - self.output_tokens(max_output))
+        return max(available - reserved, 0)
+
+    def fit(self, context, system_prompt, frame, max_output, limit=None):
+        """Compress ``context`` and truncate it to the tokens ``frame`` and ``max_output`` leave (at most ``limit``)."""
+        if not context:
+            return ""
+        before = count_tokens(context)
+        compressed = compress(context)
+        after = count_tokens(compressed)
+        available = self.context_tokens(system_prompt, frame, max_output)
+        fitted = truncate_to_tokens(compressed, available if limit is None else min(available, limit))
+        with self._lock:
+            self._stats["prompts"] += 1
+            self._stats["compressed_tokens_saved"] += before - after
+            if fitted != compressed:
+                self._stats["truncated"] += 1
+                self._stats["truncated_tokens"] += after - count_tokens(fitted)
+        return fitted
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update(
+            model=self.model, max_input_tokens=self.max_input_tokens, max_output_tokens=self.max_output_tokens,
+        )
+        return snapshot
+
+
+def scaled_output_tokens(items, per_item, overhead=50, headroom=1.25, floor=300):
+    """Output budget for ``items`` generated pieces of about ``per_item`` tokens each."""
+    return max(floor, int(math.ceil((items * per_item + overhead) * headroom)))
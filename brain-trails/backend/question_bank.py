@@ -0,0 +1,395 @@
+"""
+Brain Trails - Question bank
+
+Quiz and flashcard requests for popular subject/topic pairs (no pasted
+content) are answered from a local bank of previously generated questions
+instead of a synchronous LLM call:
+
+- questions are indexed by normalized subject, topic, difficulty and kind
+  (the question type, or ``flashcard``); a request is served when the bank
+  holds ``count`` questions of the requested kinds that the client hasn't
+  been served before;
+- every live generation feeds the bank, so misses fill it;
+- demand is counted per subject/topic/difficulty/kind, and a background
+  thread refills the most requested low-stock topics while the worker is
+  idle, at most one topic per ``refill_interval``.
+
+The bank is a SQLite file shared by every gunicorn worker. A refill claims
+its topic in the file first, so two workers never refill the same topic at
+once.
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+import logging
+from collections import Counter
+
+from quiz_topup import QUESTION_TOKENS, requested_count
+
+logger = logging.getLogger(__name__)
+
+QUESTION_KINDS = tuple(kind for kind in QUESTION_TOKENS if kind != "flashcard")
+
+
+def normalize(text):
+    """Lower-case ``text`` and collapse whitespace, so 'Cell  Biology' and 'cell biology' share a bank."""
+    return " ".join(str(text or "").lower().split())
+
+
+def bank_keys(data):
+    """``(subject, topic, difficulty, kind)`` keys a request draws from, or [] if it can't use the bank.
+
+    Requests with study content are specific to that content and never bankable.
+    """
+    subject = normalize(data.get("subject"))
+    if not subject or str(data.get("content") or "").strip():
+        return []
+    topic = normalize(data.get("topic"))
+    if data.get("type") == "flashcard":
+        # The flashcard prompt has no difficulty
+        return [(subject, topic, "", "flashcard")]
+    kinds = data.get("question_types") or ["mcq"]
+    if not isinstance(kinds, list) or any(kind not in QUESTION_KINDS for kind in kinds):
+        return []
+    difficulty = normalize(data.get("difficulty") or "medium")
+    return [(subject, topic, difficulty, kind) for kind in sorted(set(kinds))]
+
+
+def _kind(question, flashcard):
+    return "flashcard" if flashcard else question.get("type")
+
+
+def _fingerprint(question):
+    return normalize("".join(ch if ch.isalnum() else " " for ch in str(question.get("question", ""))))
+
+
+class QuestionBank:
+    """SQLite-backed bank of generated questions with demand-driven background refill."""
+
+    def __init__(self, path, enabled=True, target_stock=30, batch_size=10, max_per_topic=200, min_demand=3,
+                 refill_interval=30.0, claim_seconds=120.0, seen_ttl=7 * 86400, clock=time.time):
+        self.path = path
+        self.enabled = enabled
+        self.target_stock = target_stock
+        self.batch_size = batch_size
+        self.max_per_topic = max_per_topic
+        self.min_demand = min_demand
+        self.refill_interval = refill_interval
+        self.claim_seconds = claim_seconds
+        self.seen_ttl = seen_ttl
+        self._clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generate = None
+        self._is_idle = None
+        self._worker = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._stats = {"hits": 0, "misses": 0, "served": 0, "added": 0, "refills": 0, "refill_errors": 0}
+        if enabled:
+            self._create()
+
+    @classmethod
+    def from_env(cls):
+        """Build from QUESTION_BANK* env vars: off unless QUESTION_BANK=1, which requires QUESTION_BANK_PATH."""
+        enabled = os.getenv("QUESTION_BANK", "0").lower() in ("1", "true", "yes", "on")
+        path = os.getenv("QUESTION_BANK_PATH")
+        if enabled and not path:
+            raise ValueError("QUESTION_BANK=1 requires QUESTION_BANK_PATH")
+        return cls(
+            path,
+            enabled=enabled,
+            target_stock=int(os.getenv("QUESTION_BANK_TARGET_STOCK", 30)),
+            batch_size=int(os.getenv("QUESTION_BANK_REFILL_BATCH", 10)),
+            max_per_topic=int(os.getenv("QUESTION_BANK_MAX_PER_TOPIC", 200)),
+            min_demand=int(os.getenv("QUESTION_BANK_MIN_DEMAND", 3)),
+            refill_interval=float(os.getenv("QUESTION_BANK_REFILL_INTERVAL", 30)),
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork (gunicorn --preload) must not be reused
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create(self):
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                " id INTEGER PRIMARY KEY,"
+                " subject TEXT NOT NULL, topic TEXT NOT NULL, difficulty TEXT NOT NULL, kind TEXT NOT NULL,"
+                " fingerprint TEXT NOT NULL,"
+                " question TEXT NOT NULL,"
+                " model TEXT,"
+                " created_at REAL NOT NULL,"
+                " UNIQUE (subject, topic, difficulty, kind, fingerprint))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen ("
+                " client TEXT NOT NULL, question_id INTEGER NOT NULL, seen_at REAL NOT NULL,"
+                " PRIMARY KEY (client, question_id))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS demand ("
+                " subject TEXT NOT NULL, topic TEXT NOT NULL, difficulty TEXT NOT NULL, kind TEXT NOT NULL,"
+                " requests INTEGER NOT NULL DEFAULT 0,"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " last_requested REAL NOT NULL,"
+                " refill_after REAL NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (subject, topic, difficulty, kind))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS seen_at ON seen (seen_at)")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    # ─── Serving ───────────────────────────────────────────────
+
+    def take(self, data, client=None):
+        """Serve ``data`` from the bank: ``(questions, model)``, or None to fall through to live generation.
+
+        Questions already served to ``client`` are skipped. The request is
+        counted as demand either way.
+        """
+        keys = bank_keys(data) if self.enabled else []
+        if not keys:
+            return None
+        self._ensure_worker()
+        try:
+            return self._take(keys, requested_count(data), client)
+        except sqlite3.Error as e:
+            logger.warning(f"Question bank: lookup failed: {str(e)}")
+            return None
+
+    def _take(self, keys, count, client):
+        conn = self._connect()
+        now = self._clock()
+        for key in keys:
+            conn.execute(
+                "INSERT INTO demand (subject, topic, difficulty, kind, requests, last_requested)"
+                " VALUES (?, ?, ?, ?, 1, ?)"
+                " ON CONFLICT (subject, topic, difficulty, kind) DO UPDATE"
+                " SET requests = requests + 1, last_requested = excluded.last_requested",
+                (*key, now),
+            )
+
+        pools = []
+        for key in keys:
+            pools.append(conn.execute(
+                "SELECT id, question, model FROM questions q"
+                " WHERE subject = ? AND topic = ? AND difficulty = ? AND kind = ?"
+                " AND NOT EXISTS (SELECT 1 FROM seen s WHERE s.client = ? AND s.question_id = q.id)"
+                " ORDER BY RANDOM() LIMIT ?",
+                (*key, client or "", count),
+            ).fetchall())
+        # Spread the requested count evenly over the requested kinds
+        picked = []
+        while len(picked) < count and any(pools):
+            for pool in pools:
+                if pool and len(picked) < count:
+                    picked.append(pool.pop())
+        if len(picked) < count:
+            self._count("misses")
+            return None
+
+        if client:
+            conn.executemany(
+                "INSERT OR IGNORE INTO seen (client, question_id, seen_at) VALUES (?, ?, ?)",
+                [(client, row[0], now) for row in picked],
+            )
+        for key in keys:
+            conn.execute(
+                "UPDATE demand SET hits = hits + 1"
+                " WHERE subject = ? AND topic = ? AND difficulty = ? AND kind = ?",
+                key,
+            )
+        self._count("hits")
+        self._count("served", len(picked))
+        random.shuffle(picked)
+        model = Counter(row[2] for row in picked).most_common(1)[0][0]
+        return [json.loads(row[1]) for row in picked], model
+
+    def exhausted(self, data, client):
+        """True when the bank is stocked for ``data`` but ``client`` has already been served too much of it.
+
+        Such a client has most likely seen the cached quiz for ``data`` too.
+        """
+        keys = bank_keys(data) if self.enabled and client else []
+        if not keys:
+            return False
+        try:
+            conn = self._connect()
+            stocked = unseen = 0
+            for key in keys:
+                stocked += self.stock(key)
+                unseen += conn.execute(
+                    "SELECT COUNT(*) FROM questions q"
+                    " WHERE subject = ? AND topic = ? AND difficulty = ? AND kind = ?"
+                    " AND NOT EXISTS (SELECT 1 FROM seen s WHERE s.client = ? AND s.question_id = q.id)",
+                    (*key, client),
+                ).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Question bank: lookup failed: {str(e)}")
+            return False
+        count = requested_count(data)
+        return stocked >= count and unseen < count
+
+    def add(self, data, questions, model, client=None):
+        """Bank validated ``questions`` generated for ``data``; returns how many were new.
+
+        ``client`` has just been served them, so they are marked as seen for it.
+        """
+        keys = {key[3]: key for key in bank_keys(data)} if self.enabled else {}
+        if not keys or not questions:
+            return 0
+        try:
+            added = self._add(keys, data.get("type") == "flashcard", questions, model, client)
+        except sqlite3.Error as e:
+            logger.warning(f"Question bank: store failed: {str(e)}")
+            return 0
+        self._count("added", added)
+        return added
+
+    def _add(self, keys, flashcard, questions, model, client):
+        conn = self._connect()
+        now = self._clock()
+        added = 0
+        for question in questions:
+            key = keys.get(_kind(question, flashcard))
+            if key is None:
+                continue
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO questions"
+                " (subject, topic, difficulty, kind, fingerprint, question, model, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, _fingerprint(question), json.dumps(question), model, now),
+            )
+            added += cursor.rowcount
+            if client:
+                conn.execute(
+                    "INSERT OR IGNORE INTO seen (client, question_id, seen_at)"
+                    " SELECT ?, id, ? FROM questions"
+                    " WHERE subject = ? AND topic = ? AND difficulty = ? AND kind = ? AND fingerprint = ?",
+                    (client, now, *key, _fingerprint(question)),
+                )
+        for key in keys.values():
+            conn.execute(
+                "DELETE FROM questions WHERE id IN ("
+                " SELECT id FROM questions WHERE subject = ? AND topic = ? AND difficulty = ? AND kind = ?"
+                " ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (*key, self.max_per_topic),
+            )
+        conn.execute("DELETE FROM seen WHERE seen_at <= ?", (now - self.seen_ttl,))
+        return added
+
+    def stock(self, key):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM questions WHERE subject = ? AND topic = ? AND difficulty = ? AND kind = ?", key,
+        ).fetchone()[0]
+
+    # ─── Background refill ─────────────────────────────────────
+
+    def set_refill(self, generate, is_idle=None):
+        """Refill low-stock topics with ``generate(data, existing) -> (questions, model)``.
+
+        ``data`` is a quiz request body for one topic and kind, ``existing`` a
+        sample of banked questions to avoid repeating. Refills only run while
+        ``is_idle()`` is true.
+        """
+        self._generate = generate
+        self._is_idle = is_idle
+
+    def _ensure_worker(self):
+        # Started on first use and again after a fork; threads don't survive fork
+        if self._generate is None or self.refill_interval <= 0:
+            return
+        with self._lock:
+            if self._worker is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="question-bank", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.refill_interval):
+            if self._is_idle is not None and not self._is_idle():
+                continue
+            try:
+                self.refill_once()
+            except Exception:
+                logger.exception("Question bank: refill failed")
+                self._count("refill_errors")
+
+    def _claim(self):
+        """Claim the most requested low-stock topic for this refill, or return None."""
+        conn = self._connect()
+        now = self._clock()
+        candidates = conn.execute(
+            "SELECT subject, topic, difficulty, kind FROM demand d"
+            " WHERE requests >= ? AND refill_after <= ?"
+            " AND (SELECT COUNT(*) FROM questions q WHERE q.subject = d.subject AND q.topic = d.topic"
+            "      AND q.difficulty = d.difficulty AND q.kind = d.kind) < ?"
+            " ORDER BY requests DESC, last_requested DESC LIMIT 5",
+            (self.min_demand, now, self.target_stock),
+        ).fetchall()
+        for key in candidates:
+            # Another worker may have claimed it since the SELECT
+            claimed = conn.execute(
+                "UPDATE demand SET refill_after = ?"
+                " WHERE subject = ? AND topic = ? AND difficulty = ? AND kind = ? AND refill_after <= ?",
+                (now + self.claim_seconds, *key, now),
+            ).rowcount
+            if claimed:
+                return tuple(key)
+        return None
+
+    def refill_once(self):
+        """Refill one topic; returns ``(key, added)``, or None if no topic needs it."""
+        if self._generate is None:
+            return None
+        key = self._claim()
+        if key is None:
+            return None
+        subject, topic, difficulty, kind = key
+        data = {"subject": subject, "topic": topic, "count": self.batch_size}
+        if kind == "flashcard":
+            data["type"] = "flashcard"
+        else:
+            data.update(type="quiz", difficulty=difficulty, question_types=[kind])
+        rows = self._connect().execute(
+            "SELECT question FROM questions WHERE subject = ? AND topic = ? AND difficulty = ? AND kind = ?"
+            " ORDER BY RANDOM() LIMIT 20",
+            key,
+        ).fetchall()
+        questions, model = self._generate(data, [json.loads(row[0]) for row in rows])
+        added = self.add(data, questions or [], model)
+        self._count("refills")
+        logger.info(f"Question bank: refilled {subject}/{topic or '-'}/{kind} with {added} new questions")
+        return key, added
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update(enabled=self.enabled, target_stock=self.target_stock)
+        if not self.enabled:
+            return snapshot
+        try:
+            conn = self._connect()
+            snapshot["questions"] = conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+            snapshot["topics"] = conn.execute("SELECT COUNT(*) FROM demand").fetchone()[0]
+        except Exception:
+            snapshot["questions"] = snapshot["topics"] = None
+        return snapshot
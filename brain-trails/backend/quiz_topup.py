@@ -0,0 +1,149 @@
+"""
+Brain Trails - Quiz count validation and partial regeneration
+
+The quiz prompt asks for an exact count, but models regularly return fewer
+usable questions (or the wrong types). Instead of the client re-requesting
+the whole quiz, the backend asks for just the missing questions, with the
+existing ones listed so they aren't repeated, as long as the request is
+still inside its latency budget.
+
+Token counts are estimated with ``prompt_budget.count_tokens`` to size each
+generation's ``max_tokens`` and to report what top-ups save compared with
+regenerating the full quiz.
+"""
+
+import os
+import re
+import threading
+
+from prompt_budget import count_tokens, scaled_output_tokens
+
+# Rough output tokens per generated item, by question type
+QUESTION_TOKENS = {"flashcard": 60, "mcq": 110, "true_false": 60, "fill_blank": 70, "short_answer": 90}
+
+
+def estimate_tokens(text):
+    return max(1, count_tokens(text))
+
+
+def requested_count(data, default=10, limit=50):
+    try:
+        count = int(data.get("count", data.get("num_questions", default)))
+    except (TypeError, ValueError):
+        count = default
+    return min(max(count, 1), limit)
+
+
+def requested_types(data):
+    """Question types the request allows, or None for flashcards / no restriction."""
+    if data.get("type") == "flashcard":
+        return None
+    types = data.get("question_types")
+    return set(types) if isinstance(types, list) and types else None
+
+
+def output_tokens(data):
+    """``max_tokens`` for a full quiz: the requested count at its largest question type's size."""
+    if data.get("type") == "flashcard":
+        per_question = QUESTION_TOKENS["flashcard"]
+    else:
+        types = requested_types(data) or {"mcq"}
+        per_question = max(QUESTION_TOKENS.get(t, QUESTION_TOKENS["mcq"]) for t in types)
+    return scaled_output_tokens(requested_count(data), per_question)
+
+
+def _key(question):
+    return re.sub(r"[^a-z0-9]+", " ", str(question.get("question", "")).lower()).strip()
+
+
+class QuizTopup:
+    """Fits questions to the requested count/types and plans follow-up generations."""
+
+    def __init__(self, budget_seconds=10.0, max_rounds=1):
+        self.budget_seconds = budget_seconds
+        self.max_rounds = max_rounds
+        self._lock = threading.Lock()
+        self._stats = {
+            "checked": 0, "short": 0, "topups": 0, "recovered": 0,
+            "still_short": 0, "skipped_budget": 0, "tokens_spent": 0, "tokens_saved": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Build from QUIZ_TOPUP_* env vars (QUIZ_TOPUP_ROUNDS=0 disables top-ups)."""
+        return cls(
+            budget_seconds=float(os.getenv("QUIZ_TOPUP_BUDGET_SECONDS", 10)),
+            max_rounds=int(os.getenv("QUIZ_TOPUP_ROUNDS", 1)),
+        )
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def fit(self, questions, data):
+        """Drop wrong-type and duplicate questions and trim to the requested count."""
+        allowed = requested_types(data)
+        fitted, seen = [], set()
+        for question in questions:
+            if allowed and question.get("type") not in allowed:
+                continue
+            if _key(question) in seen:
+                continue
+            seen.add(_key(question))
+            fitted.append(question)
+        return fitted[:requested_count(data)]
+
+    def missing(self, questions, data):
+        return max(requested_count(data) - len(questions), 0)
+
+    def should_top_up(self, questions, data, elapsed, rounds_done):
+        missing = self.missing(questions, data)
+        if rounds_done == 0:
+            self._count("checked")
+            if missing:
+                self._count("short")
+        if not missing or rounds_done >= self.max_rounds:
+            return False
+        if elapsed >= self.budget_seconds:
+            self._count("skipped_budget")
+            return False
+        return True
+
+    def prompt(self, user_prompt, questions, missing):
+        existing = "\n".join(f"- {q.get('question', '')}" for q in questions)
+        return (
+            f"{user_prompt}\n\n"
+            f"Only {missing} more question(s) are needed. Generate exactly {missing}, "
+            f"and do not repeat or rephrase any of these existing questions:\n{existing}\n"
+            'Return JSON: {"questions": [...]}'
+        )
+
+    def max_tokens(self, first_text, questions, missing, ceiling=3000):
+        """Output budget for ``missing`` questions, scaled from the first response's per-question size."""
+        per_question = estimate_tokens(first_text) / max(len(questions), 1)
+        return int(min(ceiling, max(400, per_question * missing * 1.5)))
+
+    def merge(self, questions, extra, data):
+        return self.fit(questions + list(extra or []), data)
+
+    def record(self, data, system_prompt, user_prompt, first_text, first_count, topup_prompt, topup_text,
+               before, after):
+        """Account one top-up round: tokens spent on it vs. a full regeneration."""
+        per_question = estimate_tokens(first_text) / max(first_count, 1)
+        full = estimate_tokens(system_prompt + user_prompt) + per_question * requested_count(data)
+        spent = estimate_tokens(system_prompt + topup_prompt) + estimate_tokens(topup_text)
+        self._count("topups")
+        self._count("recovered", max(after - before, 0))
+        self._count("tokens_spent", spent)
+        self._count("tokens_saved", int(full - spent))
+
+    def finish(self, questions, data):
+        if self.missing(questions, data):
+            self._count("still_short")
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["budget_seconds"] = self.budget_seconds
+        snapshot["max_rounds"] = self.max_rounds
+        return snapshot
@@ -0,0 +1,215 @@
+"""
+Brain Trails - AI response cache
+
+Content-addressed cache for expensive LLM generations. Entries are keyed by a
+hash of everything that determines the completion (system prompt, normalized
+user prompt, model, temperature, max_tokens) and expire after a TTL, with LRU
+eviction once the cache is full.
+
+Two backends are available:
+- ``MemoryCacheBackend``: per-process OrderedDict, the default
+- ``SQLiteCacheBackend``: a local SQLite file shared by every gunicorn worker
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(text):
+    """Collapse whitespace so trivially different prompts share a cache entry."""
+    return " ".join((text or "").split())
+
+
+def make_cache_key(system_prompt, user_prompt, model, temperature, max_tokens):
+    """Stable SHA-256 fingerprint of a generation request."""
+    material = json.dumps(
+        [system_prompt, normalize_prompt(user_prompt), model, float(temperature), int(max_tokens)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU + TTL store. Values are JSON strings."""
+
+    def __init__(self, max_entries=1000, clock=time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return ``(value, expired)``; ``expired`` counts entries dropped by TTL."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, 0
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None, 1
+            self._entries.move_to_end(key)
+            return value, 0
+
+    def set(self, key, value, ttl):
+        """Store ``value`` and return how many entries were evicted to make room."""
+        with self._lock:
+            self._entries[key] = (value, self._clock() + ttl)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """LRU + TTL store in a SQLite file, safe to share between processes."""
+
+    def __init__(self, path, max_entries=1000, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self._clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ai_cache_last_access ON ai_cache (last_access)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork (gunicorn --preload) must not be reused
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Return ``(value, expired)``; ``expired`` counts entries dropped by TTL."""
+        conn = self._connect()
+        now = self._clock()
+        row = conn.execute("SELECT value, expires_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, 0
+        if row[1] <= now:
+            conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+            return None, 1
+        conn.execute("UPDATE ai_cache SET last_access = ? WHERE key = ?", (now, key))
+        return row[0], 0
+
+    def set(self, key, value, ttl):
+        """Store ``value`` and return how many entries were evicted to make room."""
+        conn = self._connect()
+        now = self._clock()
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, value, now + ttl, now),
+        )
+        evicted = conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (now,)).rowcount
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            evicted += conn.execute(
+                "DELETE FROM ai_cache WHERE key IN ("
+                " SELECT key FROM ai_cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+        return evicted
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """Front-end over a cache backend that serializes payloads and counts hits."""
+
+    def __init__(self, backend, ttl=86400.0, enabled=True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from AI_CACHE_* environment variables."""
+        kind = os.getenv("AI_CACHE_BACKEND", "memory").lower()
+        max_entries = int(os.getenv("AI_CACHE_MAX_ENTRIES", 1000))
+        ttl = float(os.getenv("AI_CACHE_TTL", 86400))
+        if kind == "sqlite":
+            path = os.getenv("AI_CACHE_PATH") or os.path.join(tempfile.gettempdir(), "brain_trails_ai_cache.sqlite3")
+            backend = SQLiteCacheBackend(path, max_entries=max_entries)
+        else:
+            backend = MemoryCacheBackend(max_entries=max_entries)
+        return cls(backend, ttl=ttl, enabled=kind not in ("off", "none", "disabled"))
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def key(self, system_prompt, user_prompt, model, temperature, max_tokens):
+        return make_cache_key(system_prompt, user_prompt, model, temperature, max_tokens)
+
+    def get(self, key):
+        """Return the cached payload for ``key`` or None on a miss."""
+        if not self.enabled:
+            return None
+        try:
+            value, expired = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"AI cache: lookup failed: {str(e)}")
+            self._count("errors")
+            return None
+        if expired:
+            self._count("evictions", expired)
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(value)
+
+    def set(self, key, payload, ttl=None):
+        """Store a JSON-serializable payload. Failures are logged, never raised."""
+        if not self.enabled:
+            return
+        try:
+            evicted = self.backend.set(key, json.dumps(payload), ttl or self.ttl)
+        except Exception as e:
+            logger.warning(f"AI cache: store failed: {str(e)}")
+            self._count("errors")
+            return
+        self._count("stores")
+        if evicted:
+            self._count("evictions", evicted)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_ratio"] = round(snapshot["hits"] / lookups, 3) if lookups else 0.0
+        snapshot["backend"] = type(self.backend).__name__
+        snapshot["enabled"] = self.enabled
+        try:
+            snapshot["entries"] = len(self.backend)
+        except Exception:
+            snapshot["entries"] = None
+        return snapshot
@@ -0,0 +1,179 @@
+"""
+Brain Trails - BM25 retrieval over long notes
+
+When a note doesn't fit the chat prompt's token budget, sending only its
+beginning leaves questions about the rest unanswerable. Instead the note is
+split into paragraph-sized chunks, the chunks are ranked against the
+question with BM25, and the best ones are packed into the budget in their
+original order (the note's opening chunk is kept for orientation).
+
+Chunk indexes are cached per note hash (LRU), so follow-up questions about
+the same note skip re-indexing.
+"""
+
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from prompt_budget import compress, count_tokens
+
+GAP_MARKER = "\n[...]\n"
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i in is it its me my of on or so that the their "
+    "them then there these this to was what when where which who why will with you your".split()
+)
+
+
+def terms(text):
+    """Lowercased, stopword-free terms with a light plural strip ("cells" -> "cell")."""
+    words = (w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS)
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words]
+
+
+def split_chunks(text, chunk_tokens=200):
+    """Pack paragraphs (or, for long paragraphs, sentences) into chunks of about ``chunk_tokens``."""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= chunk_tokens:
+            pieces.append(("\n\n", paragraph))
+        else:
+            sentences = [s for s in _SENTENCE_END.split(paragraph) if s.strip()]
+            pieces.extend(("\n\n" if i == 0 else " ", sentence) for i, sentence in enumerate(sentences))
+
+    chunks, current = [], ""
+    for separator, piece in pieces:
+        candidate = current + separator + piece if current else piece
+        if current and count_tokens(candidate) > chunk_tokens:
+            chunks.append(current)
+            candidate = piece
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class NoteIndex:
+    """BM25 index over one note's chunks."""
+
+    def __init__(self, text, chunk_tokens=200, k1=1.5, b=0.75):
+        self.text = text
+        self.tokens = count_tokens(text)
+        self.chunks = split_chunks(text, chunk_tokens)
+        self.chunk_tokens = [count_tokens(chunk) for chunk in self.chunks]
+        self.k1 = k1
+        self.b = b
+        self._tf = [Counter(terms(chunk)) for chunk in self.chunks]
+        self._lengths = [sum(tf.values()) for tf in self._tf]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0
+        self._df = Counter(term for tf in self._tf for term in tf)
+
+    def scores(self, query):
+        """BM25 score of every chunk for ``query``."""
+        n = len(self.chunks)
+        scores = [0.0] * n
+        for term in set(terms(query)):
+            df = self._df.get(term)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i, tf in enumerate(self._tf):
+                freq = tf.get(term)
+                if freq:
+                    norm = 1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1)
+                    scores[i] += idf * freq * (self.k1 + 1) / (freq + self.k1 * norm)
+        return scores
+
+    def select(self, query, budget_tokens):
+        """Return the best chunks for ``query`` that fit ``budget_tokens``, in note order, or None if none match."""
+        scores = self.scores(query)
+        ranked = [i for i in sorted(range(len(self.chunks)), key=lambda i: -scores[i]) if scores[i] > 0]
+        if not ranked:
+            return None
+        gap = count_tokens(GAP_MARKER)
+        chosen, used = set(), 0
+        # After the best match, the opening chunk (title, intro) tells the model what the note is about
+        for i in ranked[:1] + [0] + ranked[1:]:
+            cost = self.chunk_tokens[i] + gap
+            if i not in chosen and used + cost <= budget_tokens:
+                chosen.add(i)
+                used += cost
+        if not chosen & set(ranked):
+            return None
+
+        parts, previous = [], None
+        for i in sorted(chosen):
+            if previous is not None:
+                parts.append("\n\n" if i == previous + 1 else GAP_MARKER)
+            parts.append(self.chunks[i])
+            previous = i
+        return "".join(parts)
+
+
+class NoteRetriever:
+    """Caches one ``NoteIndex`` per note (by content hash) and selects context from it."""
+
+    def __init__(self, max_entries=64, chunk_tokens=200):
+        self.max_entries = max_entries
+        self.chunk_tokens = chunk_tokens
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"index_hits": 0, "index_misses": 0, "retrievals": 0, "no_match": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build from NOTE_INDEX_CACHE_SIZE / NOTE_CHUNK_TOKENS (defaults 64 / 200)."""
+        return cls(
+            max_entries=int(os.getenv("NOTE_INDEX_CACHE_SIZE", 64)),
+            chunk_tokens=int(os.getenv("NOTE_CHUNK_TOKENS", 200)),
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def index(self, note):
+        """Return the cached index for ``note``, building it on a miss."""
+        key = hashlib.sha256(note.encode("utf-8")).hexdigest()
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                self._stats["index_hits"] += 1
+                return index
+            self._stats["index_misses"] += 1
+        index = NoteIndex(compress(note), self.chunk_tokens)
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
+
+    def select(self, note, query, budget_tokens):
+        """Return the whole (compressed) note if it fits ``budget_tokens``, else the chunks most relevant to ``query``.
+
+        Falls back to the note itself (for the caller to truncate) when no chunk matches the query.
+        """
+        if not note:
+            return ""
+        index = self.index(note)
+        if index.tokens <= budget_tokens:
+            return index.text
+        selected = index.select(query, budget_tokens)
+        self._count("retrievals" if selected is not None else "no_match")
+        return selected if selected is not None else index.text
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["cached_notes"] = len(self._indexes)
+        snapshot["max_entries"] = self.max_entries
+        return snapshot
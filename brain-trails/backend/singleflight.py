@@ -0,0 +1,241 @@
+"""
+Brain Trails - Request coalescing (single-flight)
+
+When a class opens the same quiz page at once, identical generations arrive
+together. ``SingleFlight`` lets the first caller for a fingerprint (the
+leader) make the upstream call while concurrent callers with the same
+fingerprint wait and share its result.
+
+Within a worker, followers wait on the leader's thread, for no longer than
+their own request deadline. A leader that ran out of *its* deadline doesn't
+fail its followers: they retry, and one of them becomes the new leader. Across gunicorn
+workers, an optional lock directory serializes leaders with ``fcntl`` file
+locks, one per fingerprint; a leader that had to wait re-checks a shared
+store before calling upstream itself. That store is a SQLite file of its own
+in the lock directory, kept out of the response cache and its stats.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import logging
+
+import deadlines
+from deadlines import DeadlineExceeded
+from response_cache import ResponseCache, SQLiteCacheBackend
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: cross-worker locking is unavailable
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Results shared between workers live next to the lock files
+_STORE_NAME = "results.sqlite3"
+
+
+def request_fingerprint(*parts):
+    """SHA-256 over the JSON encoding of everything that determines a result."""
+    material = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc = None
+
+
+class _AsyncCall:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a fingerprint.
+
+    ``store`` overrides the SQLite file in ``lock_dir`` that leaders share results through.
+    """
+
+    def __init__(self, lock_dir=None, store=None, share_ttl=60.0, lock_timeout=120.0):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.share_ttl = share_ttl
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._stats = {"leaders": 0, "followers": 0, "cross_worker_hits": 0, "lock_timeouts": 0,
+                       "leader_deadline_retries": 0}
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        if self.lock_dir and store is None:
+            store = ResponseCache(SQLiteCacheBackend(os.path.join(self.lock_dir, _STORE_NAME)), ttl=share_ttl)
+        self.store = store
+
+    @classmethod
+    def from_env(cls):
+        """Build from SINGLEFLIGHT_* env vars."""
+        return cls(
+            lock_dir=os.getenv("SINGLEFLIGHT_LOCK_DIR") or None,
+            share_ttl=float(os.getenv("SINGLEFLIGHT_SHARE_TTL", 60)),
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def do(self, key, fn, share_if=None):
+        """Run ``fn()`` once for all concurrent callers of ``key``.
+
+        Returns ``(result, shared)`` where ``shared`` is True if this caller
+        reused another caller's result. ``share_if(result)`` decides whether a
+        result is published to the cross-worker store (e.g. skip errors).
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self._stats["leaders"] += 1
+                else:
+                    self._stats["followers"] += 1
+            if leader:
+                break
+            if not call.event.wait(deadlines.remaining("singleflight")):
+                raise DeadlineExceeded(deadlines.current().seconds, "singleflight")
+            if isinstance(call.exc, DeadlineExceeded):
+                self._leader_timed_out()
+                continue
+            if call.exc is not None:
+                raise call.exc
+            return call.result, True
+
+        shared = False
+        try:
+            call.result, shared = self._lead(key, fn, share_if)
+        except BaseException as e:
+            call.exc = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, shared
+
+    async def ado(self, key, coro_fn):
+        """Asyncio variant of ``do`` for the ASGI path (in-loop coalescing only).
+
+        The upstream call runs as its own task, so cancelling one caller (a
+        lost hedge race, a client disconnect) doesn't cancel the others; the
+        task is cancelled once no caller is waiting on it.
+        """
+        while True:
+            call = self._async_calls.get(key)
+            shared = call is not None and not call.task.done()
+            if shared:
+                self._count("followers")
+            else:
+                self._count("leaders")
+                call = self._async_calls[key] = _AsyncCall(asyncio.ensure_future(coro_fn()))
+                call.task.add_done_callback(lambda task, call=call: self._async_done(key, call))
+            call.waiters += 1
+            try:
+                # asyncio.wait never cancels the task, whether it times out or this caller is cancelled
+                await asyncio.wait({call.task}, timeout=deadlines.remaining("singleflight"))
+            finally:
+                call.waiters -= 1
+                if call.waiters == 0 and not call.task.done():
+                    call.task.cancel()
+                    if self._async_calls.get(key) is call:
+                        del self._async_calls[key]
+            if not call.task.done():
+                raise DeadlineExceeded(deadlines.current().seconds, "singleflight")
+            if shared and not call.task.cancelled() and isinstance(call.task.exception(), DeadlineExceeded):
+                self._leader_timed_out()
+                continue
+            return call.task.result(), shared
+
+    def _leader_timed_out(self):
+        """A follower saw the leader's deadline expire: retry under its own deadline, if any is left."""
+        self._count("leader_deadline_retries")
+        deadlines.check("singleflight")
+
+    def _async_done(self, key, call):
+        if self._async_calls.get(key) is call:
+            del self._async_calls[key]
+        # Mark retrieved so a failure nobody awaited doesn't log "exception never retrieved"
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def _lead(self, key, fn, share_if):
+        if not self.lock_dir:
+            return fn(), False
+
+        with self._file_lock(key):
+            if self.store is not None:
+                cached = self.store.get(key)
+                if cached is not None:
+                    self._count("cross_worker_hits")
+                    return cached, True
+            result = fn()
+            if self.store is not None and (share_if is None or share_if(result)):
+                self.store.set(key, result, ttl=self.share_ttl)
+            return result, False
+
+    def _file_lock(self, key):
+        # One lock per fingerprint, so unrelated requests never queue behind each other
+        return _FileLock(os.path.join(self.lock_dir, f"{key}.lock"), self)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["in_flight"] = len(self._calls) + len(self._async_calls)
+        snapshot["cross_worker"] = bool(self.lock_dir)
+        return snapshot
+
+
+class _FileLock:
+    """Exclusive flock with a polling timeout; on timeout the caller proceeds unlocked.
+
+    The wait is also bounded by the request deadline, which raises ``DeadlineExceeded`` instead.
+    """
+
+    def __init__(self, path, flight):
+        self.path = path
+        self.flight = flight
+        self.fd = None
+
+    def __enter__(self):
+        wait = self.flight.lock_timeout
+        remaining = deadlines.remaining("singleflight")
+        bounded = remaining is not None and remaining < wait
+        if bounded:
+            wait = remaining
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        until = time.monotonic() + wait
+        while True:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except BlockingIOError:
+                if time.monotonic() >= until and bounded:
+                    os.close(self.fd)
+                    raise DeadlineExceeded(deadlines.current().seconds, "singleflight")
+                if time.monotonic() >= until:
+                    self.flight._count("lock_timeouts")
+                    logger.warning(f"Single-flight: lock wait timed out for {self.path}")
+                    return self
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self.fd)
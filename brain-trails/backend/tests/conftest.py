@@ -0,0 +1,35 @@
+"""
+Shared pytest fixtures.
+
+Run: pytest tests/ -v
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from admission import AdmissionController  # noqa: E402
+from model_router import ModelRouter  # noqa: E402
+from question_bank import QuestionBank  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_admission_limits(monkeypatch):
+    """Load and concurrency tests fire many requests from one client; admission tests install their own."""
+    monkeypatch.setattr(app_module, "admission", AdmissionController(enabled=False))
+
+
+@pytest.fixture(autouse=True)
+def single_model(monkeypatch):
+    """Route everything to GROQ_MODEL; routing tests install their own router."""
+    monkeypatch.setattr(app_module, "model_router", ModelRouter(app_module.GROQ_MODEL, enabled=False))
+
+
+@pytest.fixture(autouse=True)
+def no_question_bank(monkeypatch):
+    """Quiz tests expect live generation; bank tests install their own bank."""
+    monkeypatch.setattr(app_module, "question_bank", QuestionBank(None, enabled=False))
@@ -0,0 +1,226 @@
+"""
+Local stand-in for the Groq chat completions and Gemini generateContent APIs.
+
+Serves OpenAI-style ``/openai/v1/chat/completions`` responses (plain JSON or
+``stream: true`` SSE) and Gemini REST ``models/<model>:generateContent`` /
+``:streamGenerateContent`` responses from a background thread. Latency,
+per-chunk streaming delay and injected error rates (401/429/500) are
+configurable, and it records how many requests were in flight at once.
+
+Usage:
+    with FakeLLMServer(latency=0.2, error_rates={429: 0.1}) as server:
+        os.environ["GROQ_BASE_URL"] = server.url
+        os.environ["GEMINI_BASE_URL"] = server.url
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once; the default backlog of 5 drops them
+    request_queue_size = 1024
+
+
+ERROR_TYPES = {
+    401: ("invalid_api_key", "Invalid API Key"),
+    429: ("rate_limit_exceeded", "Rate limit reached, please try again later"),
+    500: ("internal_server_error", "Internal server error"),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answers as Groq or Gemini would, on behalf of ``self.server.fake``."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        gemini = "generatecontent" in self.path.lower()
+        error = fake._enter("gemini" if gemini else "groq", body.get("model"))
+        try:
+            time.sleep(fake.latency)
+            if error:
+                self._error(error)
+            elif gemini:
+                prompt = "".join(
+                    part.get("text", "") for content in body.get("contents", []) for part in content["parts"]
+                )
+                self._gemini(fake.reply_for([{"role": "user", "content": prompt}]))
+            elif body.get("stream"):
+                self._stream(fake.reply_for(body.get("messages", [])))
+            else:
+                self._complete(fake.reply_for(body.get("messages", [])))
+        finally:
+            fake._leave()
+
+    def _send_json(self, status, payload, headers=()):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status):
+        code, message = ERROR_TYPES.get(status, ("error", "Injected error"))
+        headers = [("retry-after", str(self.server.fake.retry_after))] if status == 429 else []
+        self._send_json(status, {"error": {"message": message, "type": code, "code": code}}, headers)
+
+    def _gemini(self, text):
+        # The REST transport sends non-streaming calls to :generateContent and
+        # streaming ones to :streamGenerateContent, which answers a JSON array
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)] or [""]
+        chunks = [
+            {"candidates": [{"index": 0, "content": {"role": "model", "parts": [{"text": piece}]}}]}
+            for piece in pieces
+        ]
+        chunks[-1]["candidates"][0]["finishReason"] = "STOP"
+        usage = {"promptTokenCount": 10, "candidatesTokenCount": 10, "totalTokenCount": 20}
+        chunks[-1]["usageMetadata"] = usage
+        if ":streamGenerateContent" not in self.path:
+            return self._send_json(200, {
+                "candidates": [{"index": 0, "finishReason": "STOP",
+                                "content": {"role": "model", "parts": [{"text": text}]}}],
+                "usageMetadata": usage,
+            })
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(self.server.fake.chunk_delay)
+            self._write_chunk((("[" if index == 0 else ",\r\n") + json.dumps(chunk)).encode())
+        self._write_chunk(b"]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _complete(self, text):
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": self.server.fake.model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        })
+
+    def _stream(self, text):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, piece in enumerate([text[i:i + 8] for i in range(0, len(text), 8)]):
+            if index:
+                time.sleep(self.server.fake.chunk_delay)
+            chunk = json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": self.server.fake.model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            })
+            self._write_chunk(f"data: {chunk}\n\n".encode())
+        # Like Groq, the last chunk carries usage under "x_groq"
+        last = json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": self.server.fake.model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": "req-fake", "usage": {"prompt_tokens": 10, "completion_tokens": 10,
+                                                   "total_tokens": 20}},
+        })
+        self._write_chunk(f"data: {last}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeLLMServer:
+    """Threaded fake completions server. ``reply`` may be a string or ``fn(messages) -> str``.
+
+    ``error_rates`` maps an HTTP status (401, 429, 500) to the fraction of
+    requests that fail with it; ``seed`` makes the failures repeatable.
+    Gemini requests reach ``reply`` as a single user message. ``models``
+    counts Groq requests per requested model.
+    """
+
+    def __init__(self, latency=0.0, reply="pong", model="fake-model", error_rates=None, seed=0,
+                 chunk_delay=0.0, retry_after=1):
+        self.latency = latency
+        self.reply = reply
+        self.model = model
+        self.error_rates = dict(error_rates or {})
+        self.chunk_delay = chunk_delay
+        self.retry_after = retry_after
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.by_api = Counter()
+        self.models = Counter()
+        self.errors = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _enter(self, api, model=None):
+        """Count the request and return the error status to inject, if any."""
+        with self._lock:
+            self.requests += 1
+            self.by_api[api] += 1
+            if model:
+                self.models[model] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            roll = self._random.random()
+            for status, rate in sorted(self.error_rates.items()):
+                if roll < rate:
+                    self.errors[status] += 1
+                    return status
+                roll -= rate
+            return None
+
+    def _leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def reply_for(self, messages):
+        return self.reply(messages) if callable(self.reply) else self.reply
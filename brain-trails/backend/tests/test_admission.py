@@ -0,0 +1,226 @@
+"""
+Tests for admission control: token buckets, the priority slot queue and the 429 responses.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import asgi  # noqa: E402
+from admission import (  # noqa: E402
+    AdmissionController, AdmissionRejected, ConcurrencyLimiter, MemoryBucketStore, SQLiteBucketStore,
+)
+
+import pytest  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store_and_clock(request, tmp_path):
+    clock = FakeClock()
+    if request.param == "sqlite":
+        return SQLiteBucketStore(str(tmp_path / "buckets.sqlite3"), clock=clock), clock
+    return MemoryBucketStore(clock=clock), clock
+
+
+class TestBuckets:
+    """Tests for the token bucket stores."""
+
+    def test_burst_then_refill(self, store_and_clock):
+        store, clock = store_and_clock
+        assert store.take("a", 1, rate=0.5, burst=2) == 0
+        assert store.take("a", 1, rate=0.5, burst=2) == 0
+        assert store.take("a", 1, rate=0.5, burst=2) == pytest.approx(2.0)
+        # Other clients have their own bucket
+        assert store.take("b", 2, rate=0.5, burst=2) == 0
+        clock.now += 2
+        assert store.take("a", 1, rate=0.5, burst=2) == 0
+
+    def test_memory_store_is_bounded(self):
+        store = MemoryBucketStore(max_clients=2)
+        for client in ("a", "b", "c"):
+            store.take(client, 1, rate=1, burst=5)
+        assert len(store) == 2
+
+
+class TestClientId:
+    """Tests for identifying callers."""
+
+    def test_authorization_is_hashed(self):
+        client = AdmissionController().client_id({"Authorization": "Bearer secret"}, "10.0.0.1")
+        assert client.startswith("auth:")
+        assert "secret" not in client
+
+    def test_forwarded_for_trusts_only_our_proxy_hops(self):
+        controller = AdmissionController(proxy_hops=1)
+        headers = {"X-Forwarded-For": "6.6.6.6, 203.0.113.7"}
+        assert controller.client_id(headers, "10.0.0.1") == "ip:203.0.113.7"
+        assert controller.client_id({}, "10.0.0.1") == "ip:10.0.0.1"
+        assert AdmissionController(proxy_hops=0).client_id(headers, "10.0.0.1") == "ip:10.0.0.1"
+
+    def test_new_credentials_are_charged_to_the_ip(self):
+        controller = AdmissionController(rate_per_minute=60, burst=2)
+        ip = controller.ip_id({}, "10.0.0.1")
+        # A fresh Authorization value per request still drains the IP bucket
+        for token in ("a", "b"):
+            controller.check_rate(controller.client_id({"Authorization": token}, "10.0.0.1"), ip=ip)
+        with pytest.raises(AdmissionRejected):
+            controller.check_rate(controller.client_id({"Authorization": "c"}, "10.0.0.1"), ip=ip)
+        # A value that already has a bucket only spends its own
+        controller.check_rate(controller.client_id({"Authorization": "a"}, "10.0.0.1"), ip=ip)
+        assert controller.stats()["new_credentials"] == 3
+
+
+def _queue(limiter, priority, order):
+    def run():
+        with limiter.acquire(priority):
+            order.append(priority)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_for_waiters(limiter, count):
+    deadline = time.monotonic() + 2
+    while limiter.stats()["waiting"] < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class TestConcurrencyLimiter:
+    """Tests for the priority slot queue."""
+
+    def test_interactive_jumps_the_queue(self):
+        limiter = ConcurrencyLimiter(limit=1, interactive_reserve=0)
+        order = []
+        slot = limiter.acquire("bulk")
+        threads = [_queue(limiter, "bulk", order)]
+        _wait_for_waiters(limiter, 1)
+        threads.append(_queue(limiter, "interactive", order))
+        _wait_for_waiters(limiter, 2)
+        slot.release()
+        for thread in threads:
+            thread.join(2)
+        assert order == ["interactive", "bulk"]
+        assert limiter.stats()["in_use"] == 0
+
+    def test_reserved_slots_are_interactive_only(self):
+        limiter = ConcurrencyLimiter(limit=2, interactive_reserve=1, timeout=0.05)
+        bulk = limiter.acquire("bulk")
+        with pytest.raises(AdmissionRejected):
+            limiter.acquire("bulk")
+        interactive = limiter.acquire("interactive")
+        assert limiter.stats()["in_use"] == 2
+        assert limiter.stats()["queue_timeouts"] == 1
+        bulk.release()
+        interactive.release()
+        interactive.release()  # releasing twice is a no-op
+        assert limiter.stats()["in_use"] == 0
+
+    def test_full_queue_is_rejected_fast(self):
+        limiter = ConcurrencyLimiter(limit=1, max_waiting=0, interactive_reserve=0)
+        limiter.acquire("bulk")
+        started = time.monotonic()
+        with pytest.raises(AdmissionRejected) as excinfo:
+            limiter.acquire("interactive")
+        assert time.monotonic() - started < 0.1
+        assert excinfo.value.retry_after >= 1
+        assert limiter.stats()["queue_full"] == 1
+
+    def test_weight_is_capped_at_capacity(self):
+        limiter = ConcurrencyLimiter(limit=4, interactive_reserve=1)
+        assert limiter.acquire("bulk", weight=10).weight == 3
+
+    def test_async_waiter_is_woken_by_a_thread(self):
+        limiter = ConcurrencyLimiter(limit=1, interactive_reserve=0)
+        slot = limiter.acquire("bulk")
+
+        async def wait():
+            threading.Timer(0.05, slot.release).start()
+            acquired = await limiter.aacquire("interactive")
+            acquired.release()
+            return acquired
+
+        assert asyncio.run(wait()).priority == 0
+        assert limiter.stats()["in_use"] == 0
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    controller = AdmissionController(rate_per_minute=60, burst=2, limiter=ConcurrencyLimiter(limit=4))
+    monkeypatch.setattr(app_module, "admission", controller)
+    monkeypatch.setattr(app_module, "generate_text", lambda *a, **k: ("Hello!", None, "fake-model"))
+    app_module.app.config["TESTING"] = True
+    return controller
+
+
+class TestAdmissionRoutes:
+    """The AI routes answer 429 + Retry-After once a client's bucket is empty."""
+
+    def test_flask_rate_limit(self, limited):
+        with app_module.app.test_client() as client:
+            statuses = [client.post("/api/ai/chat", json={"message": "Hi"}).status_code for _ in range(2)]
+            rejected = client.post("/api/ai/chat", json={"message": "Hi"})
+            # Other clients and non-AI routes are unaffected
+            other = client.post(
+                "/api/ai/chat", json={"message": "Hi"}, headers={"Authorization": "Bearer other"},
+                environ_base={"REMOTE_ADDR": "10.0.0.2"},
+            )
+            health = client.get("/api/health")
+
+        assert statuses == [200, 200]
+        assert rejected.status_code == 429
+        assert rejected.headers["Retry-After"] == "1"
+        assert rejected.get_json()["retry_after"] == 1
+        assert other.status_code == 200
+        assert health.get_json()["admission"]["rate_limited"] == 1
+        assert limited.limiter.stats()["in_use"] == 0
+
+    def test_batch_costs_per_job(self, limited):
+        with app_module.app.test_client() as client:
+            jobs = [{"subject": "Biology", "type": "flashcard"}] * 3
+            response = client.post("/api/ai/generate-quiz/batch", json={"jobs": jobs})
+        # 3 jobs x 2 tokens is more than the burst of 2: the batch needs a full bucket
+        assert response.status_code == 200
+        response.get_data()
+        with app_module.app.test_client() as client:
+            assert client.post("/api/ai/chat", json={"message": "Hi"}).status_code == 429
+
+    def test_streams_hold_their_slot_until_sent(self, limited, monkeypatch):
+        monkeypatch.setattr(app_module, "groq_chat_stream", lambda *a, **k: (iter(["Hel", "lo"]), None))
+        with app_module.app.test_client() as client:
+            response = client.post("/api/ai/chat/stream", json={"message": "Hi"}, buffered=False)
+            assert limited.limiter.stats()["in_use"] == 1
+            response.get_data()
+            response.close()
+        assert limited.limiter.stats()["in_use"] == 0
+
+    def test_asgi_rate_limit(self, limited):
+        async def body():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+                return [
+                    await http.post("/api/ai/generate-quiz", json={"subject": "Bio"}, headers={"Authorization": "x"})
+                    for _ in range(2)
+                ]
+
+        first, second = asyncio.run(body())
+        assert first.status_code != 429
+        assert second.status_code == 429
+        assert second.headers["retry-after"] == "2"
+        assert limited.limiter.stats()["in_use"] == 0
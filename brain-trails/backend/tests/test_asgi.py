@@ -0,0 +1,150 @@
+"""
+Tests for the ASGI entry point, including a concurrency load test against a
+local fake LLM server.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import asgi  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    """Point the app at a fake Groq server with fresh pool, scheduler and cache."""
+    def reply(messages):
+        if "Quiz generator" in messages[0]["content"]:
+            return json.dumps({"questions": [
+                {"type": "mcq", "question": "Q?", "options": ["A", "B", "C", "D"], "correct_answer": "A"},
+            ]})
+        return "Greetings, traveler!"
+
+    with FakeLLMServer(latency=0.5, reply=reply) as server:
+        monkeypatch.setenv("GROQ_BASE_URL", server.url)
+        monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+        monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a", "key-b"]))
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        monkeypatch.setattr(app_module, "get_gemini_model", lambda: None)
+        yield server
+
+
+def _run(coro_fn):
+    """Run an async test body, closing pooled async clients on the same loop."""
+    async def wrapper():
+        try:
+            return await coro_fn()
+        finally:
+            await app_module.groq_pool.aclose()
+    return asyncio.run(wrapper())
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi.app), base_url="http://test", timeout=30)
+
+
+class TestASGIRoutes:
+    """Tests for async route parity with the Flask app."""
+
+    def test_health_is_served_by_flask(self, fake_backend):
+        async def body():
+            async with _client() as client:
+                return await client.get("/api/health")
+        response = _run(body)
+        assert response.status_code == 200
+        assert response.json()["status"] == "healthy"
+
+    def test_chat_requires_message(self, fake_backend):
+        async def body():
+            async with _client() as client:
+                return await client.post("/api/ai/chat", json={})
+        assert _run(body).status_code == 400
+
+    def test_chat(self, fake_backend):
+        async def body():
+            async with _client() as client:
+                return await client.post("/api/ai/chat", json={"message": "hi"})
+        response = _run(body)
+        assert response.status_code == 200
+        assert response.json()["response"] == "Greetings, traveler!"
+        assert response.headers["access-control-allow-origin"] == "*"
+
+    def test_cors_follows_the_flask_origins(self, fake_backend, monkeypatch):
+        monkeypatch.setattr(app_module, "CORS_ORIGINS", ["https://app.example"])
+
+        async def body():
+            async with _client() as client:
+                return [
+                    await client.post("/api/ai/chat", json={"message": "hi"}, headers={"Origin": origin})
+                    for origin in ("https://app.example", "https://other.example")
+                ]
+        allowed, other = _run(body)
+        assert allowed.headers["access-control-allow-origin"] == "https://app.example"
+        assert allowed.headers["vary"] == "Origin"
+        assert "access-control-allow-origin" not in other.headers
+
+    def test_chat_stream(self, fake_backend):
+        async def body():
+            async with _client() as client:
+                return await client.post("/api/ai/chat/stream", json={"message": "hi"})
+        response = _run(body)
+        deltas = [
+            json.loads(line[len("data: "):]).get("delta", "")
+            for line in response.text.splitlines() if line.startswith("data: ")
+        ]
+        assert "".join(deltas) == "Greetings, traveler!"
+        assert "event: done" in response.text
+
+    def test_quiz_is_cached(self, fake_backend):
+        payload = {"subject": "Biology", "topic": "Cells", "count": 1}
+
+        async def body():
+            async with _client() as client:
+                first = await client.post("/api/ai/generate-quiz", json=payload)
+                second = await client.post("/api/ai/generate-quiz", json=payload)
+                return first.json(), second.json()
+        first, second = _run(body)
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert fake_backend.requests == 1
+
+
+class TestASGILoad:
+    """One event loop holds far more upstream calls than the 2x4 gunicorn thread budget."""
+
+    def test_concurrent_upstream_calls(self, fake_backend):
+        concurrency = 200
+
+        async def body():
+            async with _client() as client:
+                started = time.perf_counter()
+                responses = await asyncio.gather(*[
+                    client.post("/api/ai/chat", json={"message": f"question {i}"})
+                    for i in range(concurrency)
+                ])
+                return responses, time.perf_counter() - started
+
+        responses, elapsed = _run(body)
+        assert all(r.status_code == 200 for r in responses)
+        assert fake_backend.max_in_flight >= concurrency * 0.75
+        # 200 calls of 0.5s through 8 threads would take >= 12.5s
+        assert elapsed < 6
+        print(
+            f"\nASGI load: {concurrency} requests in {elapsed:.2f}s, "
+            f"peak upstream concurrency {fake_backend.max_in_flight}"
+        )
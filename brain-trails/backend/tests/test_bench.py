@@ -0,0 +1,98 @@
+"""
+Tests for the fake Groq/Gemini server and the endpoint benchmark harness.
+
+Run: pytest tests/ -v
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import requests  # noqa: E402
+
+import app as app_module  # noqa: E402
+import bench  # noqa: E402
+from admission import AdmissionController  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+class TestFakeServer:
+    """Tests for injected errors and the Gemini REST emulation."""
+
+    def test_injected_errors(self):
+        with FakeLLMServer(error_rates={429: 1.0}, retry_after=3) as server:
+            response = requests.post(f"{server.url}/openai/v1/chat/completions", json={"messages": []}, timeout=5)
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "3"
+        assert response.json()["error"]["code"] == "rate_limit_exceeded"
+        assert server.errors == {429: 1}
+
+    def test_error_rates_are_repeatable(self):
+        def statuses():
+            with FakeLLMServer(error_rates={500: 0.5}, seed=7) as server:
+                url = f"{server.url}/openai/v1/chat/completions"
+                return [requests.post(url, json={}, timeout=5).status_code for _ in range(10)]
+
+        first = statuses()
+        assert first == statuses()
+        assert set(first) == {200, 500}
+
+    def test_gemini_sdk_talks_to_the_fake(self, monkeypatch):
+        pytest.importorskip("google.generativeai")
+        with FakeLLMServer(reply="Photosynthesis makes sugar.") as server:
+            monkeypatch.setenv("GEMINI_API_KEY", "fake")
+            monkeypatch.setenv("GEMINI_BASE_URL", server.url)
+            monkeypatch.setattr(app_module, "_gemini_model", None)
+            gemini = app_module.get_gemini_model()
+            assert gemini.generate_content("hi").text == "Photosynthesis makes sugar."
+            chunks = [chunk.text for chunk in gemini.generate_content("hi", stream=True)]
+        assert len(chunks) > 1
+        assert "".join(chunks) == "Photosynthesis makes sugar."
+        assert server.by_api == {"gemini": 2}
+
+
+class TestHarness:
+    """The harness drives the real handlers against the fakes."""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert bench.percentile(values, 50) == 50
+        assert bench.percentile(values, 99) == 99
+        assert bench.percentile([], 95) == 0.0
+
+    def test_fake_reply_matches_the_prompt(self):
+        quiz = [{"role": "system", "content": app_module.QUIZ_SYSTEM_PROMPT},
+                {"role": "user", "content": "Generate 3 medium questions about 'Biology'."}]
+        assert len(bench.json.loads(bench.fake_reply(quiz))["questions"]) == 3
+        syllabus = [{"role": "system", "content": app_module.SYLLABUS_SYSTEM_PROMPT}]
+        assert bench.fake_reply(syllabus) == bench.SYLLABUS_REPLY
+
+    def test_all_endpoints_with_rate_limited_keys(self, monkeypatch):
+        with FakeLLMServer(reply=bench.fake_reply, error_rates={429: 0.2}, retry_after=0) as groq, \
+                FakeLLMServer(reply=bench.fake_reply) as gemini:
+            monkeypatch.setenv("GROQ_BASE_URL", groq.url)
+            monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+            monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+            monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a", "key-b"]))
+            monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+            monkeypatch.setattr(app_module, "admission", AdmissionController(enabled=False))
+            try:
+                results = bench.benchmark(app_module, groq, gemini, requests=6, concurrency=3)
+            finally:
+                app_module.groq_pool.close()
+
+        assert [r["endpoint"] for r in results] == list(bench.ENDPOINTS)
+        total_calls = 0
+        for r in results:
+            assert r["statuses"] == {"200": 6}, r
+            assert r["p50_ms"] <= r["p95_ms"] <= r["p99_ms"]
+            assert r["upstream_per_request"]["gemini"] == 0
+            total_calls += r["upstream_per_request"]["groq"] * r["requests"]
+        # Rate-limited attempts were retried on the other key
+        assert total_calls == groq.requests == 18 + groq.errors[429]
@@ -0,0 +1,226 @@
+"""
+Tests for server-side chat sessions: stored notes and turns, compaction into
+a running summary, and the session contract of the chat endpoints.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import asgi  # noqa: E402
+from chat_sessions import SUMMARY_PREFIX, ChatSessions  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from response_cache import MemoryCacheBackend, SQLiteCacheBackend  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+NOTES = "Mitochondria produce ATP through cellular respiration."
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStore:
+    """Sessions round-trip through either backend and expire."""
+
+    @pytest.mark.parametrize("kind", ["memory", "sqlite"])
+    def test_round_trip(self, kind, tmp_path):
+        backend = MemoryCacheBackend() if kind == "memory" else SQLiteCacheBackend(str(tmp_path / "chat.sqlite3"))
+        sessions = ChatSessions(backend)
+        session = sessions.create(NOTES)
+        assert sessions.get(session["id"]) is None  # not stored before its first turn
+        sessions.add_turn(session, "What is ATP?", "Energy currency.")
+        stored = sessions.get(session["id"])
+        assert stored["notes"] == NOTES
+        assert sessions.history(stored) == [
+            {"role": "user", "content": "What is ATP?"},
+            {"role": "assistant", "content": "Energy currency."},
+        ]
+        assert sessions.stats()["sessions"] == 1
+
+    def test_sessions_expire(self):
+        clock = FakeClock()
+        sessions = ChatSessions(MemoryCacheBackend(clock=clock), ttl=60)
+        session = sessions.create()
+        sessions.add_turn(session, "Hi", "Hello!")
+        clock.now += 61
+        assert sessions.get(session["id"]) is None
+        assert sessions.stats()["expired"] == 1
+
+    def test_disabled(self):
+        sessions = ChatSessions(MemoryCacheBackend(), enabled=False)
+        assert sessions.get("anything") is None
+
+    def test_from_env_shares_sessions_between_workers(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("CHAT_SESSIONS", raising=False)
+        monkeypatch.setenv("CHAT_SESSIONS_PATH", str(tmp_path / "chat.sqlite3"))
+        worker_a, worker_b = ChatSessions.from_env(), ChatSessions.from_env()
+        assert isinstance(worker_a.backend, SQLiteCacheBackend)
+        session = worker_a.create(NOTES)
+        worker_a.add_turn(session, "What is ATP?", "Energy currency.")
+        assert worker_b.get(session["id"])["notes"] == NOTES
+
+
+class TestCompaction:
+    """Older turns are folded into the summary once the history is over budget."""
+
+    def sessions_with_turns(self, exchanges, **kwargs):
+        sessions = ChatSessions(MemoryCacheBackend(), **kwargs)
+        session = sessions.create()
+        for i in range(exchanges):
+            sessions.add_turn(session, f"Question {i} " + "word " * 20, f"Answer {i} " + "word " * 20)
+        return sessions, session
+
+    def test_within_budget(self):
+        sessions, session = self.sessions_with_turns(3, history_tokens=10000)
+        assert sessions.compaction(session) == []
+
+    def test_folds_all_but_the_recent_turns(self):
+        sessions, session = self.sessions_with_turns(4, history_tokens=150, keep_turns=4)
+        folded = sessions.compaction(session)
+        assert [turn["content"].split(" word")[0] for turn in folded] == [
+            "Question 0", "Answer 0", "Question 1", "Answer 1",
+        ]
+        sessions.compact(session, folded, "They discussed questions 0 and 1.")
+        assert len(session["turns"]) == 4
+        history = sessions.history(session)
+        assert history[0] == {"role": "system", "content": SUMMARY_PREFIX + "They discussed questions 0 and 1."}
+        assert sessions.stats()["compactions"] == 1
+
+    def test_failed_summary_drops_the_turns(self):
+        sessions, session = self.sessions_with_turns(4, history_tokens=150, keep_turns=4)
+        sessions.compact(session, sessions.compaction(session), None)
+        assert session["summary"] == "" and len(session["turns"]) == 4
+        assert sessions.stats()["dropped"] == 4
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    """Fake Groq recording each call's messages; replies 'Reply <n>' (or a summary)."""
+    calls = []
+
+    def fake_groq_chat(messages, temperature=0.7, max_tokens=1500, model=None):
+        calls.append(messages)
+        if messages[0]["content"] == app_module.CHAT_SUMMARY_SYSTEM_PROMPT:
+            return "The student asked about ATP.", None
+        return f"Reply {len(calls)}", None
+
+    sessions = ChatSessions(MemoryCacheBackend())
+    monkeypatch.setattr(app_module, "groq_chat", fake_groq_chat)
+    monkeypatch.setattr(app_module, "chat_sessions", sessions)
+    return calls, sessions
+
+
+class TestEndpoint:
+    """/api/ai/chat keeps the conversation when asked to."""
+
+    def test_follow_ups_send_only_the_message(self, chat):
+        calls, _ = chat
+        with app_module.app.test_client() as client:
+            first = client.post("/api/ai/chat", json={"message": "What is ATP?", "noteContent": NOTES, "session": True})
+            session_id = first.get_json()["sessionId"]
+            second = client.post("/api/ai/chat", json={"message": "And where is it made?", "sessionId": session_id})
+        assert second.get_json() == {"response": "Reply 2", "model": app_module.GROQ_MODEL, "sessionId": session_id}
+        roles = [message["role"] for message in calls[1]]
+        assert roles == ["system", "user", "assistant", "user"]
+        assert calls[1][1]["content"] == "What is ATP?" and calls[1][2]["content"] == "Reply 1"
+        # The stored note still reaches the model
+        assert NOTES in calls[1][-1]["content"] and "And where is it made?" in calls[1][-1]["content"]
+
+    def test_new_notes_are_stored_even_if_the_turn_fails(self, chat, monkeypatch):
+        _, sessions = chat
+        with app_module.app.test_client() as client:
+            first = client.post("/api/ai/chat", json={"message": "What is ATP?", "noteContent": NOTES, "session": True})
+            session_id = first.get_json()["sessionId"]
+            monkeypatch.setattr(app_module, "generate_text", lambda *args, **kwargs: (None, "Groq is down", None))
+            follow_up = {"message": "And mitosis?", "noteContent": "Mitosis notes.", "sessionId": session_id}
+            failed = client.post("/api/ai/chat", json=follow_up)
+        assert failed.status_code == 500
+        stored = sessions.get(session_id)
+        assert stored["notes"] == "Mitosis notes." and len(stored["turns"]) == 2
+
+    def test_stateless_requests_are_unchanged(self, chat):
+        calls, sessions = chat
+        with app_module.app.test_client() as client:
+            body = client.post("/api/ai/chat", json={"message": "Hi", "noteContent": NOTES}).get_json()
+        assert "sessionId" not in body
+        assert len(calls[0]) == 2 and sessions.stats()["sessions"] == 0
+
+    def test_unknown_session(self, chat):
+        with app_module.app.test_client() as client:
+            response = client.post("/api/ai/chat", json={"message": "Hi", "sessionId": "gone"})
+        assert response.status_code == 404
+
+    def test_long_histories_are_compacted(self, chat, monkeypatch):
+        calls, _ = chat
+        sessions = ChatSessions(MemoryCacheBackend(), history_tokens=40, keep_turns=2)
+        monkeypatch.setattr(app_module, "chat_sessions", sessions)
+        long_question = "Explain ATP synthase " + "in detail " * 40
+        with app_module.app.test_client() as client:
+            session_id = client.post("/api/ai/chat", json={"message": long_question, "session": True}).get_json()[
+                "sessionId"
+            ]
+            client.post("/api/ai/chat", json={"message": "What about glycolysis?", "sessionId": session_id})
+            client.post("/api/ai/chat", json={"message": "Thanks!", "sessionId": session_id})
+        summary_calls = [c for c in calls if c[0]["content"] == app_module.CHAT_SUMMARY_SYSTEM_PROMPT]
+        assert len(summary_calls) == 1
+        assert long_question in summary_calls[0][-1]["content"]
+        last = calls[-1]
+        assert last[1] == {"role": "system", "content": SUMMARY_PREFIX + "The student asked about ATP."}
+        assert long_question not in json.dumps(last)
+
+    def test_stream_records_the_turn(self, chat, monkeypatch):
+        _, sessions = chat
+
+        def fake_stream(messages, temperature=0.7, max_tokens=1500, model=None):
+            return iter(["Energy ", "currency."]), None
+
+        monkeypatch.setattr(app_module, "groq_chat_stream", fake_stream)
+        with app_module.app.test_client() as client:
+            text = client.post(
+                "/api/ai/chat/stream", json={"message": "What is ATP?", "noteContent": NOTES, "session": True},
+            ).get_data(as_text=True)
+        done = json.loads(text.split("event: done\ndata: ")[1])
+        stored = sessions.get(done["sessionId"])
+        assert stored["turns"][-1] == {"role": "assistant", "content": "Energy currency."}
+
+
+def test_asgi_session_against_a_fake_server(monkeypatch):
+    with FakeLLMServer(reply=lambda messages: f"{len(messages)} messages") as server:
+        monkeypatch.setenv("GROQ_BASE_URL", server.url)
+        monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+        monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a"]))
+        monkeypatch.setattr(app_module, "get_gemini_model", lambda: None)
+        monkeypatch.setattr(app_module, "chat_sessions", ChatSessions(MemoryCacheBackend()))
+
+        async def body():
+            transport = httpx.ASGITransport(app=asgi.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+                    first = await client.post(
+                        "/api/ai/chat", json={"message": "What is ATP?", "noteContent": NOTES, "session": True},
+                    )
+                    session_id = first.json()["sessionId"]
+                    second = await client.post("/api/ai/chat", json={"message": "Where?", "sessionId": session_id})
+                    return first.json(), second.json()
+            finally:
+                await app_module.groq_pool.aclose()
+
+        first, second = asyncio.run(body())
+    assert first["response"] == "2 messages"
+    assert second["response"] == "4 messages" and second["sessionId"] == first["sessionId"]
@@ -0,0 +1,98 @@
+"""
+Tests for the streaming /api/ai/chat/stream endpoint.
+
+Run: pytest tests/ -v
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+def _events(body):
+    """Parse an SSE body into a list of (event, data) tuples."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = "message", None
+        for line in block.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+
+class FakeGeminiChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGemini:
+    def generate_content(self, prompt, stream=False, **options):
+        assert stream is True
+        return iter([FakeGeminiChunk("Gem"), FakeGeminiChunk("ini")])
+
+
+@pytest.fixture
+def client():
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        yield client
+
+
+class TestChatStream:
+    """Tests for server-sent event chat streaming."""
+
+    def test_stream_requires_message(self, client):
+        response = client.post("/api/ai/chat/stream", data=json.dumps({}), content_type="application/json")
+        assert response.status_code == 400
+
+    def test_streams_groq_deltas(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "groq_chat_stream", lambda *a, **k: (iter(["Hel", "lo"]), None))
+        response = client.post("/api/ai/chat/stream", json={"message": "hi"})
+
+        assert response.status_code == 200
+        assert response.mimetype == "text/event-stream"
+        events = _events(response.get_data(as_text=True))
+        assert [d["delta"] for e, d in events if e == "message"] == ["Hel", "lo"]
+        assert events[-1][0] == "done"
+        assert events[-1][1]["model"] == app_module.GROQ_MODEL
+        assert "ttft_ms" in events[-1][1]
+
+    def test_falls_back_to_gemini_stream(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "groq_chat_stream", lambda *a, **k: (None, "All keys failed"))
+        monkeypatch.setattr(app_module, "get_gemini_model", lambda: FakeGemini())
+        events = _events(client.post("/api/ai/chat/stream", json={"message": "hi"}).get_data(as_text=True))
+
+        assert "".join(d["delta"] for e, d in events if e == "message") == "Gemini"
+        assert events[-1][1]["model"] == "gemini-2.0-flash"
+
+    def test_mid_stream_failure_emits_error_event(self, client, monkeypatch):
+        def broken():
+            yield "partial"
+            raise RuntimeError("connection reset")
+
+        monkeypatch.setattr(app_module, "groq_chat_stream", lambda *a, **k: (broken(), None))
+        events = _events(client.post("/api/ai/chat/stream", json={"message": "hi"}).get_data(as_text=True))
+
+        assert events[0] == ("message", {"delta": "partial"})
+        assert events[-1][0] == "error"
+
+    def test_no_provider_returns_json_error(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "groq_chat_stream", lambda *a, **k: (None, "No GROQ_API_KEY(S) configured"))
+        monkeypatch.setattr(app_module, "get_gemini_model", lambda: None)
+        response = client.post("/api/ai/chat/stream", json={"message": "hi"})
+        assert response.status_code == 500
+        assert "error" in response.get_json()
+
+    def test_chat_accept_header_selects_stream(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "groq_chat_stream", lambda *a, **k: (iter(["ok"]), None))
+        response = client.post("/api/ai/chat", json={"message": "hi"}, headers={"Accept": "text/event-stream"})
+        assert response.mimetype == "text/event-stream"
@@ -0,0 +1,176 @@
+"""
+Tests for map-reduce syllabus chunking.
+
+Run: pytest tests/ -v
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from chunking import is_heading, merge_syllabi, split_sections  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+def _weeks(n, filler=300):
+    return "".join(f"Week {i}: Topic {i}\n{'reading ' * (filler // 8)}\n" for i in range(1, n + 1))
+
+
+class TestSplitSections:
+    """Tests for heading-aware splitting."""
+
+    def test_headings(self):
+        assert is_heading("Week 3: Thermodynamics")
+        assert is_heading("## Grading")
+        assert is_heading("UNIT IV")
+        assert is_heading("COURSE SCHEDULE")
+        assert not is_heading("Weekly readings are posted online.")
+        assert not is_heading("The midterm is worth 25%.")
+
+    def test_short_text_is_one_chunk(self):
+        assert split_sections("Biology 101\nWeek 1: Cells", max_chars=100) == ["Biology 101\nWeek 1: Cells"]
+
+    def test_splits_on_section_boundaries(self):
+        chunks = split_sections(_weeks(10), max_chars=1000)
+        assert len(chunks) > 1
+        assert all(len(c) <= 1000 for c in chunks)
+        assert all(c.startswith("Week ") for c in chunks)
+        assert "".join(chunks) == _weeks(10)
+
+    def test_oversized_section_is_cut(self):
+        text = "Week 1\n" + ("x" * 250 + "\n") * 10
+        chunks = split_sections(text, max_chars=600)
+        assert all(len(c) <= 600 for c in chunks)
+        assert "".join(chunks) == text
+
+    def test_max_chunks(self):
+        assert len(split_sections(_weeks(40), max_chars=500, max_chunks=3)) == 3
+
+
+class TestMergeSyllabi:
+    """Tests for merging per-chunk results."""
+
+    def test_merges_subjects_topics_and_exams(self):
+        first = {
+            "semester": "Fall 2026",
+            "subjects": [{
+                "name": "Physics 201", "code": "PHYS201", "professor": "",
+                "topics": [{"name": "Motion", "sort_order": 1}, {"name": "Units", "sort_order": 0}],
+                "exams": [{"name": "Midterm", "exam_date": "2026-10-15"}],
+            }],
+        }
+        second = {
+            "semester": "",
+            "subjects": [
+                {
+                    "name": "Physics 201", "professor": "Dr. Smith",
+                    "topics": [{"name": "motion", "sort_order": 0}, {"name": "Energy", "sort_order": 1}],
+                    "exams": [
+                        {"name": "Midterm", "exam_date": "2026-10-15"},
+                        {"name": "Final", "exam_date": "2026-12-10"},
+                    ],
+                },
+                {"name": "Calculus", "topics": [{"name": "Limits", "sort_order": 0}], "exams": []},
+            ],
+        }
+        merged = merge_syllabi([first, None, second])
+        assert merged["semester"] == "Fall 2026"
+        physics, calculus = merged["subjects"]
+        assert physics["code"] == "PHYS201"
+        assert physics["professor"] == "Dr. Smith"
+        assert [(t["name"], t["sort_order"]) for t in physics["topics"]] == [("Units", 0), ("Motion", 1), ("Energy", 2)]
+        assert [e["name"] for e in physics["exams"]] == ["Midterm", "Final"]
+        assert calculus["topics"] == [{"name": "Limits", "sort_order": 0}]
+
+    def test_matches_by_code(self):
+        merged = merge_syllabi([
+            {"subjects": [{"name": "Physics", "code": "PHYS 201", "topics": [{"name": "A"}]}]},
+            {"subjects": [{"name": "Physics II", "code": "phys201", "topics": [{"name": "B"}]}]},
+        ])
+        assert len(merged["subjects"]) == 1
+        assert [t["name"] for t in merged["subjects"][0]["topics"]] == ["A", "B"]
+
+    def test_repeated_topic_names_in_different_weeks_are_kept(self):
+        merged = merge_syllabi([
+            {"subjects": [{"name": "Physics", "topics": [
+                {"name": "Lab", "week": 1, "sort_order": 0},
+                {"name": "Review", "sort_order": 1},
+                {"name": "Review", "sort_order": 2},
+            ]}]},
+            {"subjects": [{"name": "Physics", "topics": [
+                {"name": "Lab", "week": 1, "sort_order": 0},
+                {"name": "Lab", "week": 5, "sort_order": 1},
+            ]}]},
+        ])
+        topics = [(t["name"], t.get("week")) for t in merged["subjects"][0]["topics"]]
+        assert topics == [("Lab", 1), ("Review", None), ("Review", None), ("Lab", 5)]
+
+
+class TestParseSyllabusText:
+    """Long syllabi are parsed chunk-parallel and merged."""
+
+    @pytest.fixture
+    def fake_generate(self, monkeypatch):
+        calls = {"count": 0, "peak": 0, "active": 0}
+        lock = threading.Lock()
+
+        def generate(system, user, temperature=0.7, max_tokens=1024, **routing):
+            with lock:
+                calls["count"] += 1
+                calls["active"] += 1
+                calls["peak"] = max(calls["peak"], calls["active"])
+            time.sleep(0.2)
+            with lock:
+                calls["active"] -= 1
+            topics = re.findall(r"^Week (\d+)", user.split("...)")[-1], re.MULTILINE)
+            result = {"semester": "Fall 2026", "subjects": [{
+                "name": "Biology 101",
+                "topics": [{"name": f"Topic {n}", "sort_order": i} for i, n in enumerate(topics)],
+            }]}
+            return json.dumps(result), None, "fake-model"
+
+        monkeypatch.setattr(app_module, "generate_text", generate)
+        monkeypatch.setattr(app_module, "SYLLABUS_CHUNK_CHARS", 1000)
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        return calls
+
+    def test_chunks_run_concurrently_and_merge(self, fake_generate):
+        started = time.perf_counter()
+        parsed, error, model, _, chunk_count = app_module.parse_syllabus_text(_weeks(12))
+        elapsed = time.perf_counter() - started
+        assert error is None
+        assert chunk_count == fake_generate["count"] > 1
+        assert fake_generate["peak"] == chunk_count
+        assert elapsed < 0.2 * chunk_count
+        topics = [t["name"] for t in parsed["subjects"][0]["topics"]]
+        assert topics == [f"Topic {i}" for i in range(1, 13)]
+
+    def test_failed_chunk_is_skipped(self, monkeypatch, fake_generate):
+        original = app_module.generate_text
+
+        def flaky(system, user, **kwargs):
+            if "Week 1:" in user.split("...)")[-1]:
+                return "not json", None, "fake-model"
+            return original(system, user, **kwargs)
+
+        monkeypatch.setattr(app_module, "generate_text", flaky)
+        parsed, error, _, _, _ = app_module.parse_syllabus_text(_weeks(12))
+        topics = [t["name"] for t in parsed["subjects"][0]["topics"]]
+        assert "Topic 1" not in topics and "Topic 12" in topics
+
+    def test_endpoint_reports_chunks(self, fake_generate):
+        app_module.app.config["TESTING"] = True
+        with app_module.app.test_client() as client:
+            response = client.post("/api/ai/parse-syllabus", json={"file_type": "text", "content": _weeks(12)})
+        body = response.get_json()
+        assert response.status_code == 200
+        assert body["chunks"] > 1
+        assert len(body["data"]["subjects"][0]["topics"]) == 12
@@ -0,0 +1,215 @@
+"""
+Tests for per-request deadlines: the policy, propagation into worker
+threads, and routes answering 504 instead of waiting out a slow upstream.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import asgi  # noqa: E402
+import deadlines  # noqa: E402
+from deadlines import Deadline, DeadlineExceeded, DeadlinePolicy  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPolicy:
+    """Per-route budgets and the X-Request-Timeout override."""
+
+    def test_route_budgets_and_header(self):
+        policy = DeadlinePolicy({"/api/ai/chat": 30.0}, max_seconds=60.0)
+        assert policy.for_request("/api/health", {}) is None
+        assert policy.for_request("/api/ai/chat", {}).seconds == 30.0
+        assert policy.for_request("/api/ai/chat", {"X-Request-Timeout": "5"}).seconds == 5.0
+        assert policy.for_request("/api/ai/chat", {"x-request-timeout": "500"}).seconds == 60.0
+        assert policy.for_request("/api/ai/chat", {"X-Request-Timeout": "0"}).seconds == 1.0
+        assert policy.for_request("/api/ai/chat", {"X-Request-Timeout": "soon"}).seconds == 30.0
+        assert policy.for_request("/api/ai/chat", {"X-Request-Timeout": "nan"}).seconds == 30.0
+        assert policy.for_request("/api/ai/chat", {"X-Request-Timeout": "inf"}).seconds == 30.0
+        assert policy.for_request("/api/ai/chat", {"X-Request-Timeout": "-inf"}).seconds == 30.0
+
+    def test_disabled(self):
+        assert DeadlinePolicy(enabled=False).for_request("/api/ai/chat", {}) is None
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("REQUEST_DEADLINES", '{"/api/ai/chat": 12}')
+        monkeypatch.setenv("REQUEST_DEADLINE_MAX", "20")
+        policy = DeadlinePolicy.from_env()
+        assert policy.deadlines["/api/ai/chat"] == 12.0
+        assert policy.deadlines["/api/ai/parse-syllabus"] == 90.0
+        monkeypatch.setenv("REQUEST_DEADLINES", "[1, 2]")
+        assert DeadlinePolicy.from_env().deadlines["/api/ai/chat"] == 30.0
+
+
+class TestDeadline:
+    """Deadline bookkeeping and the context-variable helpers."""
+
+    def test_expiry(self):
+        clock = FakeClock()
+        deadline = Deadline(5.0, clock=clock)
+        assert deadline.remaining() == 5.0
+        clock.now += 6
+        assert deadline.expired and deadline.remaining() == 0.0
+        with pytest.raises(DeadlineExceeded, match="5s exceeded during groq"):
+            deadline.check("groq")
+
+    def test_helpers_without_a_deadline(self):
+        assert deadlines.remaining() is None
+        deadlines.check()
+
+    def test_bind_carries_the_deadline_into_pool_threads(self):
+        clock = FakeClock()
+        with deadlines.scope(Deadline(5.0, clock=clock)) as deadline:
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                assert pool.submit(deadlines.current).result() is None
+                assert pool.submit(deadlines.bind(deadlines.current)).result() is deadline
+                clock.now += 10
+                with pytest.raises(DeadlineExceeded):
+                    pool.submit(deadlines.bind(deadlines.check), "pdf_extract").result()
+        assert deadlines.current() is None
+
+    def test_groq_timeout_is_capped(self):
+        pool = GroqClientPool(connect_timeout=5.0, read_timeout=60.0)
+        assert pool.timeout().read == 60.0
+        timeout = pool.timeout(2.5)
+        assert (timeout.read, timeout.connect) == (2.5, 2.5)
+
+
+@pytest.fixture
+def slow_groq(monkeypatch):
+    with FakeLLMServer(latency=3.0, reply="Too late") as server:
+        monkeypatch.setenv("GROQ_BASE_URL", server.url)
+        monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+        monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a", "key-b"]))
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        monkeypatch.setattr(app_module, "get_gemini_model", lambda: None)
+        yield server
+
+
+class TestFlaskRoutes:
+    """Sync routes give up at the deadline instead of trying every key."""
+
+    def test_slow_groq_answers_504(self, slow_groq):
+        started = time.perf_counter()
+        with app_module.app.test_client() as client:
+            response = client.post(
+                "/api/ai/chat", json={"message": "What is ATP?"}, headers={"X-Request-Timeout": "1"},
+            )
+        assert response.status_code == 504
+        assert response.get_json()["deadline_seconds"] == 1.0
+        assert time.perf_counter() - started < 2.5
+        # The second key was not tried once the budget was spent
+        assert slow_groq.requests == 1
+        assert app_module.metrics.value("deadlines_exceeded_total", stage="groq") >= 1
+
+    def test_batch_reports_unfinished_jobs(self, monkeypatch):
+        def run_quiz_job(data, client=None):
+            if data["topic"] == "slow":
+                time.sleep(2)
+            return 200, {"questions": []}
+
+        monkeypatch.setattr(app_module, "run_quiz_job", run_quiz_job)
+        jobs = [{"subject": "Bio", "topic": "fast"}, {"subject": "Bio", "topic": "slow"}]
+        with app_module.app.test_client() as client:
+            response = client.post(
+                "/api/ai/generate-quiz/batch", json={"jobs": jobs}, headers={"X-Request-Timeout": "1"},
+            )
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [(line["index"], line["status"]) for line in lines[:-1]] == [(0, 200), (1, 504)]
+        assert lines[-1]["failed"] == 1
+
+    def test_health_reports_the_policy(self):
+        with app_module.app.test_client() as client:
+            health = client.get("/api/health").get_json()
+        assert health["deadlines"]["deadlines"]["/api/ai/chat"] == 30.0
+
+
+class TestASGI:
+    """The ASGI dispatcher enforces the deadline and cancels abandoned routes."""
+
+    def _post(self, path, payload, headers=None):
+        async def body():
+            transport = httpx.ASGITransport(app=asgi.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+                    return await client.post(path, json=payload, headers=headers or {})
+            finally:
+                await app_module.groq_pool.aclose()
+
+        return asyncio.run(body())
+
+    def test_slow_groq_answers_504(self, slow_groq):
+        started = time.perf_counter()
+        response = self._post("/api/ai/chat", {"message": "What is ATP?"}, {"X-Request-Timeout": "1"})
+        assert response.status_code == 504
+        assert response.json()["deadline_seconds"] == 1.0
+        assert time.perf_counter() - started < 2.5
+
+    def test_route_is_cancelled_past_the_deadline(self, monkeypatch):
+        cancelled = []
+
+        async def stuck(data, headers, send):
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        monkeypatch.setattr(asgi, "DEADLINE_GRACE", 0.0)
+        monkeypatch.setitem(asgi.ASYNC_ROUTES, ("POST", "/api/ai/chat"), stuck)
+        response = self._post("/api/ai/chat", {"message": "hi"}, {"X-Request-Timeout": "1"})
+        assert response.status_code == 504
+        assert cancelled == [True]
+
+    def test_disconnect_cancels_the_route(self, monkeypatch):
+        cancelled = []
+
+        async def stuck(data, headers, send):
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        messages = [
+            {"type": "http.request", "body": b'{"message": "hi"}', "more_body": False},
+            {"type": "http.disconnect"},
+        ]
+
+        async def receive():
+            return messages.pop(0)
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        monkeypatch.setitem(asgi.ASYNC_ROUTES, ("POST", "/api/ai/chat"), stuck)
+        scope = {"type": "http", "method": "POST", "path": "/api/ai/chat", "headers": [], "client": ("1.2.3.4", 1)}
+        asyncio.run(asgi.app(scope, receive, send))
+        assert cancelled == [True]
+        assert sent == []
+        assert app_module.metrics.value("requests_abandoned_total", reason="disconnect") >= 1
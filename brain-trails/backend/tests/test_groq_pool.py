@@ -0,0 +1,90 @@
+"""
+Tests for the pooled Groq client registry.
+
+Run: pytest tests/ -v
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from groq_pool import GroqClientPool  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def fake_groq(monkeypatch):
+    """Serve fake completions on localhost and point the Groq SDK at it."""
+    with FakeLLMServer() as server:
+        monkeypatch.setenv("GROQ_BASE_URL", server.url)
+        yield server
+
+
+def _ask(client):
+    completion = client.chat.completions.create(
+        model="test-model",
+        messages=[{"role": "user", "content": "ping"}],
+    )
+    return completion.choices[0].message.content
+
+
+class TestGroqClientPool:
+    """Tests for client reuse and connection accounting."""
+
+    def test_same_key_returns_same_client(self):
+        """A key maps to a single shared client."""
+        pool = GroqClientPool()
+        try:
+            assert pool.get("key-a") is pool.get("key-a")
+            assert pool.get("key-a") is not pool.get("key-b")
+            stats = pool.stats()
+            assert stats["clients_created"] == 2
+            assert stats["clients_reused"] == 2
+        finally:
+            pool.close()
+
+    def test_concurrent_get_creates_one_client(self):
+        """Racing threads still build exactly one client per key."""
+        pool = GroqClientPool()
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(pool.get("key-a"))) for _ in range(8)]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert len({id(c) for c in seen}) == 1
+            assert pool.stats()["clients_created"] == 1
+        finally:
+            pool.close()
+
+    def test_connections_are_kept_alive(self, fake_groq):
+        """Sequential calls on one key reuse the same TCP connection."""
+        pool = GroqClientPool(max_retries=0)
+        try:
+            client = pool.get("key-a")
+            for _ in range(3):
+                assert _ask(client) == "pong"
+            stats = pool.stats()
+            assert stats["requests"] == 3
+            assert stats["connections_opened"] == 1
+            assert stats["connections_reused"] == 2
+        finally:
+            pool.close()
+
+    def test_from_env_reads_limits(self, monkeypatch):
+        """Pool size and timeouts are configurable via the environment."""
+        monkeypatch.setenv("GROQ_POOL_MAX_CONNECTIONS", "7")
+        monkeypatch.setenv("GROQ_READ_TIMEOUT", "12.5")
+        pool = GroqClientPool.from_env()
+        assert pool.max_connections == 7
+        assert pool.read_timeout == 12.5
+        assert pool.max_keepalive == 10
+        # Like every other module's settings, a bad value fails at startup
+        monkeypatch.setenv("GROQ_POOL_MAX_KEEPALIVE", "not-a-number")
+        with pytest.raises(ValueError):
+            GroqClientPool.from_env()
@@ -0,0 +1,128 @@
+"""
+Tests for hedged Groq/Gemini provider calls.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from hedging import HedgePolicy, LatencyHistogram  # noqa: E402
+
+
+def _slow(text, delay, error=None):
+    def fn():
+        time.sleep(delay)
+        return text, error
+    return fn
+
+
+class TestLatencyHistogram:
+    """Tests for latency bookkeeping."""
+
+    def test_quantiles_and_buckets(self):
+        hist = LatencyHistogram()
+        for i in range(1, 101):
+            hist.observe(i / 100)
+        assert hist.count == 100
+        assert 0.94 <= hist.quantile(0.95) <= 0.97
+        snapshot = hist.snapshot()
+        assert snapshot["buckets"][-1] == (float("inf"), 100)
+        assert dict(snapshot["buckets"])[0.5] == 50
+
+    def test_empty(self):
+        assert LatencyHistogram().quantile(0.95) is None
+
+
+class TestHedgePolicy:
+    """Tests for fallback and racing behaviour."""
+
+    def test_delay_is_default_until_warmed_up(self):
+        policy = HedgePolicy(default_delay=3.0, min_samples=5, min_delay=0.1)
+        assert policy.delay_for("groq") == 3.0
+        for _ in range(5):
+            policy.observe("groq", 0.8)
+        assert policy.delay_for("groq") == 0.8
+
+    def test_delay_is_clamped(self):
+        policy = HedgePolicy(min_samples=1, min_delay=0.5, max_delay=2.0)
+        policy.observe("groq", 0.01)
+        assert policy.delay_for("groq") == 0.5
+        policy = HedgePolicy(min_samples=1, min_delay=0.5, max_delay=2.0)
+        policy.observe("groq", 9.0)
+        assert policy.delay_for("groq") == 2.0
+
+    def test_disabled_is_sequential_fallback(self):
+        policy = HedgePolicy(enabled=False)
+        text, error, provider = policy.call(("groq", _slow(None, 0, "429")), ("gemini", _slow("hi", 0)))
+        assert (text, provider) == ("hi", "gemini")
+        assert policy.histogram("gemini").count == 1
+
+    def test_missing_secondary_returns_primary_error(self):
+        policy = HedgePolicy(enabled=True)
+        assert policy.call(("groq", _slow(None, 0, "boom")), ("gemini", None)) == (None, "boom", "groq")
+
+    def test_fast_primary_is_not_hedged(self):
+        policy = HedgePolicy(enabled=True, default_delay=1.0)
+        calls = []
+        text, _, provider = policy.call(("groq", _slow("fast", 0)), ("gemini", lambda: calls.append(1)))
+        assert (text, provider) == ("fast", "groq")
+        assert calls == []
+        assert policy.stats()["hedged"] == 0
+
+    def test_slow_primary_is_hedged(self):
+        policy = HedgePolicy(enabled=True, default_delay=0.1)
+        started = time.perf_counter()
+        text, _, provider = policy.call(("groq", _slow("slow", 1.0)), ("gemini", _slow("quick", 0.05)))
+        elapsed = time.perf_counter() - started
+        assert (text, provider) == ("quick", "gemini")
+        assert elapsed < 0.6
+        stats = policy.stats()
+        assert stats["hedged"] == 1
+        assert stats["secondary_wins"] == 1
+
+    def test_hedged_primary_can_still_win(self):
+        policy = HedgePolicy(enabled=True, default_delay=0.05)
+        text, _, provider = policy.call(("groq", _slow("groq", 0.15)), ("gemini", _slow("gemini", 1.0)))
+        assert (text, provider) == ("groq", "groq")
+
+    def test_async_loser_is_cancelled(self):
+        policy = HedgePolicy(enabled=True, default_delay=0.05)
+        cancelled = []
+
+        async def slow_groq():
+            try:
+                await asyncio.sleep(2)
+                return "groq", None
+            except asyncio.CancelledError:
+                cancelled.append("groq")
+                raise
+
+        async def quick_gemini():
+            await asyncio.sleep(0.05)
+            return "gemini", None
+
+        async def body():
+            result = await policy.acall(("groq", slow_groq), ("gemini", quick_gemini))
+            await asyncio.sleep(0)
+            return result
+
+        assert asyncio.run(body()) == ("gemini", None, "gemini")
+        assert cancelled == ["groq"]
+
+
+class TestGenerateText:
+    """generate_text() reports the model that actually answered."""
+
+    def test_fallback_reports_gemini_model(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "test")
+        monkeypatch.setattr(app_module, "hedge_policy", HedgePolicy(enabled=False))
+        monkeypatch.setattr(app_module, "groq_chat", lambda *a, **k: (None, "All keys failed"))
+        monkeypatch.setattr(app_module, "gemini_chat", lambda prompt: ("from gemini", None))
+        text, error, model = app_module.generate_text("sys", "user")
+        assert (text, model) == ("from gemini", app_module.GEMINI_MODEL)
@@ -0,0 +1,133 @@
+"""
+Tests for syllabus image preprocessing: format sniffing, header sizes and the Gemini upload.
+
+Run: pytest tests/ -v
+"""
+
+import io
+import json
+import os
+import struct
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+import image_prep  # noqa: E402
+from image_prep import ImageFormatError, ImageLimitError, ImagePreprocessor, image_size, sniff_mime  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+def png_header(width, height):
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    chunk = struct.pack(">I", len(ihdr)) + b"IHDR" + ihdr + struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+    return b"\x89PNG\r\n\x1a\n" + chunk
+
+
+def jpeg_header(width, height):
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + bytes(9)
+    sof0 = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, height, width, 1) + bytes(3)
+    return b"\xff\xd8" + app0 + sof0
+
+
+class TestSniffing:
+    """Tests for magic-byte sniffing and header dimensions."""
+
+    def test_sniff_mime(self):
+        assert sniff_mime(png_header(1, 1)) == "image/png"
+        assert sniff_mime(jpeg_header(1, 1)) == "image/jpeg"
+        assert sniff_mime(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+        assert sniff_mime(b"GIF89a\x01\x00\x01\x00") == "image/gif"
+        assert sniff_mime(b"\x00\x00\x00\x18ftypheic") == "image/heic"
+        assert sniff_mime(b"%PDF-1.7") is None
+
+    def test_header_sizes(self):
+        assert image_size(png_header(4032, 3024), "image/png") == (4032, 3024)
+        assert image_size(jpeg_header(4032, 3024), "image/jpeg") == (4032, 3024)
+        assert image_size(b"GIF89a" + struct.pack("<HH", 640, 480), "image/gif") == (640, 480)
+        assert image_size(b"\xff\xd8\xff", "image/jpeg") is None
+
+
+class TestPreprocessor:
+    """Tests for limits and the pass-through path."""
+
+    def test_limits_are_checked_from_the_header(self):
+        prep = ImagePreprocessor(max_pixels=10_000_000)
+        with pytest.raises(ImageLimitError):
+            prep.inspect(png_header(20000, 20000))
+        with pytest.raises(ImageLimitError):
+            ImagePreprocessor(max_bytes=10).inspect(png_header(1, 1))
+        with pytest.raises(ImageFormatError):
+            prep.inspect(b"not an image at all")
+
+    def test_passthrough_keeps_the_real_mime_type(self, monkeypatch):
+        monkeypatch.setattr(image_prep, "PILLOW", False)
+        prep = ImagePreprocessor()
+        data = jpeg_header(800, 600)
+        assert prep.prepare(data) == (data, "image/jpeg")
+        with pytest.raises(ImageFormatError):
+            prep.inspect(b"GIF89a" + struct.pack("<HH", 64, 64))
+        assert prep.stats()["passthrough"] == 1
+
+    def test_large_photos_are_downscaled(self):
+        Image = pytest.importorskip("PIL.Image")
+        out = io.BytesIO()
+        Image.new("RGB", (4000, 3000), "white").save(out, format="PNG")
+        prep = ImagePreprocessor(max_side=1000)
+        data, mime = prep.prepare(out.getvalue())
+        assert mime == "image/jpeg"
+        assert Image.open(io.BytesIO(data)).size == (1000, 750)
+        assert prep.stats()["resized"] == 1
+
+    def test_transparency_is_flattened_onto_white(self):
+        Image = pytest.importorskip("PIL.Image")
+        # Dark text on a transparent background, as in a screenshot
+        image = Image.new("RGBA", (2000, 1000), (0, 0, 0, 0))
+        image.paste((20, 20, 20, 255), (500, 400, 1500, 600))
+        out = io.BytesIO()
+        image.save(out, format="PNG")
+        data, mime = ImagePreprocessor(max_side=1000).prepare(out.getvalue())
+        assert mime == "image/jpeg"
+        flattened = Image.open(io.BytesIO(data))
+        assert min(flattened.getpixel((10, 10))) > 240
+        assert max(flattened.getpixel((500, 250))) < 60
+
+
+class FakeGemini:
+    def __init__(self):
+        self.parts = None
+
+    def generate_content(self, parts, **options):
+        self.parts = parts
+        reply = json.dumps({"course_name": "Biology 101", "topics": [], "exams": [], "assignments": []})
+        return type("Response", (), {"text": reply})()
+
+
+class TestImageRoute:
+    """The image branch sends the sniffed MIME type and rejects bad images up front."""
+
+    def test_jpeg_is_labelled_as_jpeg(self, monkeypatch):
+        gemini = FakeGemini()
+        monkeypatch.setattr(image_prep, "PILLOW", False)
+        monkeypatch.setattr(app_module, "get_gemini_model", lambda: gemini)
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        app_module.app.config["TESTING"] = True
+        with app_module.app.test_client() as client:
+            response = client.post(
+                "/api/ai/parse-syllabus", data=jpeg_header(800, 600), content_type="image/png",
+            )
+        assert response.status_code == 200
+        assert gemini.parts[1]["mime_type"] == "image/jpeg"
+
+    def test_bad_images_are_rejected_before_parsing(self, monkeypatch):
+        monkeypatch.setattr(app_module, "get_gemini_model", lambda: pytest.fail("Gemini should not be called"))
+        monkeypatch.setattr(app_module, "image_preprocessor", ImagePreprocessor(max_pixels=1_000_000))
+        app_module.app.config["TESTING"] = True
+        with app_module.app.test_client() as client:
+            huge = client.post("/api/ai/parse-syllabus", data=png_header(5000, 5000), content_type="image/png")
+            bogus = client.post("/api/ai/parse-syllabus", data=b"hello", content_type="image/png")
+        assert huge.status_code == 413
+        assert bogus.status_code == 400
@@ -0,0 +1,195 @@
+"""
+Tests for background jobs: the job stores, the worker queue and async syllabus parsing.
+
+Run: pytest tests/ -v
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+import deadlines  # noqa: E402
+from jobs import JobQueue, JobQueueFull, MemoryJobStore, SQLiteJobStore  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+
+import pytest  # noqa: E402
+
+SYLLABUS = json.dumps({
+    "course_name": "Biology 101",
+    "topics": [{"name": "Cells", "week": 1}],
+    "exams": [],
+    "assignments": [],
+})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _record(job_id, status):
+    return json.dumps({"id": job_id, "status": status})
+
+
+def _wait(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job and job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store_and_clock(request, tmp_path):
+    clock = FakeClock()
+    if request.param == "sqlite":
+        return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"), max_jobs=2, clock=clock), clock
+    return MemoryJobStore(max_jobs=2, clock=clock), clock
+
+
+class TestJobStores:
+    """Tests for the TTL + bounded job stores."""
+
+    def test_ttl(self, store_and_clock):
+        store, clock = store_and_clock
+        store.put("a", _record("a", "queued"), ttl=10)
+        assert json.loads(store.get("a"))["status"] == "queued"
+        clock.now += 11
+        assert store.get("a") is None
+
+    def test_finished_jobs_are_evicted_first(self, store_and_clock):
+        store, clock = store_and_clock
+        store.put("old-running", _record("old-running", "running"), ttl=60)
+        clock.now += 1
+        store.put("done", _record("done", "done"), ttl=60)
+        clock.now += 1
+        assert store.put("new", _record("new", "queued"), ttl=60) == 1
+        assert store.get("done") is None
+        assert store.get("old-running") is not None
+        assert len(store) == 2
+
+
+class TestJobQueue:
+    """Tests for running jobs and recording their outcome."""
+
+    def test_done_and_failed(self):
+        queue = JobQueue(MemoryJobStore())
+        done = queue.submit("echo", lambda x: (200, {"value": x}), 42)
+        failed = queue.submit("bad", lambda: (400, {"error": "Nope"}))
+        crashed = queue.submit("crash", lambda: 1 / 0)
+
+        assert _wait(queue, done["id"])["result"] == {"value": 42}
+        job = _wait(queue, failed["id"])
+        assert (job["status"], job["status_code"], job["error"]) == ("failed", 400, "Nope")
+        job = _wait(queue, crashed["id"])
+        assert job["status_code"] == 500
+        assert "division by zero" in job["error"]
+        stats = queue.stats()
+        assert (stats["done"], stats["failed"], stats["pending"]) == (1, 2, 0)
+
+    def test_jobs_run_under_a_deadline(self):
+        queue = JobQueue(MemoryJobStore(), deadline=0.2)
+
+        def hung_upstream():
+            # Stands in for an upstream call that checks the deadline between attempts
+            while True:
+                deadlines.check("groq")
+                time.sleep(0.02)
+
+        job = _wait(queue, queue.submit("hung", hung_upstream)["id"])
+        assert (job["status"], job["status_code"]) == ("failed", 504)
+        assert job["result"]["deadline_seconds"] == 0.2
+        assert queue.stats()["timed_out"] == 1 and queue.stats()["pending"] == 0
+
+    def test_full_queue_is_rejected(self):
+        queue = JobQueue(MemoryJobStore(), workers=1, max_pending=1)
+        release = threading.Event()
+        job = queue.submit("slow", lambda: (release.wait(5), (200, {}))[1])
+        with pytest.raises(JobQueueFull) as excinfo:
+            queue.submit("slow", lambda: (200, {}))
+        assert excinfo.value.retry_after >= 1
+        release.set()
+        _wait(queue, job["id"])
+        assert queue.stats()["rejected"] == 1
+
+    def test_webhooks_only_reach_allowed_hosts(self, monkeypatch):
+        queue = JobQueue(MemoryJobStore(), webhook_hosts=["hooks.example.com"])
+        for url in ("http://169.254.169.254/latest", "ftp://hooks.example.com/x", "not a url"):
+            with pytest.raises(ValueError):
+                queue.submit("echo", lambda: (200, {}), callback_url=url)
+
+        sent = []
+
+        class FakeResponse:
+            def raise_for_status(self):
+                pass
+
+        def post(url, json, **kwargs):
+            sent.append((url, json))
+            return FakeResponse()
+
+        monkeypatch.setattr("jobs.requests.post", post)
+        job = queue.submit("echo", lambda: (200, {"ok": True}), callback_url="https://hooks.example.com/done")
+        _wait(queue, job["id"])
+        deadline = time.monotonic() + 2
+        while not sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sent[0][0] == "https://hooks.example.com/done"
+        assert sent[0][1]["result"] == {"ok": True}
+        assert queue.stats()["webhooks_sent"] == 1
+
+
+@pytest.fixture
+def jobs_app(monkeypatch):
+    queue = JobQueue(MemoryJobStore())
+    monkeypatch.setattr(app_module, "job_queue", queue)
+    monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+    app_module.app.config["TESTING"] = True
+    return queue
+
+
+class TestAsyncSyllabusRoute:
+    """?async=1 returns a job id; /api/jobs/<id> returns the parse."""
+
+    def test_async_parse(self, jobs_app, monkeypatch):
+        monkeypatch.setattr(app_module, "generate_text", lambda *a, **k: (SYLLABUS, None, "fake-model"))
+        with app_module.app.test_client() as client:
+            response = client.post("/api/ai/parse-syllabus?async=1", json={"content": "Week 1: Cells"})
+            assert response.status_code == 202
+            body = response.get_json()
+            assert response.headers["Location"] == body["status_url"]
+            _wait(jobs_app, body["job_id"])
+            job = client.get(body["status_url"]).get_json()
+
+        assert job["status"] == "done"
+        assert job["result"]["data"]["course_name"] == "Biology 101"
+
+    def test_validation_errors_are_immediate(self, jobs_app):
+        with app_module.app.test_client() as client:
+            response = client.post("/api/ai/parse-syllabus?async=1", json={"content": " "})
+            callback = client.post(
+                "/api/ai/parse-syllabus?async=1",
+                json={"content": "Week 1", "callback_url": "http://10.0.0.1/hook"},
+            )
+        assert response.status_code == 400
+        assert callback.status_code == 400
+        assert jobs_app.stats()["submitted"] == 0
+
+    def test_full_queue_and_unknown_job(self, jobs_app, monkeypatch):
+        monkeypatch.setattr(jobs_app, "max_pending", 0)
+        with app_module.app.test_client() as client:
+            rejected = client.post("/api/ai/parse-syllabus?async=1", json={"content": "Week 1"})
+            missing = client.get("/api/jobs/nope")
+        assert rejected.status_code == 503
+        assert rejected.headers["Retry-After"] == str(rejected.get_json()["retry_after"])
+        assert missing.status_code == 404
@@ -0,0 +1,188 @@
+"""
+Tests for tolerant JSON extraction, schema validation and quiz streaming.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import asgi  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from json_extract import (  # noqa: E402
+    JSONExtractionError, JSONScanner, extract_json, validate_question, validate_quiz, validate_syllabus,
+)
+from key_scheduler import KeyScheduler  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+QUESTIONS = [
+    {"type": "mcq", "question": "Powerhouse of the cell?", "options": ["Mitochondria", "Nucleus", "Ribosome", "Golgi"],
+     "correct_answer": "Mitochondria", "explanation": "ATP."},
+    {"type": "true_false", "question": "DNA is a {double} helix [yes].", "options": ["True", "False"],
+     "correct_answer": "True", "explanation": "Watson \"and\" Crick."},
+    {"type": "short_answer", "question": "Name a base.", "correct_answer": "Adenine", "explanation": ""},
+]
+QUIZ_JSON = json.dumps({"questions": QUESTIONS})
+
+
+def _events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return events
+
+
+class TestExtractJSON:
+    """Tests for locating and repairing JSON in model output."""
+
+    def test_fences_and_trailing_prose(self):
+        text = f"Here you go:\n```json\n{QUIZ_JSON}\n```\nLet me know if you need more!"
+        assert extract_json(text) == ({"questions": QUESTIONS}, False)
+
+    def test_truncated_keeps_complete_elements(self):
+        document, truncated = extract_json(QUIZ_JSON[:QUIZ_JSON.index("Name a base") + 5])
+        assert truncated
+        assert document["questions"][:2] == QUESTIONS[:2]
+
+    def test_truncated_nested_arrays(self):
+        document, truncated = extract_json('{"subjects": [{"name": "Bio", "topics": [{"name": "Cells"}, {"name": "DN')
+        assert truncated
+        assert document == {"subjects": [{"name": "Bio", "topics": [{"name": "Cells"}]}]}
+
+    def test_no_json(self):
+        with pytest.raises(JSONExtractionError):
+            extract_json("I'm sorry, I can't help with that.")
+
+    def test_malformed_complete_document(self):
+        with pytest.raises(JSONExtractionError):
+            extract_json('{"questions": [1, 2,]}')
+
+
+class TestJSONScanner:
+    """Tests for incremental element streaming."""
+
+    def test_emits_each_question_when_complete(self):
+        scanner = JSONScanner(stream_key="questions")
+        text = "```json\n" + json.dumps({"title": "Cells", "questions": QUESTIONS, "total": 3}) + "\n```"
+        emitted = []
+        for i in range(0, len(text), 5):
+            emitted.extend((i, item) for item in scanner.feed(text[i:i + 5]))
+        assert [item for _, item in emitted] == QUESTIONS
+        # The first question is emitted long before the stream ends
+        assert emitted[0][0] < len(text) // 2
+        assert scanner.complete
+
+    def test_ignores_other_arrays(self):
+        scanner = JSONScanner(stream_key="questions")
+        assert scanner.feed('{"tags": [{"question": "no"}], "questions": [{"question": "yes"}]}') == [
+            {"question": "yes"}
+        ]
+
+    def test_top_level_array(self):
+        scanner = JSONScanner(stream_key="questions")
+        assert scanner.feed('[{"question": "a"}, "b", 3]') == [{"question": "a"}, "b", 3]
+
+
+class TestValidation:
+    """Tests for schema validation."""
+
+    def test_quiz(self):
+        items = QUESTIONS + [{"question": "no answer"}, {"type": "mcq", "question": "x", "correct_answer": "A"}, "junk"]
+        questions, dropped = validate_quiz({"questions": items})
+        assert questions == QUESTIONS
+        assert dropped == 3
+
+    def test_quiz_accepts_bare_array(self):
+        assert validate_quiz(QUESTIONS)[0] == QUESTIONS
+
+    def test_flashcards_need_answers(self):
+        assert validate_question({"question": "Q", "answer": "A"}, flashcard=True)
+        assert validate_question({"question": "Q"}, flashcard=True) is None
+
+    def test_syllabus(self):
+        parsed = validate_syllabus({
+            "semester": "Fall 2026",
+            "subjects": [
+                {"name": "Bio", "topics": ["Cells", {"name": "DNA", "sort_order": 5}, {}],
+                 "exams": [{"name": "Final", "exam_type": "boss fight"}]},
+                {"code": "nameless"},
+            ],
+        })
+        subject, = parsed["subjects"]
+        assert subject["topics"] == [{"name": "Cells", "sort_order": 0}, {"name": "DNA", "sort_order": 5}]
+        assert subject["exams"][0]["exam_type"] == "other"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as test_client:
+        yield test_client
+
+
+class TestQuizRoutes:
+    """Quiz routes survive truncated output and stream questions."""
+
+    def test_truncated_quiz_is_partial_and_not_cached(self, client, monkeypatch):
+        truncated = QUIZ_JSON[:QUIZ_JSON.index("Name a base")]
+        monkeypatch.setattr(app_module, "generate_text", lambda *a, **k: (truncated, None, "fake-model"))
+        body = {"subject": "Biology", "topic": "Cells", "count": 3}
+        first = client.post("/api/ai/generate-quiz", json=body).get_json()
+        assert first["partial"] is True
+        assert first["questions"] == QUESTIONS[:2]
+        assert client.post("/api/ai/generate-quiz", json=body).get_json()["cached"] is False
+
+    def test_unusable_output_is_500(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "generate_text", lambda *a, **k: ("Sorry!", None, "fake-model"))
+        response = client.post("/api/ai/generate-quiz", json={"subject": "Biology", "count": 3})
+        assert response.status_code == 500
+        assert response.get_json()["raw_response"] == "Sorry!"
+
+    def test_stream(self, client, monkeypatch):
+        with FakeLLMServer(reply=QUIZ_JSON) as server:
+            monkeypatch.setenv("GROQ_BASE_URL", server.url)
+            monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+            monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a"]))
+            body = {"subject": "Biology", "topic": "Cells", "count": 3}
+            first = _events(client.post("/api/ai/generate-quiz/stream", json=body).get_data(as_text=True))
+            second = _events(client.post("/api/ai/generate-quiz/stream", json=body).get_data(as_text=True))
+            app_module.groq_pool.close()
+
+        assert [data["question"] for event, data in first if event == "question"] == QUESTIONS
+        assert first[-1][0] == "done"
+        assert first[-1][1]["count"] == 3 and first[-1][1]["partial"] is False
+        assert second[-1][1]["cached"] is True
+        assert [data["question"] for event, data in second if event == "question"] == QUESTIONS
+        assert server.requests == 1
+
+    def test_asgi_stream(self, monkeypatch):
+        with FakeLLMServer(reply=QUIZ_JSON) as server:
+            monkeypatch.setenv("GROQ_BASE_URL", server.url)
+            monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+            monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a"]))
+            monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+
+            async def body():
+                transport = httpx.ASGITransport(app=asgi.app)
+                try:
+                    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+                        return await http.post("/api/ai/generate-quiz/stream", json={"subject": "Biology", "count": 3})
+                finally:
+                    await app_module.groq_pool.aclose()
+
+            response = asyncio.run(body())
+        events = _events(response.text)
+        assert [data["question"] for event, data in events if event == "question"] == QUESTIONS
+        assert events[-1][0] == "done"
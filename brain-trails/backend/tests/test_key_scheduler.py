@@ -0,0 +1,137 @@
+"""
+Tests for the health-aware Groq key scheduler.
+
+Run: pytest tests/ -v
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from key_scheduler import KeyScheduler, parse_duration  # noqa: E402
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class FakeAPIError(Exception):
+    """Mimics groq.APIStatusError (status_code + response.headers)."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        self.response = FakeResponse(headers or {})
+
+
+def _scheduler(n=3, **kwargs):
+    clock = FakeClock()
+    keys = [f"key-{i}" for i in range(n)]
+    return KeyScheduler(keys, clock=clock, **kwargs), clock
+
+
+class TestParseDuration:
+    """Tests for Groq rate-limit header parsing."""
+
+    def test_plain_seconds(self):
+        assert parse_duration("12") == 12.0
+
+    def test_go_durations(self):
+        assert parse_duration("2m59.5s") == 179.5
+        assert parse_duration("7.66s") == 7.66
+        assert parse_duration("120ms") == 0.12
+
+    def test_garbage(self):
+        assert parse_duration(None) is None
+        assert parse_duration("soon") is None
+
+
+class TestKeyScheduler:
+    """Tests for key selection, cooldown and quarantine."""
+
+    def test_round_robins_healthy_keys(self):
+        """Successive acquisitions spread across keys least-recently-used first."""
+        scheduler, clock = _scheduler()
+        picked = []
+        for _ in range(6):
+            clock.now += 1
+            picked.append(scheduler.acquire().index)
+        assert picked == [0, 1, 2, 0, 1, 2]
+
+    def test_rate_limited_key_is_skipped_until_retry_after(self):
+        """A 429 honours retry-after and is skipped until it expires."""
+        scheduler, clock = _scheduler(n=2)
+        state = scheduler.acquire()
+        assert scheduler.record_failure(state, FakeAPIError(429, {"retry-after": "10"})) is True
+
+        clock.now += 5
+        assert scheduler.acquire().index == 1
+        clock.now += 1
+        assert scheduler.acquire().index == 1
+
+        clock.now += 5
+        assert scheduler.acquire().index == 0
+
+    def test_rate_limit_reset_headers(self):
+        """Without retry-after, Groq's reset headers set the cooldown."""
+        scheduler, clock = _scheduler(n=1)
+        state = scheduler.acquire()
+        scheduler.record_failure(state, FakeAPIError(429, {
+            "x-ratelimit-remaining-tokens": "0",
+            "x-ratelimit-reset-tokens": "7.5s",
+        }))
+        assert scheduler.acquire() is None
+        assert scheduler.next_available_in() == 7.5
+
+    def test_rate_limit_default_cooldown(self):
+        """Without any headers the configured cooldown applies."""
+        scheduler, clock = _scheduler(n=1, rate_limit_cooldown=42)
+        scheduler.record_failure(scheduler.acquire(), FakeAPIError(429))
+        assert scheduler.next_available_in() == 42
+
+    def test_auth_failure_quarantines(self):
+        """A 401 key is quarantined for the long quarantine period."""
+        scheduler, clock = _scheduler(n=2, auth_quarantine=3600)
+        state = scheduler.acquire()
+        assert scheduler.record_failure(state, FakeAPIError(401)) is True
+        clock.now += 600
+        assert {scheduler.acquire().index for _ in range(3)} == {1}
+        snapshot = scheduler.snapshot()
+        assert snapshot[0]["status"] == "quarantined"
+        assert snapshot[0]["auth_failures"] == 1
+
+    def test_other_errors_do_not_rotate(self):
+        """Non-key errors are reported as final and leave the key healthy."""
+        scheduler, clock = _scheduler(n=2)
+        state = scheduler.acquire()
+        assert scheduler.record_failure(state, FakeAPIError(500)) is False
+        assert scheduler.snapshot()[0]["status"] == "healthy"
+
+    def test_exhausted_success_cools_down_preemptively(self):
+        """A success reporting zero remaining requests parks the key until reset."""
+        scheduler, clock = _scheduler(n=2)
+        state = scheduler.acquire()
+        scheduler.record_success(state, {
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "1m",
+        })
+        assert scheduler.snapshot()[0]["status"] == "cooldown"
+        assert scheduler.snapshot()[0]["remaining_requests"] == 0
+
+    def test_exclude(self):
+        """Keys already tried by a request are not handed out again."""
+        scheduler, clock = _scheduler(n=2)
+        assert scheduler.acquire(exclude={0}).index == 1
+        assert scheduler.acquire(exclude={0, 1}) is None
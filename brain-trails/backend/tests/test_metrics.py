@@ -0,0 +1,146 @@
+"""
+Tests for the Prometheus metrics registry and /api/metrics.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import asgi  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+QUIZ = json.dumps({"questions": [
+    {"type": "short_answer", "question": "Name a base.", "correct_answer": "Adenine", "explanation": ""},
+]})
+
+
+def _samples(text):
+    """Map 'name{labels}' -> value for every sample line."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+class TestMetrics:
+    """Tests for the registry and its text rendering."""
+
+    def test_counters_and_histograms(self):
+        metrics = Metrics(prefix="t_", buckets=(0.1, 1.0))
+        metrics.inc("generations_total", provider="groq", outcome="success")
+        metrics.inc("generations_total", 2, provider="groq", outcome="success")
+        metrics.observe("stage_duration_seconds", 0.05, stage="groq")
+        metrics.observe("stage_duration_seconds", 0.5, stage="groq")
+        metrics.observe("stage_duration_seconds", 5, stage="groq")
+        text = metrics.render()
+
+        assert "# TYPE t_generations_total counter" in text
+        assert "# TYPE t_stage_duration_seconds histogram" in text
+        samples = _samples(text)
+        assert samples['t_generations_total{outcome="success",provider="groq"}'] == 3
+        assert samples['t_stage_duration_seconds_bucket{stage="groq",le="0.1"}'] == 1
+        assert samples['t_stage_duration_seconds_bucket{stage="groq",le="1.0"}'] == 2
+        assert samples['t_stage_duration_seconds_bucket{stage="groq",le="+Inf"}'] == 3
+        assert samples['t_stage_duration_seconds_count{stage="groq"}'] == 3
+        assert samples['t_stage_duration_seconds_sum{stage="groq"}'] == pytest.approx(5.55)
+
+    def test_timer_records_on_error(self):
+        metrics = Metrics(prefix="t_")
+        with pytest.raises(ValueError):
+            with metrics.timer("stage_duration_seconds", stage="pdf_extract"):
+                raise ValueError("boom")
+        assert 't_stage_duration_seconds_count{stage="pdf_extract"} 1' in metrics.render()
+
+    def test_label_escaping_and_collectors(self):
+        metrics = Metrics(prefix="t_")
+        metrics.inc("json_parse_failures_total", kind='say "hi"\n')
+        metrics.collector(lambda: [("queue_depth", "gauge", "Jobs waiting", {}, 4)])
+        text = metrics.render()
+        assert 't_json_parse_failures_total{kind="say \\"hi\\"\\n"} 1' in text
+        assert "# HELP t_queue_depth Jobs waiting" in text
+        assert "# TYPE t_queue_depth gauge" in text
+        assert "t_queue_depth 4" in text
+
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    metrics = Metrics()
+    metrics.collector(app_module._component_metrics)
+    monkeypatch.setattr(app_module, "metrics", metrics)
+    monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+    app_module.app.config["TESTING"] = True
+    return metrics
+
+
+class TestMetricsRoute:
+    """Requests through the app feed /api/metrics."""
+
+    def test_quiz_request_is_broken_down(self, fresh_metrics, monkeypatch):
+        with FakeLLMServer(reply=QUIZ) as server:
+            monkeypatch.setenv("GROQ_BASE_URL", server.url)
+            monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+            monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a"]))
+            with app_module.app.test_client() as client:
+                body = {"subject": "Biology", "count": 1, "question_types": ["short_answer"]}
+                assert client.post("/api/ai/generate-quiz", json=body).status_code == 200
+                client.post("/api/ai/generate-quiz", json=body)
+                response = client.get("/api/metrics")
+            app_module.groq_pool.close()
+
+        assert response.mimetype == "text/plain"
+        samples = _samples(response.get_data(as_text=True))
+        p = "brain_trails_"
+        endpoint = 'endpoint="/api/ai/generate-quiz",method="POST",status="200"'
+        assert samples[f"{p}http_request_duration_seconds_count{{{endpoint}}}"] == 2
+        assert samples[f'{p}stage_duration_seconds_count{{stage="groq"}}'] == 1
+        assert samples[f'{p}stage_duration_seconds_count{{stage="json_parse"}}'] == 1
+        assert samples[f'{p}groq_key_attempts_total{{key="0",outcome="success"}}'] == 1
+        assert samples[f'{p}generations_total{{outcome="success",provider="groq"}}'] == 1
+        assert samples[f'{p}llm_tokens_total{{kind="completion",provider="groq"}}'] == 10
+        assert samples[f'{p}cache_lookups_total{{result="hit"}}'] == 1
+        assert samples[f'{p}groq_key_healthy{{key="0"}}'] == 1
+
+    def test_json_failures_are_counted(self, fresh_metrics, monkeypatch):
+        monkeypatch.setattr(app_module, "generate_text", lambda *a, **k: ("Sorry!", None, "fake-model"))
+        with app_module.app.test_client() as client:
+            assert client.post("/api/ai/generate-quiz", json={"subject": "Biology"}).status_code == 500
+        assert fresh_metrics.value("json_parse_failures_total", kind="quiz") == 1
+
+    def test_stream_usage_and_asgi_routes(self, fresh_metrics, monkeypatch):
+        with FakeLLMServer(reply="Hello there") as server:
+            monkeypatch.setenv("GROQ_BASE_URL", server.url)
+            monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+            monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a"]))
+
+            async def body():
+                transport = httpx.ASGITransport(app=asgi.app)
+                try:
+                    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+                        response = await http.post("/api/ai/chat/stream", json={"message": "Hi"})
+                        return response, (await http.get("/api/metrics")).text
+                finally:
+                    await app_module.groq_pool.aclose()
+
+            response, text = asyncio.run(body())
+
+        assert response.status_code == 200
+        samples = _samples(text)
+        endpoint = 'endpoint="/api/ai/chat/stream",method="POST",status="200"'
+        assert samples[f"brain_trails_http_request_duration_seconds_count{{{endpoint}}}"] == 1
+        assert fresh_metrics.value("llm_tokens_total", provider="groq", kind="prompt") == 10
@@ -0,0 +1,169 @@
+"""
+Tests for per-request model routing and escalation on invalid output.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import asgi  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from model_router import DEFAULT_SMALL_MODEL, ModelRouter  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+LARGE = "llama-3.3-70b-versatile"
+QUIZ = json.dumps({"questions": [
+    {"type": "mcq", "question": "Q?", "options": ["A", "B", "C", "D"], "correct_answer": "A", "explanation": "."}
+]})
+
+
+class TestRoute:
+    """route() sends small requests to the small model."""
+
+    def test_small_and_large_requests(self):
+        router = ModelRouter(LARGE)
+        assert router.route("chat", 40) == DEFAULT_SMALL_MODEL
+        assert router.route("chat", 5000) == LARGE
+        assert router.route("quiz", 40, count=5) == DEFAULT_SMALL_MODEL
+        assert router.route("quiz", 40, count=20) == LARGE
+        assert router.route("flashcard", 40, count=10) == DEFAULT_SMALL_MODEL
+        assert router.route("syllabus", 40) == LARGE
+        assert router.route(None, 40) == LARGE
+        stats = router.stats()
+        assert (stats["small"], stats["large"]) == (3, 3)
+
+    def test_chat_summaries_go_small(self):
+        router = ModelRouter(LARGE)
+        assert router.route("summary", 1500) == DEFAULT_SMALL_MODEL
+        assert router.route("summary", 3000) == LARGE
+
+    def test_disabled(self):
+        router = ModelRouter(LARGE, enabled=False)
+        assert router.route("chat", 1) == LARGE
+        assert router.escalate(LARGE) is None
+
+    def test_slow_large_model_stretches_the_limits(self):
+        router = ModelRouter(LARGE, min_samples=5)
+        assert router.route("quiz", 40, count=8) == LARGE
+        for _ in range(5):
+            router.observe("quiz", LARGE, 9.0)
+        assert router.over_slo("quiz")
+        assert router.route("quiz", 40, count=8) == DEFAULT_SMALL_MODEL
+        assert router.route("quiz", 40, count=20) == LARGE
+        assert router.stats()["latency"]["quiz"][LARGE]["count"] == 5
+
+    def test_escalate(self):
+        router = ModelRouter(LARGE)
+        assert router.escalate(DEFAULT_SMALL_MODEL) == LARGE
+        assert router.escalate(LARGE) is None
+        assert router.stats()["escalated"] == 1
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.delenv("MODEL_ROUTING", raising=False)
+        assert ModelRouter.from_env(LARGE).route("chat", 10) == LARGE  # opt-in
+        monkeypatch.setenv("MODEL_ROUTING", "1")
+        monkeypatch.setenv("GROQ_SMALL_MODEL", "tiny")
+        monkeypatch.setenv("MODEL_ROUTES", '{"quiz": {"max_count": 12}, "summary": {"max_input_tokens": 100}}')
+        router = ModelRouter.from_env(LARGE)
+        assert router.route("quiz", 40, count=12) == "tiny"
+        assert router.routes["quiz"]["slo_seconds"] == 6.0
+        assert router.route("summary", 50) == "tiny"
+
+    def test_invalid_routes_are_ignored(self, monkeypatch):
+        monkeypatch.setenv("MODEL_ROUTES", "not json")
+        monkeypatch.setenv("MODEL_ROUTING", "0")
+        router = ModelRouter.from_env(LARGE)
+        assert router.routes["quiz"]["max_count"] == 5
+        assert router.route("chat", 1) == LARGE
+
+
+class TestEndpoints:
+    """The chosen model reaches the upstream call and the ``model`` response field."""
+
+    @pytest.fixture
+    def groq(self, monkeypatch):
+        calls = []
+        replies = {}
+
+        def fake_groq_chat(messages, temperature=0.7, max_tokens=1500, model=None):
+            calls.append(model)
+            return replies.get(model, "Hello!"), None
+
+        monkeypatch.setattr(app_module, "groq_chat", fake_groq_chat)
+        monkeypatch.setattr(app_module, "model_router", ModelRouter(app_module.GROQ_MODEL))
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        return calls, replies
+
+    def test_short_chat_uses_the_small_model(self, groq):
+        calls, _ = groq
+        with app_module.app.test_client() as client:
+            body = client.post("/api/ai/chat", json={"message": "What is ATP?"}).get_json()
+        assert body["model"] == calls[0] == DEFAULT_SMALL_MODEL
+        assert client.get("/api/health").get_json()["model_routing"]["small"] == 1
+
+    def test_invalid_small_output_escalates(self, groq):
+        calls, replies = groq
+        replies[DEFAULT_SMALL_MODEL] = "Sure! Here are some questions."
+        replies[app_module.GROQ_MODEL] = QUIZ
+        with app_module.app.test_client() as client:
+            response = client.post("/api/ai/generate-quiz", json={"subject": "Biology", "count": 1})
+        assert response.status_code == 200
+        assert response.get_json()["model"] == app_module.GROQ_MODEL
+        assert calls == [DEFAULT_SMALL_MODEL, app_module.GROQ_MODEL]
+        assert app_module.model_router.stats()["escalated"] == 1
+
+    def test_quiz_cache_is_keyed_by_the_routed_model(self, groq, monkeypatch):
+        calls, replies = groq
+        replies[DEFAULT_SMALL_MODEL] = QUIZ
+        replies[app_module.GROQ_MODEL] = QUIZ
+        job = {"subject": "Biology", "count": 1}
+        assert app_module.run_quiz_job(job)[1]["model"] == DEFAULT_SMALL_MODEL
+        # With routing off, the same request must not get the small model's cached quiz
+        monkeypatch.setattr(app_module, "model_router", ModelRouter(app_module.GROQ_MODEL, enabled=False))
+        status, body = app_module.run_quiz_job(job)
+        assert (status, body["model"], body["cached"]) == (200, app_module.GROQ_MODEL, False)
+        assert calls == [DEFAULT_SMALL_MODEL, app_module.GROQ_MODEL]
+
+    def test_large_quiz_goes_straight_to_the_large_model(self, groq):
+        calls, replies = groq
+        replies[app_module.GROQ_MODEL] = QUIZ
+        status, body = app_module.run_quiz_job({"subject": "Biology", "count": 30})
+        assert (status, body["model"]) == (200, app_module.GROQ_MODEL)
+        assert calls[0] == app_module.GROQ_MODEL
+        assert app_module.model_router.stats()["escalated"] == 0
+
+
+def test_asgi_quiz_escalates_against_a_fake_server(monkeypatch):
+    replies = iter(["Sure! Here are some questions.", QUIZ])
+    with FakeLLMServer(reply=lambda messages: next(replies)) as server:
+        monkeypatch.setenv("GROQ_BASE_URL", server.url)
+        monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+        monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a"]))
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        monkeypatch.setattr(app_module, "get_gemini_model", lambda: None)
+        monkeypatch.setattr(app_module, "model_router", ModelRouter(app_module.GROQ_MODEL))
+
+        async def body():
+            transport = httpx.ASGITransport(app=asgi.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+                    return await client.post("/api/ai/generate-quiz", json={"subject": "Biology", "count": 1})
+            finally:
+                await app_module.groq_pool.aclose()
+
+        response = asyncio.run(body())
+    assert response.status_code == 200
+    assert response.json()["model"] == app_module.GROQ_MODEL
+    assert server.models == {DEFAULT_SMALL_MODEL: 1, app_module.GROQ_MODEL: 1}
@@ -0,0 +1,175 @@
+"""
+Tests for budgeted PDF extraction and syllabus upload formats.
+
+Run: pytest tests/ -v
+"""
+
+import base64
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from pdf_extract import PDFExtractionError, PDFExtractor, PDFLimitError, base64_decoded_size  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+def make_pdf(pages):
+    """Build a minimal PDF with one line of Helvetica text per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+class TestPDFExtractor:
+    """Tests for limits and lazy extraction."""
+
+    def test_base64_decoded_size(self):
+        for raw in (b"", b"a", b"ab", b"abc", b"abcd" * 100):
+            assert base64_decoded_size(base64.b64encode(raw).decode()) == len(raw)
+
+    def test_extracts_all_pages_under_budget(self):
+        text, pages_read, page_count = PDFExtractor().extract(make_pdf(["Week 1 Cells", "Week 2 DNA"]))
+        assert "Week 1 Cells" in text and "Week 2 DNA" in text
+        assert (pages_read, page_count) == (2, 2)
+
+    def test_stops_at_char_budget(self):
+        pdf = make_pdf([f"Page {i} " + "x" * 40 for i in range(8)])
+        text, pages_read, page_count = PDFExtractor().extract(pdf, char_budget=90)
+        assert pages_read == 2
+        assert page_count == 8
+        assert "Page 2" not in text
+
+    def test_max_pages(self):
+        _, pages_read, _ = PDFExtractor(max_pages=3).extract(make_pdf(["a"] * 6))
+        assert pages_read == 3
+
+    def test_limits(self):
+        pdf = make_pdf(["a"] * 5)
+        with pytest.raises(PDFLimitError):
+            PDFExtractor(max_bytes=100).extract(pdf)
+        with pytest.raises(PDFLimitError):
+            PDFExtractor(max_document_pages=4).extract(pdf)
+
+    def test_not_a_pdf(self):
+        with pytest.raises(PDFExtractionError):
+            PDFExtractor().extract(b"definitely not a pdf")
+
+    def test_process_pool_matches_serial(self):
+        pdf = make_pdf([f"Topic {i}" for i in range(6)])
+        extractor = PDFExtractor(workers=2, parallel_min_pages=2)
+        try:
+            parallel = extractor.extract(pdf)
+        finally:
+            extractor.close()
+        assert parallel == PDFExtractor().extract(pdf)
+
+    def test_process_pool_stops_after_budget_window(self):
+        pdf = make_pdf([f"Page {i} " + "x" * 40 for i in range(8)])
+        extractor = PDFExtractor(workers=2, parallel_min_pages=2)
+        try:
+            _, pages_read, _ = extractor.extract(pdf, char_budget=90)
+        finally:
+            extractor.close()
+        assert pages_read == 2
+
+
+class TestSyllabusUploads:
+    """parse-syllabus accepts JSON base64, multipart and raw PDF bodies."""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        prompts = []
+
+        def fake_generate(system, user, temperature=0.7, max_tokens=1024, **routing):
+            prompts.append(user)
+            return json.dumps({"subjects": [{"name": "Biology"}]}), None, "fake-model"
+
+        monkeypatch.setattr(app_module, "generate_text", fake_generate)
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        monkeypatch.setattr(app_module, "pdf_extractor", PDFExtractor(max_bytes=64 * 1024))
+        app_module.app.config["TESTING"] = True
+        with app_module.app.test_client() as client:
+            client.prompts = prompts
+            yield client
+
+    def test_json_base64(self, client):
+        body = {"file_type": "pdf", "file_data": base64.b64encode(make_pdf(["Biology 101"])).decode()}
+        response = client.post("/api/ai/parse-syllabus", json=body)
+        assert response.status_code == 200
+        assert "Biology 101" in client.prompts[0]
+
+    def test_multipart(self, client):
+        data = {"file": (io.BytesIO(make_pdf(["Chemistry 201"])), "syllabus.pdf", "application/pdf")}
+        response = client.post("/api/ai/parse-syllabus", data=data, content_type="multipart/form-data")
+        assert response.status_code == 200
+        assert "Chemistry 201" in client.prompts[0]
+
+    def test_raw_binary(self, client):
+        response = client.post(
+            "/api/ai/parse-syllabus", data=make_pdf(["Physics 301"]), content_type="application/pdf"
+        )
+        assert response.status_code == 200
+        assert "Physics 301" in client.prompts[0]
+
+    def test_same_file_shares_cache_across_formats(self, client):
+        pdf = make_pdf(["History 110"])
+        client.post("/api/ai/parse-syllabus", data=pdf, content_type="application/pdf")
+        second = client.post(
+            "/api/ai/parse-syllabus",
+            json={"file_type": "pdf", "file_data": base64.b64encode(pdf).decode()},
+        )
+        assert second.get_json()["cached"] is True
+        assert len(client.prompts) == 1
+
+    def test_oversized_base64_rejected_before_decoding(self, client):
+        body = {"file_type": "pdf", "file_data": "A" * (200 * 1024)}
+        assert client.post("/api/ai/parse-syllabus", json=body).status_code == 413
+        assert client.prompts == []
+
+    @pytest.mark.parametrize("file_data", [12345, ["JVBERi0="], {"data": "JVBERi0="}])
+    def test_non_string_file_data_is_a_bad_request(self, client, file_data):
+        body = {"file_type": "pdf", "file_data": file_data}
+        response = client.post("/api/ai/parse-syllabus", json=body)
+        assert response.status_code == 400
+        assert "file_data" in response.get_json()["error"]
+
+    def test_oversized_binary_rejected(self, client):
+        response = client.post("/api/ai/parse-syllabus", data=b"x" * (100 * 1024), content_type="application/pdf")
+        assert response.status_code == 413
+
+    def test_unreadable_pdf(self, client):
+        response = client.post("/api/ai/parse-syllabus", data=b"not a pdf", content_type="application/pdf")
+        assert response.status_code == 400
+
+    def test_missing_multipart_file(self, client):
+        response = client.post(
+            "/api/ai/parse-syllabus", data={"file_type": "pdf"}, content_type="multipart/form-data"
+        )
+        assert response.status_code == 400
@@ -0,0 +1,115 @@
+"""
+Tests for token-budgeted prompt assembly.
+
+Run: pytest tests/ -v
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from prompt_budget import (  # noqa: E402
+    TRUNCATION_MARKER, PromptBudget, compress, count_tokens, scaled_output_tokens, truncate_to_tokens,
+)
+from quiz_topup import output_tokens  # noqa: E402
+
+NOTES = "Mitochondria produce ATP through cellular respiration. " * 40
+
+
+class TestCounting:
+    """Tests for the local token approximation."""
+
+    def test_counts(self):
+        assert count_tokens("") == 0
+        assert count_tokens("The cell divides.") == 4
+        # Long words and long numbers take several tokens
+        assert count_tokens("internationalization") == 3
+        assert count_tokens("1234567") == 3
+
+    def test_whitespace_runs_count(self):
+        assert count_tokens("a\n\n\n\nb") == 3
+        assert count_tokens("a      b") == 3
+
+
+class TestCompress:
+    """Tests for whitespace and boilerplate removal."""
+
+    def test_whitespace(self):
+        text = "Cells\r\n\r\n\r\n\r\n  are    small\t\t units   \n\n\n\nDNA\u200b"
+        assert compress(text) == "Cells\n\n  are small units\n\nDNA"
+
+    def test_boilerplate_lines(self):
+        page = "BIO 101 - Fall 2026 Syllabus\nWeek {n}: topic {n}\n---------\nPage {n} of 3\n"
+        text = "".join(page.format(n=n) for n in range(1, 4))
+        assert compress(text) == "BIO 101 - Fall 2026 Syllabus\nWeek 1: topic 1\nWeek 2: topic 2\nWeek 3: topic 3"
+
+    def test_keeps_content(self):
+        assert compress("Step 1\n- mix\n- heat to 90 C") == "Step 1\n- mix\n- heat to 90 C"
+
+
+class TestTruncate:
+    """Tests for boundary-aware truncation."""
+
+    def test_short_text_is_untouched(self):
+        assert truncate_to_tokens("Cells divide.", 100) == "Cells divide."
+
+    def test_cuts_at_a_sentence(self):
+        fitted = truncate_to_tokens(NOTES, 50)
+        assert fitted.endswith("respiration." + TRUNCATION_MARKER)
+        assert count_tokens(fitted[:-len(TRUNCATION_MARKER)]) <= 50
+
+
+class TestPromptBudget:
+    """Tests for splitting the budget between prompt parts and output."""
+
+    def test_context_gets_the_remainder(self):
+        budget = PromptBudget("m", context_window=10000, max_input_tokens=1000)
+        assert budget.context_tokens("system " * 100, "frame " * 100, max_output=500) == 800
+        # The output reservation only binds when the context window is small
+        small = PromptBudget("m", context_window=1200, max_input_tokens=1000)
+        assert small.context_tokens("system " * 100, "frame " * 100, max_output=500) == 500
+
+    def test_fit_compresses_then_truncates(self):
+        budget = PromptBudget("m", context_window=10000, max_input_tokens=200)
+        assert budget.fit("a   b\n\n\n\nc", "sys", "frame", 100) == "a b\n\nc"
+        fitted = budget.fit(NOTES, "sys", "frame", 100)
+        assert fitted.endswith(TRUNCATION_MARKER)
+        assert count_tokens(fitted) <= 200
+        stats = budget.stats()
+        assert stats["prompts"] == 2
+        assert stats["truncated"] == 1
+        assert stats["compressed_tokens_saved"] > 0
+
+    def test_output_is_clamped_to_the_model(self):
+        assert PromptBudget.for_model("gemini-2.0-flash").output_tokens(20000) == 8192
+
+    def test_quiz_output_scales_with_count_and_type(self):
+        assert scaled_output_tokens(0, 100) == 300
+        assert output_tokens({"type": "flashcard", "count": 1}) < output_tokens({"count": 10})
+        assert output_tokens({"count": 10, "question_types": ["true_false"]}) < output_tokens({"count": 10})
+
+
+class TestPrompts:
+    """The app's prompts use the budget instead of fixed character slices."""
+
+    def test_chat_notes_are_capped_and_retrieved(self):
+        filler = "\n\n".join(f"Section {i}. Cells divide by mitosis and meiosis in stage {i}." for i in range(300))
+        notes = filler + "\n\nThe key fact is at the end."
+        prompt = app_module.build_chat_prompt("What is the key fact?", notes)
+        assert "The key fact is at the end." in prompt
+        assert prompt.endswith("Student's question: What is the key fact?")
+        assert count_tokens(prompt) <= app_module.CHAT_CONTEXT_TOKENS + 50
+
+    def test_chat_without_notes(self):
+        assert app_module.build_chat_prompt("Hi", "   \n ") == "Student's question: Hi"
+
+    def test_quiz_content_is_budgeted(self):
+        content = "Photosynthesis converts light into chemical energy. " * 2000
+        prompt, error = app_module.build_quiz_prompt({"content": content, "count": 5})
+        assert error is None
+        assert prompt.endswith(TRUNCATION_MARKER)
+        assert count_tokens(prompt) <= app_module.prompt_budget.max_input_tokens
+        # Far more than the old 4000-character slice survives
+        assert len(prompt) > 8000
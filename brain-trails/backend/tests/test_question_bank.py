@@ -0,0 +1,190 @@
+"""
+Tests for the question bank: serving unseen questions, feeding it from live
+generations and demand-driven background refill.
+
+Run: pytest tests/ -v
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from question_bank import QuestionBank, bank_keys  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+
+import pytest  # noqa: E402
+
+QUIZ = {"subject": "Biology", "topic": "Cells", "count": 3}
+
+
+def mcq(text):
+    return {"type": "mcq", "question": text, "options": ["A", "B", "C", "D"], "correct_answer": "A"}
+
+
+@pytest.fixture
+def bank(tmp_path):
+    return QuestionBank(str(tmp_path / "bank.sqlite3"), min_demand=2, target_stock=6, refill_interval=0)
+
+
+class TestKeys:
+    """Which requests can be served from the bank."""
+
+    def test_subject_topic_requests(self):
+        assert bank_keys({"subject": " Cell  Biology ", "topic": "Mitosis"}) == [
+            ("cell biology", "mitosis", "medium", "mcq"),
+        ]
+        assert bank_keys({"subject": "Bio", "question_types": ["true_false", "mcq"], "difficulty": "Hard"}) == [
+            ("bio", "", "hard", "mcq"), ("bio", "", "hard", "true_false"),
+        ]
+        assert bank_keys({"subject": "Bio", "type": "flashcard", "difficulty": "hard"}) == [
+            ("bio", "", "", "flashcard"),
+        ]
+
+    def test_content_and_unknown_types_are_not_banked(self):
+        assert bank_keys({"subject": "Bio", "content": "Cells make ATP."}) == []
+        assert bank_keys({"subject": "Bio", "question_types": ["essay"]}) == []
+        assert bank_keys({"content": "Cells"}) == []
+
+
+class TestServing:
+    """take() serves questions a client hasn't seen; add() fills the bank."""
+
+    def test_clients_get_unseen_questions(self, bank):
+        assert bank.add(QUIZ, [mcq(f"Question {i}?") for i in range(5)], "model-a") == 5
+        first, model = bank.take(QUIZ, "client-a")
+        assert (len(first), model) == (3, "model-a")
+        # Only two unseen questions are left for client-a
+        assert bank.take(QUIZ, "client-a") is None
+        assert len(bank.take(QUIZ, "client-b")[0]) == 3
+        assert bank.stats()["hits"] == 2 and bank.stats()["misses"] == 1
+
+    def test_live_generations_are_seen_by_their_client(self, bank):
+        bank.add(QUIZ, [mcq(f"Question {i}?") for i in range(3)], "model-a", client="client-a")
+        assert bank.take(QUIZ, "client-a") is None
+        assert bank.take(QUIZ, "client-b") is not None
+
+    def test_duplicates_and_wrong_types_are_skipped(self, bank):
+        questions = [mcq("What is a cell?"), mcq("what is a CELL"), {"type": "true_false", "question": "T?"}]
+        assert bank.add(QUIZ, questions, "model-a") == 1
+
+    def test_requested_types_are_interleaved(self, bank):
+        data = {**QUIZ, "count": 4, "question_types": ["mcq", "true_false"]}
+        bank.add(data, [mcq(f"M{i}?") for i in range(4)], "m")
+        bank.add(data, [{"type": "true_false", "question": f"T{i}?", "correct_answer": "True"} for i in range(4)], "m")
+        questions, _ = bank.take(data, "client-a")
+        assert sorted(q["type"] for q in questions) == ["mcq", "mcq", "true_false", "true_false"]
+
+    def test_topics_are_capped(self, tmp_path):
+        bank = QuestionBank(str(tmp_path / "bank.sqlite3"), max_per_topic=4, refill_interval=0)
+        bank.add(QUIZ, [mcq(f"Question {i}?") for i in range(10)], "m")
+        assert bank.stock(bank_keys(QUIZ)[0]) == 4
+
+    def test_disabled(self):
+        bank = QuestionBank(None, enabled=False)
+        assert bank.add(QUIZ, [mcq("Q?")], "m") == 0
+        assert bank.take(QUIZ, "client-a") is None
+        assert bank.exhausted(QUIZ, "client-a") is False
+
+    def test_exhausted_clients(self, bank):
+        assert bank.exhausted(QUIZ, "client-a") is False
+        bank.add(QUIZ, [mcq(f"Question {i}?") for i in range(4)], "m", client="client-a")
+        assert bank.exhausted(QUIZ, "client-a") is True
+        assert bank.exhausted(QUIZ, "client-b") is False
+        assert bank.exhausted(QUIZ, None) is False
+
+    def test_from_env_is_opt_in(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("QUESTION_BANK", raising=False)
+        monkeypatch.delenv("QUESTION_BANK_PATH", raising=False)
+        assert QuestionBank.from_env().enabled is False
+        monkeypatch.setenv("QUESTION_BANK", "1")
+        with pytest.raises(ValueError):
+            QuestionBank.from_env()
+        monkeypatch.setenv("QUESTION_BANK_PATH", str(tmp_path / "bank.sqlite3"))
+        assert QuestionBank.from_env().enabled is True
+
+
+class TestRefill:
+    """Popular low-stock topics are refilled in the background."""
+
+    def test_refills_the_most_requested_topic(self, bank):
+        calls = []
+
+        def generate(data, existing):
+            calls.append((data, len(existing)))
+            return [mcq(f"{data['topic']} {len(calls)}-{i}?") for i in range(data["count"])], "model-r"
+
+        bank.set_refill(generate)
+        assert bank.refill_once() is None  # no demand yet
+        for _ in range(2):
+            bank.take(QUIZ, "client-a")
+        bank.take({**QUIZ, "topic": "DNA"}, "client-a")
+
+        key, added = bank.refill_once()
+        assert key == ("biology", "cells", "medium", "mcq") and added == 10
+        assert calls[0][0] == {"subject": "biology", "topic": "cells", "count": 10, "type": "quiz",
+                               "difficulty": "medium", "question_types": ["mcq"]}
+        # Stocked now (and claimed); DNA has too little demand
+        assert bank.refill_once() is None
+        assert bank.take(QUIZ, "client-a")[1] == "model-r"
+
+    def test_background_worker_waits_for_idle(self, tmp_path):
+        bank = QuestionBank(str(tmp_path / "bank.sqlite3"), min_demand=1, refill_interval=0.01)
+        idle = {"value": False}
+        bank.set_refill(lambda data, existing: ([mcq(f"Q{i}?") for i in range(3)], "m"), lambda: idle["value"])
+        try:
+            bank.take(QUIZ, "client-a")
+            time.sleep(0.1)
+            assert bank.stats()["refills"] == 0
+            idle["value"] = True
+            deadline = time.monotonic() + 5
+            while bank.stats()["refills"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert bank.take(QUIZ, "client-a") is not None
+        finally:
+            bank.stop()
+
+    def test_refill_generator_uses_groq(self, monkeypatch):
+        prompts = []
+
+        def fake_groq_chat(messages, temperature=0.7, max_tokens=1500, model=None):
+            prompts.append(messages[1]["content"])
+            return json.dumps({"questions": [mcq("What is a ribosome?"), mcq("What is a cell?")]}), None
+
+        monkeypatch.setattr(app_module, "groq_chat", fake_groq_chat)
+        data = {"subject": "biology", "topic": "cells", "count": 2, "type": "quiz", "question_types": ["mcq"]}
+        questions, model = app_module.refill_question_bank(data, [mcq("What is a cell?")])
+        assert model == app_module.GROQ_MODEL
+        assert [q["question"] for q in questions] == ["What is a ribosome?", "What is a cell?"]
+        assert "do not repeat" in prompts[0] and "What is a cell?" in prompts[0]
+
+
+class TestEndpoint:
+    """/api/ai/generate-quiz serves bank hits and feeds misses into the bank."""
+
+    def test_second_client_is_served_from_the_bank(self, bank, monkeypatch):
+        calls = []
+
+        def fake_generate(system, user, temperature=0.7, max_tokens=1024, **routing):
+            calls.append(user)
+            return json.dumps({"questions": [mcq(f"Question {len(calls)}-{i}?") for i in range(3)]}), None, "m"
+
+        monkeypatch.setattr(app_module, "generate_text", fake_generate)
+        monkeypatch.setattr(app_module, "question_bank", bank)
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+
+        with app_module.app.test_client() as client:
+            live = client.post("/api/ai/generate-quiz", json=QUIZ, headers={"Authorization": "Bearer a"}).get_json()
+            banked = client.post("/api/ai/generate-quiz", json=QUIZ, headers={"Authorization": "Bearer b"}).get_json()
+            again = client.post("/api/ai/generate-quiz", json=QUIZ, headers={"Authorization": "Bearer a"}).get_json()
+            health = client.get("/api/health").get_json()
+
+        assert "bank" not in live and banked["bank"] is True
+        assert sorted(q["question"] for q in banked["questions"]) == sorted(q["question"] for q in live["questions"])
+        # Client a has seen everything banked, so it gets a fresh quiz rather than the cached one
+        assert again["cached"] is False and "bank" not in again
+        assert len(calls) == 2
+        assert health["question_bank"]["questions"] == 6
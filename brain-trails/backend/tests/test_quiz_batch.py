@@ -0,0 +1,134 @@
+"""
+Tests for the batch quiz generation endpoint (Flask and ASGI).
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import asgi  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+JOBS = [
+    {"subject": "Biology", "topic": "Cells", "count": 1, "type": "flashcard"},
+    {"subject": "Biology", "topic": "DNA", "count": 1, "type": "flashcard"},
+    {"topic": "missing subject", "type": "flashcard"},
+    {"subject": "Chemistry", "topic": "Bonds", "count": 1, "difficulty": "hard"},
+]
+
+
+def _lines(text):
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    state = {"active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def fake_generate(system, user, temperature=0.7, max_tokens=1024, **routing):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.2)
+        with lock:
+            state["active"] -= 1
+        return json.dumps({"questions": [{"question": user[:40], "answer": "A"}]}), None, "fake-model"
+
+    monkeypatch.setattr(app_module, "generate_text", fake_generate)
+    monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+    monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a", "key-b"]))
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as test_client:
+        test_client.state = state
+        yield test_client
+
+
+class TestQuizBatch:
+    """Tests for the Flask NDJSON batch route."""
+
+    def test_streams_results_with_per_item_errors(self, client):
+        started = time.perf_counter()
+        response = client.post("/api/ai/generate-quiz/batch", json={"jobs": JOBS})
+        lines = _lines(response.get_data(as_text=True))
+        elapsed = time.perf_counter() - started
+
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        items, summary = lines[:-1], lines[-1]
+        assert sorted(item["index"] for item in items) == [0, 1, 2, 3]
+        by_index = {item["index"]: item for item in items}
+        assert by_index[2]["status"] == 400
+        assert "subject" in by_index[2]["error"]
+        assert by_index[0]["result"]["questions"]
+        assert by_index[3]["subject"] == "Chemistry"
+        assert summary == {"done": True, "total": 4, "failed": 1, "total_ms": summary["total_ms"]}
+        # The three valid jobs overlap instead of running back to back
+        assert client.state["peak"] == 3
+        assert elapsed < 0.5
+
+    def test_concurrency_is_capped_by_keys(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["only-key"]))
+        jobs = [{"subject": "History", "topic": f"Era {i}", "type": "flashcard", "count": 1} for i in range(6)]
+        client.post("/api/ai/generate-quiz/batch", json={"jobs": jobs}).get_data()
+        assert client.state["peak"] == 2
+
+    def test_results_are_cached_like_single_requests(self, client):
+        client.post("/api/ai/generate-quiz/batch", json={"jobs": JOBS[:1]}).get_data()
+        single = client.post("/api/ai/generate-quiz", json=JOBS[0])
+        assert single.get_json()["cached"] is True
+
+    def test_validation(self, client, monkeypatch):
+        assert client.post("/api/ai/generate-quiz/batch", json={}).status_code == 400
+        assert client.post("/api/ai/generate-quiz/batch", json={"jobs": []}).status_code == 400
+        monkeypatch.setattr(app_module, "QUIZ_BATCH_MAX_JOBS", 2)
+        assert client.post("/api/ai/generate-quiz/batch", json={"jobs": JOBS}).status_code == 400
+
+    def test_non_object_job(self, client):
+        response = client.post("/api/ai/generate-quiz/batch", json={"jobs": ["nope", JOBS[0]]})
+        items = _lines(response.get_data(as_text=True))[:-1]
+        assert {item["index"]: item["status"] for item in items} == {0: 400, 1: 200}
+
+
+class TestASGIQuizBatch:
+    """The ASGI route keeps the same contract on the event loop."""
+
+    def test_batch(self, monkeypatch):
+        reply = json.dumps({"questions": [{"question": "Q?", "answer": "A"}]})
+        with FakeLLMServer(latency=0.3, reply=reply) as server:
+            monkeypatch.setenv("GROQ_BASE_URL", server.url)
+            monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+            monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a", "key-b"]))
+            monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+            monkeypatch.setattr(app_module, "get_gemini_model", lambda: None)
+
+            async def body():
+                transport = httpx.ASGITransport(app=asgi.app)
+                try:
+                    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+                        return await client.post("/api/ai/generate-quiz/batch", json={"jobs": JOBS})
+                finally:
+                    await app_module.groq_pool.aclose()
+
+            response = asyncio.run(body())
+            lines = _lines(response.text)
+            assert response.headers["content-type"] == "application/x-ndjson"
+            assert lines[-1]["failed"] == 1
+            assert {item["index"] for item in lines[:-1]} == {0, 1, 2, 3}
+            assert server.requests == 3
+            assert server.max_in_flight == 3
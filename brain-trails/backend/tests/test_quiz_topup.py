@@ -0,0 +1,148 @@
+"""
+Tests for quiz count validation and partial regeneration.
+
+Run: pytest tests/ -v
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from quiz_topup import QuizTopup, requested_count  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+def _questions(start, end, qtype="short_answer"):
+    return [
+        {"type": qtype, "question": f"Question number {i}?", "correct_answer": f"Answer {i}", "explanation": "..."}
+        for i in range(start, end)
+    ]
+
+
+def _reply(questions):
+    return json.dumps({"questions": questions})
+
+
+class TestQuizTopup:
+    """Tests for fitting and planning."""
+
+    def test_requested_count(self):
+        assert requested_count({}) == 10
+        assert requested_count({"num_questions": "4"}) == 4
+        assert requested_count({"count": "lots"}) == 10
+        assert requested_count({"count": 500}) == 50
+
+    def test_fit_drops_wrong_types_duplicates_and_extras(self):
+        topup = QuizTopup()
+        duplicate = dict(_questions(0, 1)[0], question="question NUMBER 0")
+        questions = _questions(0, 3) + _questions(3, 4, "mcq") + [duplicate]
+        fitted = topup.fit(questions, {"count": 2, "question_types": ["short_answer"]})
+        assert [q["question"] for q in fitted] == ["Question number 0?", "Question number 1?"]
+
+    def test_prompt_lists_existing_questions(self):
+        prompt = QuizTopup().prompt("Generate 5 questions", _questions(0, 2), 3)
+        assert "exactly 3" in prompt
+        assert "- Question number 1?" in prompt
+
+    def test_max_tokens_scales_with_missing(self):
+        topup = QuizTopup()
+        first_text = _reply(_questions(0, 7))
+        assert topup.max_tokens(first_text, _questions(0, 7), 3) < 3000
+
+
+class TestShortQuizzes:
+    """run_quiz_job() asks only for the missing questions."""
+
+    @pytest.fixture
+    def fake_generate(self, monkeypatch):
+        calls = []
+        replies = []
+
+        def generate(system, user, temperature=0.7, max_tokens=1024, **routing):
+            calls.append({"user": user, "max_tokens": max_tokens})
+            return replies.pop(0), None, "fake-model"
+
+        monkeypatch.setattr(app_module, "generate_text", generate)
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        monkeypatch.setattr(app_module, "quiz_topup", QuizTopup())
+        return calls, replies
+
+    def test_short_quiz_is_topped_up(self, fake_generate):
+        calls, replies = fake_generate
+        # 7 of 10 come back; the follow-up returns one duplicate and three new questions
+        replies.extend([_reply(_questions(0, 7)), _reply(_questions(6, 10))])
+        status, body = app_module.run_quiz_job({"subject": "Biology", "count": 10})
+
+        assert status == 200
+        assert len(body["questions"]) == 10
+        assert body["partial"] is False
+        assert len(calls) == 2
+        assert "exactly 3" in calls[1]["user"]
+        assert calls[1]["max_tokens"] < 3000
+        stats = app_module.quiz_topup.stats()
+        assert stats["topups"] == 1
+        assert stats["recovered"] == 3
+        assert stats["tokens_saved"] > 0
+        # Complete quizzes are cached
+        assert app_module.run_quiz_job({"subject": "Biology", "count": 10})[1]["cached"] is True
+
+    def test_full_quiz_is_not_topped_up(self, fake_generate):
+        calls, replies = fake_generate
+        replies.append(_reply(_questions(0, 5)))
+        status, body = app_module.run_quiz_job({"subject": "Biology", "count": 5})
+        assert len(calls) == 1
+        assert len(body["questions"]) == 5
+
+    def test_still_short_is_partial(self, fake_generate):
+        calls, replies = fake_generate
+        replies.extend([_reply(_questions(0, 7)), "Sorry, I can't."])
+        status, body = app_module.run_quiz_job({"subject": "Biology", "count": 10})
+        assert status == 200
+        assert len(body["questions"]) == 7
+        assert body["partial"] is True
+        assert app_module.quiz_topup.stats()["still_short"] == 1
+
+    def test_budget_exhausted_skips_topup(self, fake_generate, monkeypatch):
+        calls, replies = fake_generate
+        monkeypatch.setattr(app_module, "quiz_topup", QuizTopup(budget_seconds=0))
+        replies.append(_reply(_questions(0, 7)))
+        status, body = app_module.run_quiz_job({"subject": "Biology", "count": 10})
+        assert len(calls) == 1
+        assert body["partial"] is True
+        assert app_module.quiz_topup.stats()["skipped_budget"] == 1
+
+
+class TestStreamTopup:
+    """The streaming route sends topped-up questions before `done`."""
+
+    def test_stream_emits_missing_questions(self, monkeypatch):
+        def reply(messages):
+            if "more question" in messages[-1]["content"]:
+                return _reply(_questions(4, 6))
+            return _reply(_questions(0, 4))
+
+        with FakeLLMServer(reply=reply) as server:
+            monkeypatch.setenv("GROQ_BASE_URL", server.url)
+            monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+            monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a"]))
+            monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+            monkeypatch.setattr(app_module, "quiz_topup", QuizTopup())
+            app_module.app.config["TESTING"] = True
+            with app_module.app.test_client() as client:
+                text = client.post("/api/ai/generate-quiz/stream", json={"subject": "Biology", "count": 6}).get_data(
+                    as_text=True
+                )
+            app_module.groq_pool.close()
+
+        questions = [line for line in text.splitlines() if line == "event: question"]
+        assert len(questions) == 6
+        assert '"partial": false' in text
+        assert server.requests == 2
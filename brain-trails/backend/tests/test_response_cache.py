@@ -0,0 +1,127 @@
+"""
+Tests for the content-addressed AI response cache.
+
+Run: pytest tests/ -v
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from response_cache import (  # noqa: E402
+    MemoryCacheBackend,
+    ResponseCache,
+    SQLiteCacheBackend,
+    make_cache_key,
+)
+
+import pytest  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend_and_clock(request, tmp_path):
+    """Run each backend test against both stores."""
+    clock = FakeClock()
+    if request.param == "memory":
+        return MemoryCacheBackend(max_entries=2, clock=clock), clock
+    return SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=2, clock=clock), clock
+
+
+class TestCacheKey:
+    """Tests for request fingerprinting."""
+
+    def test_whitespace_is_normalized(self):
+        a = make_cache_key("sys", "Generate 5  questions\n about cells", "m", 0.4, 3000)
+        b = make_cache_key("sys", "Generate 5 questions about cells ", "m", 0.4, 3000)
+        assert a == b
+
+    def test_parameters_change_key(self):
+        base = make_cache_key("sys", "prompt", "m", 0.4, 3000)
+        assert base != make_cache_key("sys", "prompt", "m", 0.2, 3000)
+        assert base != make_cache_key("sys", "prompt", "m", 0.4, 1500)
+        assert base != make_cache_key("sys", "prompt", "other", 0.4, 3000)
+        assert base != make_cache_key("other", "prompt", "m", 0.4, 3000)
+
+
+class TestBackends:
+    """Tests shared by the memory and SQLite backends."""
+
+    def test_ttl_expiry(self, backend_and_clock):
+        backend, clock = backend_and_clock
+        cache = ResponseCache(backend, ttl=60)
+        cache.set("k", {"v": 1})
+        assert cache.get("k") == {"v": 1}
+        clock.now += 61
+        assert cache.get("k") is None
+        assert cache.stats()["evictions"] == 1
+
+    def test_lru_eviction(self, backend_and_clock):
+        backend, clock = backend_and_clock
+        cache = ResponseCache(backend, ttl=60)
+        cache.set("a", 1)
+        clock.now += 1
+        cache.set("b", 2)
+        clock.now += 1
+        assert cache.get("a") == 1  # touch a so b is least recently used
+        clock.now += 1
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["hits"] == 3
+        assert stats["misses"] == 1
+
+    def test_sqlite_is_shared_between_instances(self, tmp_path):
+        """Two caches on one file (e.g. two workers) see each other's entries."""
+        path = str(tmp_path / "shared.sqlite3")
+        writer = ResponseCache(SQLiteCacheBackend(path))
+        reader = ResponseCache(SQLiteCacheBackend(path))
+        writer.set("k", {"questions": ["q"]})
+        assert reader.get("k") == {"questions": ["q"]}
+
+
+class TestCachedEndpoints:
+    """Tests for cache integration in the AI routes."""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        calls = []
+
+        def fake_groq_chat(messages, temperature=0.7, max_tokens=1500, model=None):
+            calls.append(messages)
+            return json.dumps({"questions": [{"question": "Q?", "answer": "A"}]}), None
+
+        monkeypatch.setattr(app_module, "groq_chat", fake_groq_chat)
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        app_module.app.config["TESTING"] = True
+        with app_module.app.test_client() as client:
+            client.calls = calls
+            yield client
+
+    def test_quiz_second_request_is_cached(self, client):
+        body = json.dumps({"type": "flashcard", "subject": "Biology", "topic": "Cells", "count": 1})
+        first = client.post("/api/ai/generate-quiz", data=body, content_type="application/json").get_json()
+        second = client.post("/api/ai/generate-quiz", data=body, content_type="application/json").get_json()
+
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert second["questions"] == first["questions"]
+        assert len(client.calls) == 1
+
+    def test_health_reports_cache_stats(self, client):
+        data = client.get("/api/health").get_json()
+        assert "hits" in data["cache"]
+        assert "evictions" in data["cache"]
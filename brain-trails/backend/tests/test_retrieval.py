@@ -0,0 +1,100 @@
+"""
+Tests for BM25 retrieval over long notes.
+
+Run: pytest tests/ -v
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from prompt_budget import PromptBudget, count_tokens  # noqa: E402
+from retrieval import GAP_MARKER, NoteIndex, NoteRetriever, split_chunks, terms  # noqa: E402
+
+FILLER = "The professor reviewed general course logistics and reading lists for the week. " * 6
+
+
+def long_note():
+    sections = [f"# Week {i}\n{FILLER}" for i in range(30)]
+    sections[0] = "# Biology 101 notes\nIntroduction to the course."
+    sections[27] = "# Week 27\nThe Krebs cycle happens in the mitochondrial matrix and yields NADH and FADH2."
+    return "\n\n".join(sections)
+
+
+class TestChunking:
+    """Tests for term extraction and chunk packing."""
+
+    def test_terms(self):
+        assert terms("What are the Cells doing in 2026?") == ["cell", "doing", "2026"]
+        assert terms("class glass") == ["class", "glass"]
+
+    def test_split_chunks_packs_paragraphs(self):
+        chunks = split_chunks("one\n\ntwo\n\n" + "Long sentence here. " * 50, chunk_tokens=40)
+        assert chunks[0].startswith("one\n\ntwo\n\nLong sentence here. Long sentence here.")
+        assert len(chunks) > 3
+        assert all(count_tokens(chunk) <= 40 for chunk in chunks)
+
+
+class TestNoteIndex:
+    """Tests for BM25 ranking and packing."""
+
+    def test_ranks_the_matching_chunk_first(self):
+        index = NoteIndex(long_note())
+        scores = index.scores("Where does the Krebs cycle happen?")
+        best = max(range(len(scores)), key=scores.__getitem__)
+        assert "Krebs" in index.chunks[best]
+
+    def test_select_keeps_intro_and_order(self):
+        index = NoteIndex(long_note(), chunk_tokens=60)
+        selected = index.select("krebs cycle", budget_tokens=120)
+        assert selected.startswith("# Biology 101 notes")
+        assert "Krebs cycle" in selected
+        assert GAP_MARKER in selected
+        assert count_tokens(selected) <= 120
+
+    def test_no_match(self):
+        assert NoteIndex(long_note()).select("quantum chromodynamics", 500) is None
+
+
+class TestNoteRetriever:
+    """Tests for the per-note index cache."""
+
+    def test_short_notes_are_returned_whole(self):
+        retriever = NoteRetriever()
+        assert retriever.select("Cells   divide.", "anything", 100) == "Cells divide."
+        assert retriever.select("", "anything", 100) == ""
+
+    def test_follow_ups_reuse_the_index(self):
+        retriever = NoteRetriever()
+        note = long_note()
+        assert "Krebs" in retriever.select(note, "krebs cycle?", 300)
+        assert "Krebs" in retriever.select(note, "What does the Krebs cycle yield?", 300)
+        stats = retriever.stats()
+        assert (stats["index_misses"], stats["index_hits"], stats["retrievals"]) == (1, 1, 2)
+
+    def test_lru_eviction(self):
+        retriever = NoteRetriever(max_entries=2)
+        for note in ("a", "b", "c"):
+            retriever.index(note)
+        assert retriever.stats()["cached_notes"] == 2
+        retriever.index("a")
+        assert retriever.stats()["index_misses"] == 4
+
+    def test_unmatched_question_falls_back_to_the_note(self):
+        retriever = NoteRetriever()
+        assert retriever.select(long_note(), "quantum chromodynamics", 300).startswith("# Biology 101 notes")
+        assert retriever.stats()["no_match"] == 1
+
+
+class TestChatPrompt:
+    """The chat prompt carries the relevant part of a long note."""
+
+    def test_question_about_the_end_of_a_long_note(self, monkeypatch):
+        monkeypatch.setattr(app_module, "prompt_budget", PromptBudget("m", 131072, max_input_tokens=900))
+        monkeypatch.setattr(app_module, "note_retriever", NoteRetriever())
+        prompt = app_module.build_chat_prompt("Where does the Krebs cycle happen?", long_note())
+        assert "mitochondrial matrix" in prompt
+        assert "[... truncated]" not in prompt
+        assert count_tokens(prompt) + count_tokens(app_module.STUDY_SYSTEM_PROMPT) <= 900
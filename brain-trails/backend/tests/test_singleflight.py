@@ -0,0 +1,300 @@
+"""
+Tests for single-flight request coalescing.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+import deadlines  # noqa: E402
+from deadlines import Deadline, DeadlineExceeded  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from singleflight import SingleFlight, request_fingerprint  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+def _in_threads(n, target):
+    results = [None] * n
+    errors = [None] * n
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+class TestSingleFlight:
+    """Tests for in-process and cross-worker coalescing."""
+
+    def test_fingerprint_is_order_stable(self):
+        assert request_fingerprint({"a": 1, "b": 2}) == request_fingerprint({"b": 2, "a": 1})
+        assert request_fingerprint("m", [1]) != request_fingerprint("m", [2])
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return "result"
+
+        results, errors = _in_threads(10, lambda: flight.do("k", slow))
+        assert len(calls) == 1
+        assert [r[0] for r in results] == ["result"] * 10
+        assert sum(shared for _, shared in results) == 9
+        assert flight.stats()["followers"] == 9
+
+    def test_followers_see_leader_exception(self):
+        flight = SingleFlight()
+
+        def boom():
+            time.sleep(0.1)
+            raise RuntimeError("upstream down")
+
+        results, errors = _in_threads(4, lambda: flight.do("k", boom))
+        assert all(isinstance(e, RuntimeError) for e in errors)
+        assert flight.stats()["in_flight"] == 0
+
+    def test_sequential_calls_are_not_coalesced(self):
+        flight = SingleFlight()
+        assert flight.do("k", lambda: 1) == (1, False)
+        assert flight.do("k", lambda: 2) == (2, False)
+
+    def test_cross_worker_lock_shares_result(self, tmp_path):
+        """Two 'workers' (separate instances) sharing a lock dir call upstream once."""
+        lock_dir = str(tmp_path / "locks")
+        worker_a = SingleFlight(lock_dir=lock_dir)
+        worker_b = SingleFlight(lock_dir=lock_dir)
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.3)
+            return ["text", None]
+
+        first = {}
+        thread = threading.Thread(target=lambda: first.update(r=worker_a.do("k", slow)))
+        thread.start()
+        time.sleep(0.1)
+        second = worker_b.do("k", slow)
+        thread.join()
+
+        assert len(calls) == 1
+        assert first["r"] == (["text", None], False)
+        assert second == (["text", None], True)
+        assert worker_b.stats()["cross_worker_hits"] == 1
+
+    def test_cross_worker_results_stay_out_of_the_response_cache(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("SINGLEFLIGHT_LOCK_DIR", str(tmp_path / "locks"))
+        flight = SingleFlight.from_env()
+        flight.do("k", lambda: "result")
+        assert flight.store is not app_module.response_cache
+        assert flight.store.backend.path == str(tmp_path / "locks" / "results.sqlite3")
+        assert len(flight.store.backend) == 1
+
+    def test_unrelated_keys_do_not_share_a_lock(self, tmp_path):
+        flight = SingleFlight(lock_dir=str(tmp_path / "locks"))
+        assert flight._file_lock("abc1").path != flight._file_lock("abc2").path
+
+    def test_async_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "result"
+
+        async def body():
+            return await asyncio.gather(*[flight.ado("k", slow) for _ in range(5)])
+
+        results = asyncio.run(body())
+        assert len(calls) == 1
+        assert [r for r, _ in results] == ["result"] * 5
+
+    def test_cancelled_leader_does_not_cancel_followers(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "result"
+
+        async def body():
+            leader = asyncio.ensure_future(flight.ado("k", slow))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.ado("k", slow))
+            await asyncio.sleep(0.02)
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        assert asyncio.run(body()) == ("result", True)
+        assert len(calls) == 1
+        assert flight.stats()["in_flight"] == 0
+
+    def test_upstream_is_cancelled_without_waiters(self):
+        flight = SingleFlight()
+        cancelled = []
+
+        async def stuck():
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def body():
+            caller = asyncio.ensure_future(flight.ado("k", stuck))
+            await asyncio.sleep(0.02)
+            caller.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await caller
+            await asyncio.sleep(0)
+
+        asyncio.run(body())
+        assert cancelled == [True]
+        assert flight.stats()["in_flight"] == 0
+
+
+class TestDeadlines:
+    """Each caller waits under its own deadline, not the leader's."""
+
+    def test_follower_outlives_a_leader_with_a_short_deadline(self):
+        flight = SingleFlight()
+        calls = []
+        follower = {}
+
+        def upstream():
+            calls.append(1)
+            deadline = deadlines.current()
+            time.sleep(min(0.3, deadline.remaining()))
+            deadline.check("groq")
+            return "result"
+
+        def follow():
+            time.sleep(0.05)
+            with deadlines.scope(Deadline(60.0)):
+                follower["r"] = flight.do("k", upstream)
+
+        thread = threading.Thread(target=follow)
+        thread.start()
+        with deadlines.scope(Deadline(0.1)):
+            with pytest.raises(DeadlineExceeded):
+                flight.do("k", upstream)
+        thread.join()
+        assert follower["r"] == ("result", False)
+        assert len(calls) == 2
+        assert flight.stats()["leader_deadline_retries"] == 1
+
+    def test_follower_gives_up_at_its_own_deadline(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            time.sleep(0.5)
+            return "result"
+
+        thread = threading.Thread(target=lambda: flight.do("k", slow))
+        thread.start()
+        started.wait()
+        begun = time.perf_counter()
+        with deadlines.scope(Deadline(0.1)):
+            with pytest.raises(DeadlineExceeded, match="during singleflight"):
+                flight.do("k", slow)
+        assert time.perf_counter() - begun < 0.4
+        thread.join()
+
+    def test_cross_worker_lock_wait_stops_at_the_deadline(self, tmp_path):
+        lock_dir = str(tmp_path / "locks")
+        worker_a = SingleFlight(lock_dir=lock_dir)
+        worker_b = SingleFlight(lock_dir=lock_dir)
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            time.sleep(0.5)
+            return "result"
+
+        thread = threading.Thread(target=lambda: worker_a.do("k", slow))
+        thread.start()
+        started.wait()
+        begun = time.perf_counter()
+        with deadlines.scope(Deadline(0.1)):
+            with pytest.raises(DeadlineExceeded, match="during singleflight"):
+                worker_b.do("k", slow)
+        assert time.perf_counter() - begun < 0.4
+        assert worker_b.stats()["lock_timeouts"] == 0
+        thread.join()
+
+    def test_async_follower_outlives_a_leader_with_a_short_deadline(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            deadline = deadlines.current()
+            await asyncio.sleep(min(0.3, deadline.remaining()))
+            deadline.check("groq")
+            return "result"
+
+        async def call(seconds, delay=0.0):
+            await asyncio.sleep(delay)
+            with deadlines.scope(Deadline(seconds)):
+                return await flight.ado("k", upstream)
+
+        async def body():
+            return await asyncio.gather(call(0.1), call(60.0, delay=0.02), return_exceptions=True)
+
+        leader, follower = asyncio.run(body())
+        assert isinstance(leader, DeadlineExceeded)
+        assert follower == ("result", False)
+        assert len(calls) == 2
+
+
+class TestGroqChatCoalescing:
+    """Identical concurrent groq_chat() calls reach the upstream once."""
+
+    @pytest.fixture
+    def fake_groq(self, monkeypatch):
+        with FakeLLMServer(latency=0.3) as server:
+            monkeypatch.setenv("GROQ_BASE_URL", server.url)
+            monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+            monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a"]))
+            monkeypatch.setattr(app_module, "groq_flight", SingleFlight())
+            yield server
+            app_module.groq_pool.close()
+
+    def test_identical_prompts_coalesce(self, fake_groq):
+        messages = [{"role": "user", "content": "Generate 10 questions about cells"}]
+        results, errors = _in_threads(8, lambda: app_module.groq_chat(messages))
+        assert all(r == ("pong", None) for r in results)
+        assert fake_groq.requests == 1
+
+    def test_different_prompts_do_not_coalesce(self, fake_groq):
+        results, errors = _in_threads(
+            3, lambda: app_module.groq_chat([{"role": "user", "content": str(threading.get_ident())}])
+        )
+        assert fake_groq.requests == 3
@@ -0,0 +1,174 @@
+"""
+Tests for request tracing: the span tree, sampling and admin traces, and the
+breakdown attached to AI endpoint responses.
+
+Run: pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import asgi  # noqa: E402
+import tracing  # noqa: E402
+from chunking import map_concurrent  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from key_scheduler import KeyScheduler  # noqa: E402
+from response_cache import MemoryCacheBackend, ResponseCache  # noqa: E402
+from tests.fake_llm import FakeLLMServer  # noqa: E402
+from tracing import Tracer  # noqa: E402
+
+import pytest  # noqa: E402
+
+TOKEN = "trace-secret"
+SYLLABUS = json.dumps({"semester": "Fall 2026", "subjects": [{"name": "Biology", "topics": [{"name": "Cells"}]}]})
+
+
+def names(node):
+    """Span names in the tree, depth first."""
+    return [node["name"]] + [name for child in node.get("children", []) for name in names(child)]
+
+
+class TestTracer:
+    """Which requests are traced and what a trace records."""
+
+    def test_untraced_requests_get_null_spans(self):
+        assert Tracer().start("/api/ai/chat", {}) is None
+        assert Tracer(token=TOKEN).start("/api/ai/chat", {"X-Trace": "wrong"}) is None
+        assert tracing.span("groq") is tracing.NULL_SPAN
+
+    def test_span_tree(self, tmp_path):
+        log = tmp_path / "traces.jsonl"
+        tracer = Tracer(token=TOKEN, log_path=str(log))
+
+        @tracing.traced("prompt_build")
+        def build():
+            with tracing.span("inner", size=3) as inner:
+                inner.set(ok=True)
+            return "prompt"
+
+        trace = tracer.start("/api/ai/chat", {"X-Trace": TOKEN})
+        assert trace.admin
+        assert build() == "prompt"
+        with pytest.raises(ValueError):
+            with tracing.span("groq_attempt", key=0):
+                raise ValueError("boom")
+        tracing.record("pdf_page", 0.25, page=1)
+        tracer.finish(trace, status=200)
+
+        tree = json.loads(log.read_text())
+        assert tree["id"] == trace.id and tree["attrs"] == {"status": 200}
+        assert names(tree) == ["/api/ai/chat", "prompt_build", "inner", "groq_attempt", "pdf_page"]
+        assert tree["children"][0]["children"][0]["attrs"] == {"size": 3, "ok": True}
+        assert tree["children"][1]["attrs"] == {"key": 0, "error": "ValueError"}
+        assert tree["children"][2]["ms"] == 250.0
+        assert "pdf_page;dur=250.0" in trace.server_timing()
+        # Finishing clears the current trace
+        assert tracing.current() is None and tracing.span("x") is tracing.NULL_SPAN
+
+    def test_sampling(self):
+        assert Tracer(sample_rate=0.5, rng=lambda: 0.9).start("/api/ai/chat", {}) is None
+        tracer = Tracer(sample_rate=0.5, rng=lambda: 0.1)
+        trace = tracer.start("/api/ai/chat", {})
+        assert trace is not None and not trace.admin
+        tracer.finish(trace)
+        assert tracer.stats()["sampled"] == 1
+
+    def test_pool_threads_record_into_the_tree(self):
+        tracer = Tracer(token=TOKEN)
+        trace = tracer.start("/api/ai/parse-syllabus", {"X-Trace": TOKEN})
+
+        def work(item):
+            with tracing.span("chunk", item=item):
+                time.sleep(0.01)
+            return item
+
+        assert map_concurrent(work, [1, 2, 3]) == [1, 2, 3]
+        tracer.finish(trace)
+        assert sorted(child["attrs"]["item"] for child in trace.to_dict()["children"]) == [1, 2, 3]
+
+    def test_profile(self):
+        tracer = Tracer(token=TOKEN, profile_interval=0.001)
+        trace = tracer.start("/api/ai/chat", {"X-Trace": TOKEN, "X-Trace-Profile": "1"})
+        deadline = time.perf_counter() + 0.1
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        tracer.finish(trace)
+        profile = trace.to_dict()["profile"]
+        assert profile["samples"] > 0
+        assert "test_profile" in profile["stacks"][0]["stack"]
+
+
+@pytest.fixture
+def groq(monkeypatch):
+    with FakeLLMServer(reply=SYLLABUS) as server:
+        monkeypatch.setenv("GROQ_BASE_URL", server.url)
+        monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+        monkeypatch.setattr(app_module, "key_scheduler", KeyScheduler(["key-a"]))
+        monkeypatch.setattr(app_module, "response_cache", ResponseCache(MemoryCacheBackend()))
+        monkeypatch.setattr(app_module, "get_gemini_model", lambda: None)
+        yield server
+
+
+class TestEndpoints:
+    """Admin traces come back with the response; sampled ones go to the trace log."""
+
+    def test_syllabus_breakdown(self, groq, monkeypatch):
+        monkeypatch.setattr(app_module, "tracer", Tracer(token=TOKEN))
+        with app_module.app.test_client() as client:
+            response = client.post(
+                "/api/ai/parse-syllabus", json={"file_type": "text", "content": "Biology 101. Week 1: Cells."},
+                headers={"X-Trace": TOKEN},
+            )
+        assert response.status_code == 200
+        trace = response.get_json()["trace"]
+        assert trace["name"] == "/api/ai/parse-syllabus" and trace["attrs"]["status"] == 200
+        spans = names(trace)
+        for name in ("json_body", "admission", "prompt_build", "syllabus_chunk", "groq", "groq_attempt",
+                     "json_parse", "json_scan", "json_loads"):
+            assert name in spans
+        assert "groq_attempt;dur=" in response.headers["Server-Timing"]
+        assert response.headers["X-Trace-Id"] == trace["id"]
+
+    def test_untraced_responses_are_unchanged(self, groq, monkeypatch):
+        monkeypatch.setattr(app_module, "tracer", Tracer(token=TOKEN))
+        with app_module.app.test_client() as client:
+            response = client.post("/api/ai/chat", json={"message": "What is ATP?"})
+        assert "trace" not in response.get_json()
+        assert "Server-Timing" not in response.headers
+
+    def test_sampled_stream_is_logged_after_the_body(self, groq, monkeypatch, tmp_path):
+        log = tmp_path / "traces.jsonl"
+        monkeypatch.setattr(app_module, "tracer", Tracer(sample_rate=1.0, log_path=str(log)))
+        with app_module.app.test_client() as client:
+            response = client.post("/api/ai/chat/stream", json={"message": "What is ATP?"})
+            assert "event: done" in response.get_data(as_text=True)
+        trace = json.loads(log.read_text())
+        assert trace["attrs"]["status"] == 200
+        assert "groq_attempt" in names(trace)
+
+    def test_asgi_chat_breakdown(self, groq, monkeypatch):
+        monkeypatch.setattr(app_module, "tracer", Tracer(token=TOKEN))
+
+        async def body():
+            transport = httpx.ASGITransport(app=asgi.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+                    return await client.post(
+                        "/api/ai/chat", json={"message": "What is ATP?"}, headers={"X-Trace": TOKEN},
+                    )
+            finally:
+                await app_module.groq_pool.aclose()
+
+        response = asyncio.run(body())
+        assert response.status_code == 200
+        trace = response.json()["trace"]
+        assert {"json_body", "admission", "prompt_build", "groq", "groq_attempt"} <= set(names(trace))
+        assert "groq;dur=" in response.headers["server-timing"]
@@ -0,0 +1,99 @@
+"""
+Tests for startup warm-up: SDK preloading, the cached Gemini model and fork-safe SQLite stores.
+
+Run: pytest tests/ -v
+"""
+
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as app_module  # noqa: E402
+from groq_pool import GroqClientPool  # noqa: E402
+from response_cache import SQLiteCacheBackend  # noqa: E402
+from warmup import preload  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def fake_genai(monkeypatch):
+    """A stand-in google.generativeai that counts configure() calls and models built."""
+    calls = {"configure": [], "models": 0}
+
+    class GenerativeModel:
+        def __init__(self, name):
+            calls["models"] += 1
+            self.name = name
+
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda api_key: calls["configure"].append(api_key)
+    genai.GenerativeModel = GenerativeModel
+    google = types.ModuleType("google")
+    google.generativeai = genai
+    monkeypatch.setitem(sys.modules, "google", google)
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+    monkeypatch.setattr(app_module, "_gemini_model", None)
+    return calls
+
+
+class TestGeminiModel:
+    """get_gemini_model() configures the SDK once per key."""
+
+    def test_model_is_reused(self, fake_genai, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "key-a")
+        first = app_module.get_gemini_model()
+        assert app_module.get_gemini_model() is first
+        assert first.name == app_module.GEMINI_MODEL
+        assert (fake_genai["configure"], fake_genai["models"]) == (["key-a"], 1)
+
+        monkeypatch.setenv("GEMINI_API_KEY", "key-b")
+        assert app_module.get_gemini_model() is not first
+        assert fake_genai["configure"] == ["key-a", "key-b"]
+
+    def test_no_key(self, fake_genai, monkeypatch):
+        monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+        assert app_module.get_gemini_model() is None
+        assert fake_genai["models"] == 0
+
+
+class TestWarmUp:
+    """warm_up() front-loads imports and client construction."""
+
+    def test_preload_reports_missing_modules(self):
+        timings = preload(("json", "no_such_module_for_tests"))
+        assert timings["json"] >= 0
+        assert timings["no_such_module_for_tests"] is None
+
+    def test_builds_clients_for_every_key(self, fake_genai, monkeypatch):
+        monkeypatch.setenv("GROQ_API_KEYS", "key-a,key-b")
+        monkeypatch.setenv("GEMINI_API_KEY", "key-g")
+        monkeypatch.setattr(app_module, "groq_pool", GroqClientPool())
+        monkeypatch.setattr(app_module, "startup", {"warmup": None})
+        monkeypatch.setattr(app_module, "preload", lambda: {"groq": 1.0})
+
+        timings = app_module.warm_up()
+        try:
+            assert app_module.groq_pool.stats()["clients_created"] == 2
+            assert fake_genai["models"] == 1
+            assert timings["imports_ms"] == {"groq": 1.0}
+            with app_module.app.test_client() as client:
+                assert client.get("/api/health").get_json()["startup"]["warmup"]["pid"] == os.getpid()
+        finally:
+            app_module.groq_pool.close()
+
+    def test_can_be_disabled(self, monkeypatch):
+        monkeypatch.setenv("WARMUP", "0")
+        assert app_module.warm_up() is None
+
+
+def test_sqlite_store_reconnects_after_fork(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"))
+    backend.set("k", "v", ttl=60)
+    inherited = backend._local.conn
+    # What a forked worker sees: the parent's connection under a different pid
+    backend._local.pid = -1
+    assert backend.get("k") == ("v", 0)
+    assert backend._local.conn is not inherited
@@ -0,0 +1,306 @@
+"""
+Brain Trails - Request tracing
+
+Stage histograms say Groq is slow on average, not where one 40-second
+syllabus parse spent its time. A traced request records a tree of timed
+spans: body parsing, admission, base64 decoding, PDF pages, prompt building,
+every Groq key attempt, the Gemini fallback, JSON scanning and loading (the
+metrics stage timers open spans too). Work handed to thread pools through
+``deadlines.bind`` records into the same tree.
+
+A request is traced when it sends ``X-Trace: <TRACE_TOKEN>`` (an admin
+trace) or is picked at ``TRACE_SAMPLE_RATE``. Admin traces are attached to
+JSON responses as a ``trace`` field plus a ``Server-Timing`` header, and may
+ask for ``X-Trace-Profile: 1``: a sampling profile of the handler thread.
+Finished traces are appended to ``TRACE_LOG_PATH`` (JSON lines) when set;
+without it, sampled traces are logged.
+
+Untraced requests pay one context-variable lookup per span.
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import uuid
+import threading
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Trace"
+PROFILE_HEADER = "X-Trace-Profile"
+
+_trace = ContextVar("trace", default=None)
+_span = ContextVar("trace_span", default=None)
+
+
+class Span:
+    """One timed step; ``set()`` adds attributes."""
+
+    __slots__ = ("name", "attrs", "started", "duration", "children")
+
+    def __init__(self, name, attrs=None, started=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.started = time.perf_counter() if started is None else started
+        self.duration = None
+        self.children = []
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.started
+
+    def to_dict(self, origin):
+        duration = self.duration if self.duration is not None else time.perf_counter() - self.started
+        node = {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 2),
+            "ms": round(duration * 1000, 2),
+        }
+        if self.attrs:
+            node["attrs"] = dict(self.attrs)
+        if self.children:
+            node["children"] = [child.to_dict(origin) for child in list(self.children)]
+        return node
+
+    def walk(self):
+        yield self
+        for child in list(self.children):
+            yield from child.walk()
+
+
+class _NullSpan:
+    """Stands in for a span when the request isn't traced."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _SpanScope:
+    def __init__(self, parent, name, attrs):
+        self.parent = parent
+        self.span = Span(name, attrs)
+        self.token = None
+
+    def __enter__(self):
+        self.parent.children.append(self.span)
+        self.token = _span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.finish()
+        if exc_type is not None:
+            self.span.attrs["error"] = exc_type.__name__
+        _span.reset(self.token)
+        return False
+
+
+def span(name, **attrs):
+    """Context manager timing ``name`` as a child of the current span (a no-op when not tracing)."""
+    parent = _span.get()
+    if parent is None:
+        return NULL_SPAN
+    return _SpanScope(parent, name, attrs)
+
+
+def traced(name):
+    """Decorator running the function inside ``span(name)``."""
+    def decorator(fn):
+        @wraps(fn)
+        def run(*args, **kwargs):
+            if _span.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return run
+    return decorator
+
+
+def record(name, seconds, **attrs):
+    """Add an already-finished ``seconds``-long step, e.g. one timed in a worker process."""
+    parent = _span.get()
+    if parent is not None:
+        child = Span(name, attrs, started=time.perf_counter() - seconds)
+        child.duration = seconds
+        parent.children.append(child)
+
+
+def current():
+    """The ``Trace`` of the request being served, or None."""
+    return _trace.get()
+
+
+class StackSampler:
+    """Samples one thread's Python stack every ``interval`` seconds from a daemon thread."""
+
+    def __init__(self, thread_id, interval=0.005, max_depth=40):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="trace-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.samples += 1
+            self.stacks[";".join(reversed(frames))] += 1
+
+    def stop(self, top=20):
+        """Stop sampling; returns the most frequent stacks (root first, ``;``-separated)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return {
+            "interval_ms": round(self.interval * 1000, 2),
+            "samples": self.samples,
+            "stacks": [{"stack": stack, "count": count} for stack, count in self.stacks.most_common(top)],
+        }
+
+
+class Trace:
+    """The span tree of one request."""
+
+    def __init__(self, name, admin=False, sampler=None):
+        self.id = uuid.uuid4().hex[:16]
+        self.admin = admin
+        self.wall_started = time.time()
+        self.root = Span(name)
+        self.sampler = sampler
+        self.profile = None
+        self.finished = False
+
+    def to_dict(self):
+        trace = {
+            "id": self.id,
+            "started_at": round(self.wall_started, 3),
+            **self.root.to_dict(self.root.started),
+        }
+        if self.profile is not None:
+            trace["profile"] = self.profile
+        return trace
+
+    def server_timing(self):
+        """``Server-Timing`` header value: total milliseconds per span name, in first-seen order."""
+        totals = {}
+        for node in self.root.walk():
+            if node is self.root:
+                continue
+            duration = node.duration if node.duration is not None else time.perf_counter() - node.started
+            totals[node.name] = totals.get(node.name, 0.0) + duration
+        root = self.root.duration if self.root.duration is not None else time.perf_counter() - self.root.started
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items()]
+        return ", ".join(entries + [f"total;dur={root * 1000:.1f}"])
+
+
+class Tracer:
+    """Decides which requests are traced and where finished traces go."""
+
+    def __init__(self, token=None, sample_rate=0.0, log_path=None, profile_interval=0.005, rng=random.random):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.log_path = log_path
+        self.profile_interval = profile_interval
+        self._rng = rng
+        self._lock = threading.Lock()
+        self._stats = {"traced": 0, "admin": 0, "sampled": 0, "profiled": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build from TRACE_TOKEN, TRACE_SAMPLE_RATE, TRACE_LOG_PATH and TRACE_PROFILE_INTERVAL_MS."""
+        return cls(
+            token=os.getenv("TRACE_TOKEN") or None,
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", 0)),
+            log_path=os.getenv("TRACE_LOG_PATH") or None,
+            profile_interval=float(os.getenv("TRACE_PROFILE_INTERVAL_MS", 5)) / 1000,
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.token) or self.sample_rate > 0
+
+    def _is_admin(self, headers):
+        supplied = headers.get(HEADER) or headers.get(HEADER.lower())
+        return bool(self.token and supplied) and hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    def start(self, name, headers):
+        """Start tracing this request if it asked to (with the token) or is sampled; returns the Trace or None."""
+        if not self.enabled:
+            return None
+        admin = self._is_admin(headers)
+        if not admin and not (self.sample_rate > 0 and self._rng() < self.sample_rate):
+            return None
+        sampler = None
+        if admin and (headers.get(PROFILE_HEADER) or headers.get(PROFILE_HEADER.lower())) == "1":
+            sampler = StackSampler(threading.get_ident(), self.profile_interval).start()
+        trace = Trace(name, admin=admin, sampler=sampler)
+        _trace.set(trace)
+        _span.set(trace.root)
+        with self._lock:
+            self._stats["traced"] += 1
+            self._stats["admin" if admin else "sampled"] += 1
+            self._stats["profiled"] += sampler is not None
+        return trace
+
+    def finish(self, trace, **attrs):
+        """Close ``trace`` (once), stop its profiler and write it to the trace log."""
+        _trace.set(None)
+        _span.set(None)
+        if trace is None or trace.finished:
+            return
+        trace.finished = True
+        trace.root.set(**attrs)
+        trace.root.finish()
+        if trace.sampler is not None:
+            trace.profile = trace.sampler.stop()
+        line = json.dumps(trace.to_dict())
+        if self.log_path:
+            try:
+                with self._lock, open(self.log_path, "a") as log:
+                    log.write(line + "\n")
+            except OSError as e:
+                logger.warning(f"Tracing: could not write {self.log_path}: {e}")
+        elif not trace.admin:
+            logger.info(f"Trace: {line}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "log_path": self.log_path,
+            **stats,
+        }
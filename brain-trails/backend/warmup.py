@@ -0,0 +1,38 @@
+"""
+Brain Trails - Startup warm-up
+
+Provider SDKs are imported lazily by the modules that use them, which keeps
+tests and tools light, but leaves the first request in every fresh worker to
+pay for ``google.generativeai``, ``groq`` and ``pypdf`` imports (well over a
+second together). ``preload()`` imports them up front instead.
+
+Imports are fork-safe, so ``gunicorn.conf.py`` runs ``preload()`` in the
+master with ``preload_app`` and every worker inherits the loaded modules.
+Clients that open sockets or threads (Groq HTTP pools, the Gemini model) are
+built after the fork, by ``app.warm_up()`` in each worker.
+"""
+
+import importlib
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Heaviest first; PIL is optional (see image_prep)
+PRELOAD_MODULES = ("google.generativeai", "groq", "pypdf", "httpx", "PIL.Image")
+
+
+def preload(modules=PRELOAD_MODULES):
+    """Import ``modules`` and return ``{module: milliseconds}`` (None for modules that are not installed)."""
+    timings = {}
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            timings[name] = None
+            continue
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    loaded = {name: ms for name, ms in timings.items() if ms is not None}
+    logger.info(f"Warm-up: imported {', '.join(f'{name} {ms}ms' for name, ms in loaded.items()) or 'nothing'}")
+    return timings
@@ -34,6 +34,38 @@ const quickActions: QuickAction[] = [
 
 const BACKEND_URL = process.env.NEXT_PUBLIC_AI_API_URL || process.env.NEXT_PUBLIC_BACKEND_URL || "http://localhost:5000";
 
+// Read the /api/ai/chat/stream server-sent events, calling onDelta for each token chunk.
+async function readChatStream(response: Response, onDelta: (text: string) => void): Promise<void> {
+  const reader = response.body!.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf("\n\n");
+
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (!data) continue;
+
+      const payload = JSON.parse(data);
+      if (event === "error") throw new Error(payload.error || "Stream failed");
+      if (event === "message" && payload.delta) onDelta(payload.delta);
+    }
+  }
+}
+
 export default function AIFamiliar({ noteContent = "", isOpen = false, onToggle }: AIFamiliarProps) {
   const { theme } = useTheme();
   const isSun = theme === "sun";
@@ -47,6 +79,7 @@ export default function AIFamiliar({ noteContent = "", isOpen = false, onToggle
   ]);
   const [input, setInput] = useState("");
   const [isLoading, setIsLoading] = useState(false);
+  const [streamingId, setStreamingId] = useState<string | null>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
   useEffect(() => {
@@ -68,9 +101,9 @@ export default function AIFamiliar({ noteContent = "", isOpen = false, onToggle
     setIsLoading(true);
 
     try {
-      const response = await fetch(`${BACKEND_URL}/api/ai/chat`, {
+      const response = await fetch(`${BACKEND_URL}/api/ai/chat/stream`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
         body: JSON.stringify({
           message: messageText,
           noteContent: noteContent,
@@ -92,16 +125,41 @@ export default function AIFamiliar({ noteContent = "", isOpen = false, onToggle
         return;
       }
 
-      const data = await response.json();
+      const assistantId = `assistant-${Date.now()}`;
 
-      const assistantMessage: Message = {
-        id: `assistant-${Date.now()}`,
-        role: "assistant",
-        content: data.response || "I couldn't generate a response. Please try again.",
-        timestamp: new Date(),
-      };
+      // Older backends answer with a single JSON body
+      if (!response.body || !response.headers.get("content-type")?.includes("text/event-stream")) {
+        const data = await response.json();
+        setMessages((prev) => [...prev, {
+          id: assistantId,
+          role: "assistant",
+          content: data.response || "I couldn't generate a response. Please try again.",
+          timestamp: new Date(),
+        }]);
+        return;
+      }
 
-      setMessages((prev) => [...prev, assistantMessage]);
+      // Show the reply as it is generated; the first token replaces the "Thinking..." bubble
+      let streamed = "";
+      await readChatStream(response, (delta) => {
+        if (!streamed) setStreamingId(assistantId);
+        streamed += delta;
+        const content = streamed;
+        setMessages((prev) =>
+          prev.some((m) => m.id === assistantId)
+            ? prev.map((m) => (m.id === assistantId ? { ...m, content } : m))
+            : [...prev, { id: assistantId, role: "assistant", content, timestamp: new Date() }]
+        );
+      });
+
+      if (!streamed) {
+        setMessages((prev) => [...prev, {
+          id: assistantId,
+          role: "assistant",
+          content: "I couldn't generate a response. Please try again.",
+          timestamp: new Date(),
+        }]);
+      }
     } catch (error) {
       console.error("AI chat error:", error);
 
@@ -115,6 +173,7 @@ export default function AIFamiliar({ noteContent = "", isOpen = false, onToggle
       setMessages((prev) => [...prev, fallbackMessage]);
     } finally {
       setIsLoading(false);
+      setStreamingId(null);
     }
   };
 
@@ -216,7 +275,7 @@ export default function AIFamiliar({ noteContent = "", isOpen = false, onToggle
               </div>
             </motion.div>
           ))}
-          {isLoading && (
+          {isLoading && !streamingId && (
             <motion.div initial={{ opacity: 0 }} animate={{ opacity: 1 }} className="flex justify-start">
               <div className={`px-4 py-3 rounded-2xl rounded-bl-md flex items-center gap-2 ${isSun ? "bg-slate-100" : "bg-white/10"}`}>
                 <Loader2 className="w-4 h-4 animate-spin text-violet-500" />